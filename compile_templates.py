@@ -0,0 +1,5 @@
+from sharebears import app
+from sharebears import template_cache
+
+names = template_cache.precompile_templates(app.jinja_env)
+print "Compiled %s templates" % len(names)
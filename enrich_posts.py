@@ -0,0 +1,5 @@
+from sharebears import post_enrichment
+from sharebears import views
+
+num_posts = post_enrichment.enrich_posts(views.post_processor)
+print "Decoded the URLs of %s posts" % num_posts
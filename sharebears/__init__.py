@@ -6,16 +6,39 @@ app = Flask(__name__.split('.')[0])
 import configuration
 configuration.configure_app(app)
 
-# Remove some whitespace from the HTML.
-app.jinja_env.trim_blocks = app.config['JINJA_TRIM_BLOCKS']
+# Configure how templates are loaded, before the Jinja environment is created.
+import template_cache
+template_cache.configure_jinja_options(app)
 
 # Set up the database.
 import db
 import db_util
 import db_schema
-engine = db_util.init_db(app.config["DATABASE_NAME"], app.config["DATABASE_URI"])
+from lru_cache import LruCache
+from sqlite_cache import SqliteCache
+sqlite_profile = None
+if app.config["SQLITE_PROFILE"] is not None:
+  sqlite_profile = db_util.SqliteProfile(**app.config["SQLITE_PROFILE"])
+engine = db_util.init_db(app.config["DATABASE_NAME"], app.config["DATABASE_URI"], sqlite_profile,
+    app.config["DATABASE_REPLICA_URIS"], app.config["DATABASE_REPLICA_STICKY_SECONDS"])
+if app.config["DATABASE_REPLICA_URIS"] and app.config["SHARED_CACHE_PATH"]:
+  # Share the keys of recent writes, so that reads by all processes use the primary.
+  db_util.set_sticky_store(SqliteCache(app.config["SHARED_CACHE_PATH"],
+      app.config["SHARED_CACHE_MAX_BYTES"],
+      namespace="sticky_keys",
+      ttl_seconds=app.config["DATABASE_REPLICA_STICKY_SECONDS"]))
 db_schema.create_all_tables(engine) 
+if app.config["DATABASE_RESULT_CACHE_MAX_ENTRIES"]:
+  db_util.set_result_cache(LruCache(app.config["DATABASE_RESULT_CACHE_MAX_BYTES"],
+      db.get_result_cache_entry_size, app.config["DATABASE_RESULT_CACHE_MAX_ENTRIES"]),
+      app.config["DATABASE_RESULT_CACHE_TTL_SECONDS"])
+# Share one session and connection across all database calls in a request.
+db_util.use_shared_session_per_request(app)
 
 # Register the handlers.
 import views
 
+# Compile all templates now, so that the first requests of each worker are fast.
+if app.config["PRECOMPILE_TEMPLATES"]:
+  template_cache.precompile_templates(app.jinja_env)
+
@@ -1,12 +1,22 @@
 import unittest
 
 import album_item_test 
+import conditional_get_test
 import db_test
+import db_util_test
 import filters_test
+import github_client_test
+import lru_cache_test
 import paragraph_item_test
 import parser_test
+import post_enrichment_test
 import post_processor_test
 import renderable_item_test
+import rendered_post_test
+import sqlite_cache_test
+import template_cache_test
+import timeline_cache_test
+import url_decoder_breaker_test
 import url_decoder_github_test
 import url_decoder_image_test
 import url_decoder_test
@@ -17,12 +27,22 @@ import url_decoder_youtube_test
 def suite():
   suite = unittest.TestSuite()
   suite.addTest(album_item_test.suite())
+  suite.addTest(conditional_get_test.suite())
   suite.addTest(db_test.suite())
+  suite.addTest(db_util_test.suite())
   suite.addTest(filters_test.suite())
+  suite.addTest(github_client_test.suite())
+  suite.addTest(lru_cache_test.suite())
   suite.addTest(paragraph_item_test.suite())
   suite.addTest(parser_test.suite())
+  suite.addTest(post_enrichment_test.suite())
   suite.addTest(post_processor_test.suite())
   suite.addTest(renderable_item_test.suite())
+  suite.addTest(rendered_post_test.suite())
+  suite.addTest(sqlite_cache_test.suite())
+  suite.addTest(template_cache_test.suite())
+  suite.addTest(timeline_cache_test.suite())
+  suite.addTest(url_decoder_breaker_test.suite())
   suite.addTest(url_decoder_github_test.suite())
   suite.addTest(url_decoder_image_test.suite())
   suite.addTest(url_decoder_test.suite())
@@ -0,0 +1,62 @@
+import calendar
+from datetime import timedelta
+import hashlib
+import werkzeug.http
+
+from rendered_post import RenderedPost
+
+
+def _get_interval_start(now, interval_seconds):
+  """Returns the start of the interval of the given number of seconds that
+  contains the given time.
+  """
+  seconds = calendar.timegm(now.utctimetuple())
+  return now.replace(microsecond=0) - timedelta(seconds=seconds % interval_seconds)
+
+
+def _get_content_hash(post):
+  """Returns a hash of the data of the given Post, or of the content of the given
+  RenderedPost.
+  """
+  if isinstance(post, RenderedPost):
+    content = post.content.html
+  else:
+    content = post.data
+  if isinstance(content, unicode):
+    content = content.encode("utf-8")
+  return hashlib.sha1(content).hexdigest()
+
+
+def get_validators(viewer_id, posts, now, interval_seconds, cursors=()):
+  """Returns a tuple of the ETag and Last-Modified time for a page showing the
+  given posts and pagination cursors to the given viewer at the given time.
+
+  The posts are Post or RenderedPost instances. Only their identifiers, creation
+  times, content and stars are hashed, because their other properties never
+  change. Because the page shows how long
+  ago each post was created, the validators also change once every
+  interval_seconds.
+  """
+  interval_start = _get_interval_start(now, interval_seconds)
+  hashed_value = (
+    viewer_id,
+    interval_start.isoformat(),
+    tuple(cursors),
+    tuple((post.id, post.created_datetime.isoformat(), post.is_starred, post.num_stars,
+        _get_content_hash(post)) for post in posts),
+  )
+  etag = hashlib.sha1(repr(hashed_value)).hexdigest()
+
+  # A new post on the page is newer than the start of the interval.
+  last_modified = min(now, max([interval_start] + [post.created_datetime for post in posts]))
+  return (etag, last_modified.replace(microsecond=0))
+
+
+def is_modified(environ, etag, last_modified):
+  """Returns whether the request in the given WSGI environment must be answered
+  with the full page, or with 304 Not Modified otherwise.
+
+  Its If-None-Match header is compared with the given ETag. Only if it has no
+  such header is its If-Modified-Since header compared with the given time.
+  """
+  return werkzeug.http.is_resource_modified(environ, etag=etag, last_modified=last_modified)
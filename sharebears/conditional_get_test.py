@@ -0,0 +1,90 @@
+from datetime import datetime
+import unittest
+import werkzeug.http
+import werkzeug.test
+
+import conditional_get
+from db import Post
+from rendered_post import RenderedPost, RenderedPostContent
+
+
+class ConditionalGetTest(unittest.TestCase):
+  def _make_post(self, id, created_datetime, is_starred=False, num_stars=0, data="data"):
+    return Post(id, "creator", created_datetime, data, is_starred, num_stars, ())
+
+  def _make_rendered_post(self, id, created_datetime):
+    content = RenderedPostContent("<p>data</p>", None)
+    return RenderedPost(id, "creator", created_datetime, content, False, 0, ())
+
+  def _get_validators(self, viewer_id="viewer_id", posts=None, now=None, cursors=()):
+    if posts is None:
+      posts = [self._make_post(2, datetime(2014, 10, 27, 9, 30)),
+          self._make_post(1, datetime(2013, 9, 26))]
+    if now is None:
+      now = datetime(2014, 10, 27, 10, 0, 30, 500)
+    return conditional_get.get_validators(viewer_id, posts, now, 60, cursors)
+
+  def _make_environ(self, headers):
+    return werkzeug.test.create_environ(headers=headers)
+
+
+  def test_validators(self):
+    etag, last_modified = self._get_validators()
+    self.assertEqual(etag, self._get_validators()[0])
+    # The last modified time is the start of the interval, without microseconds.
+    self.assertEqual(datetime(2014, 10, 27, 10, 0), last_modified)
+
+    # Assert that the time within the same interval does not change the ETag.
+    self.assertEqual(etag, self._get_validators(now=datetime(2014, 10, 27, 10, 0, 59))[0])
+
+    # Assert that each change to the page changes the ETag.
+    changed_etags = [
+      self._get_validators(viewer_id="other_viewer_id")[0],
+      self._get_validators(now=datetime(2014, 10, 27, 10, 1))[0],
+      self._get_validators(cursors=("next_cursor", None))[0],
+      self._get_validators(posts=[self._make_post(2, datetime(2014, 10, 27, 9, 30), True, 1)])[0],
+      self._get_validators(posts=[self._make_post(2, datetime(2014, 10, 27, 9, 30))])[0],
+      self._get_validators(posts=[self._make_post(2, datetime(2014, 10, 27, 9, 30), data="new_data"),
+          self._make_post(1, datetime(2013, 9, 26))])[0],
+      self._get_validators(posts=[self._make_rendered_post(2, datetime(2014, 10, 27, 9, 30)),
+          self._make_post(1, datetime(2013, 9, 26))])[0],
+    ]
+    self.assertEqual(len(changed_etags), len(set(changed_etags)))
+    self.assertNotIn(etag, changed_etags)
+
+  def test_last_modified_by_new_post(self):
+    posts = [self._make_post(1, datetime(2014, 10, 27, 10, 0, 15, 200))]
+    etag, last_modified = self._get_validators(posts=posts)
+    self.assertEqual(datetime(2014, 10, 27, 10, 0, 15), last_modified)
+
+  def test_is_modified_by_etag(self):
+    etag, last_modified = self._get_validators()
+    self.assertTrue(conditional_get.is_modified(self._make_environ({}), etag, last_modified))
+    self.assertFalse(conditional_get.is_modified(
+        self._make_environ({"If-None-Match": '"%s"' % etag}), etag, last_modified))
+    self.assertFalse(conditional_get.is_modified(
+        self._make_environ({"If-None-Match": 'W/"%s"' % etag}), etag, last_modified))
+    self.assertTrue(conditional_get.is_modified(
+        self._make_environ({"If-None-Match": '"other_etag"'}), etag, last_modified))
+
+  def test_is_modified_by_last_modified(self):
+    etag, last_modified = self._get_validators()
+    def _make_environ(if_modified_since, **kwargs):
+      headers = {"If-Modified-Since": werkzeug.http.http_date(if_modified_since)}
+      headers.update(kwargs)
+      return self._make_environ(headers)
+
+    self.assertFalse(conditional_get.is_modified(
+        _make_environ(last_modified), etag, last_modified))
+    self.assertTrue(conditional_get.is_modified(
+        _make_environ(datetime(2014, 10, 27, 9, 59, 59)), etag, last_modified))
+    # Assert that If-None-Match takes precedence.
+    self.assertTrue(conditional_get.is_modified(
+        _make_environ(last_modified, **{"If-None-Match": '"other_etag"'}), etag, last_modified))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(ConditionalGetTest))
+  return suite
+
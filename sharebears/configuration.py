@@ -1,6 +1,71 @@
 class Configuration:
   """Configuration used in all environments."""
+  # Remove some whitespace from the HTML.
   JINJA_TRIM_BLOCKS = True
+  # If not None, the directory where compiled templates are cached across workers
+  # and restarts. Run "make compile-templates" after deploying to fill it.
+  JINJA_BYTECODE_CACHE_DIR = None
+  # Whether to compile all templates when the app starts.
+  PRECOMPILE_TEMPLATES = True
+
+  # The number of posts displayed on each page of a post sequence.
+  POSTS_PAGE_SIZE = 20
+  # The maximum number of bytes of rendered post content to cache.
+  RENDERED_POST_CACHE_MAX_BYTES = 16 * 1024 * 1024
+  # The maximum number of pages of all posts to cache, and the number of seconds
+  # after which each is read again.
+  TIMELINE_PAGE_CACHE_MAX_ENTRIES = 100
+  TIMELINE_PAGE_CACHE_TTL_SECONDS = 60
+  # Keyword arguments for the db_util.SqliteProfile, or None to use SQLite defaults.
+  SQLITE_PROFILE = {}
+  # The URIs of read replicas of the database, if any.
+  DATABASE_REPLICA_URIS = []
+  # The number of seconds after a write by a user that their reads use the primary.
+  # Only the process that wrote knows of the write, unless SHARED_CACHE_PATH is
+  # configured, so use it if there are several worker processes.
+  DATABASE_REPLICA_STICKY_SECONDS = 10
+  # The maximum number of database query results to cache, or 0 to not cache
+  # them, the maximum number of bytes of post data in them, and the number of
+  # seconds after which each is read again. Each worker process invalidates
+  # results upon its own writes only, so writes by other processes, including
+  # a client's own writes, may go unseen for this long. Enable this only with
+  # one worker process.
+  DATABASE_RESULT_CACHE_MAX_ENTRIES = 0
+  DATABASE_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+  DATABASE_RESULT_CACHE_TTL_SECONDS = 10
+  # The number of seconds for which a client may reuse its copy of a page, as
+  # long as its posts are unchanged. The relative times on it may be this old.
+  CONDITIONAL_GET_INTERVAL_SECONDS = 60
+  # If not None, the path of a SQLite file that caches rendered post content
+  # for all worker processes, instead of each process caching its own. It also
+  # stores which reads must use the primary database.
+  SHARED_CACHE_PATH = None
+  SHARED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+  SHARED_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+  # If not None, the path of a SQLite file that caches responses from the GitHub
+  # API, and the maximum number of bytes of responses in it.
+  GITHUB_RESPONSE_CACHE_PATH = None
+  GITHUB_RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+  # Maps GitHubClient endpoints to the number of seconds before revalidating
+  # their cached responses, overriding GitHubClient.DEFAULT_TTL_SECONDS.
+  GITHUB_RESPONSE_TTL_SECONDS = {}
+  # Keyword arguments for the post_processor.PostProcessor, which decodes the
+  # URLs of a post concurrently, and waits for at most the given seconds. Longer
+  # posts, or posts with more tokens, are rejected.
+  POST_PROCESSOR = {
+    "max_workers": 8,
+    "decoder_timeout_seconds": 5,
+    "deadline_seconds": 10,
+    "max_length": 1024 * 1024,
+    "max_tokens": 10000,
+  }
+  # Keyword arguments for each url_decoder_breaker.BreakerUrlDecoder.
+  URL_DECODER_BREAKER = {}
+  # Whether posts are added with unrecognized URLs, which a background thread in
+  # each process decodes, instead of decoding them before responding.
+  ENRICH_POSTS_IN_BACKGROUND = True
+  # Keyword arguments for the post_enrichment.EnrichmentWorker.
+  ENRICHMENT_WORKER = {}
 
 
 class DevelopmentConfiguration(Configuration):
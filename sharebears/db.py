@@ -1,21 +1,44 @@
-from datetime import datetime
+import base64
+from datetime import datetime, timedelta
+import functools
+import itertools
 import sqlalchemy as sa
-import sqlalchemy.orm as sa_orm
 
 from db_schema import Post as MappedPost, Posts, HashTag as MappedHashTag, HashTags, StarredPost as MappedStarredPost, StarredPosts
+from db_schema import StarCountDelta as MappedStarCountDelta, StarCountDeltas
+from db_schema import PendingEnrichment as MappedPendingEnrichment, PendingEnrichments
 import db_util
 from db_util import DbException
 
 
+# The number of posts returned in a page by default.
+DEFAULT_PAGE_SIZE = 20
+# The number of posts read at a time by the iter_posts functions by default.
+DEFAULT_BATCH_SIZE = 100
+# Star count deltas are folded into Posts after every this many are recorded.
+STAR_COUNT_FOLD_INTERVAL = 100
+
+
+class InvalidCursorException(DbException):
+  """Exception class raised when a pagination cursor cannot be decoded."""
+  pass
+
+
 class PaginatedSequence:
   """A sequence of items read from the database.
 
   This sequence may not represent all items in the sequence.
   Using the pagination values, a client can iterate over all items.
+
+  If not None, next_cursor can be passed as the before argument to fetch the
+  following page of older items, and previous_cursor can be passed as the after
+  argument to fetch the preceding page of newer items.
   """
 
-  def __init__(self, items):
+  def __init__(self, items, next_cursor=None, previous_cursor=None):
     self.items = items
+    self.next_cursor = next_cursor
+    self.previous_cursor = previous_cursor
 
   def __getitem__(self, index):
     return self.items[index]
@@ -24,7 +47,10 @@ class PaginatedSequence:
     return len(self.items)
 
   def __repr__(self):
-    return "PaginatedSequence(items=%r)" % self.items
+    return "PaginatedSequence(items=%r, next_cursor=%r, previous_cursor=%r)" % (
+        self.items,
+        self.next_cursor,
+        self.previous_cursor)
 
 
 class Post:
@@ -50,6 +76,90 @@ class Post:
         self.hash_tags)
 
 
+def _user_sticky_key(user_id):
+  return "user:%s" % user_id
+
+def _post_sticky_key(post_id):
+  return "post:%s" % post_id
+
+def _get_client_sticky_keys(client_id, *pargs, **kwargs):
+  """Reads by a client go to the primary after that client writes."""
+  return (_user_sticky_key(client_id),)
+
+def _get_post_sticky_keys(post_id, *pargs, **kwargs):
+  """Reads of a post's stars go to the primary after the post is starred or unstarred."""
+  return (_post_sticky_key(post_id),)
+
+# The key of writes that add posts.
+_ALL_POSTS_KEY = "posts"
+
+def _hash_tag_key(hash_tag):
+  return "hashtag:%s" % hash_tag
+
+def _get_posts_sticky_keys(client_id, *pargs, **kwargs):
+  """Reads of all posts go to the primary after any post is added."""
+  return (_user_sticky_key(client_id), _ALL_POSTS_KEY)
+
+def _get_posts_with_hashtag_sticky_keys(client_id, hash_tag, *pargs, **kwargs):
+  return (_user_sticky_key(client_id), _hash_tag_key(hash_tag))
+
+def _get_posts_by_user_sticky_keys(client_id, user_id, *pargs, **kwargs):
+  return (_user_sticky_key(client_id), _user_sticky_key(user_id))
+
+def _get_post_version_keys(post, client_id, post_id, *pargs, **kwargs):
+  """A post changes when it is starred or unstarred, or when the client stars or
+  unstars any post. A missing post may be added by any new post.
+  """
+  if post is None:
+    return (_ALL_POSTS_KEY,)
+  return (_user_sticky_key(client_id), _post_sticky_key(post_id))
+
+def _get_page_version_keys(page, client_id, page_key):
+  """A page changes when a post is added to it, when any post on it is starred
+  or unstarred, or when the client stars or unstars any post.
+
+  These are also the sticky keys of the page, so that a page read from a replica
+  is read again from the primary if any post on it was recently changed.
+  """
+  return itertools.chain((page_key, _user_sticky_key(client_id)),
+      (_post_sticky_key(post.id) for post in page))
+
+def _get_posts_version_keys(page, client_id, *pargs, **kwargs):
+  return _get_page_version_keys(page, client_id, _ALL_POSTS_KEY)
+
+def _get_posts_with_hashtag_version_keys(page, client_id, hash_tag, *pargs, **kwargs):
+  return _get_page_version_keys(page, client_id, _hash_tag_key(hash_tag))
+
+def _get_posts_by_user_version_keys(page, client_id, user_id, *pargs, **kwargs):
+  # Adding a post records a write with the key of its creator.
+  return _get_page_version_keys(page, client_id, _user_sticky_key(user_id))
+
+def _get_stars_version_keys(stars, post_id, *pargs, **kwargs):
+  return (_post_sticky_key(post_id),)
+
+def get_result_cache_entry_size(entry):
+  """Returns the size of the given entry of the db_util result cache for an
+  LruCache, which is the number of bytes of the data of the posts in it, or of
+  the user identifiers of stars.
+  """
+  result = db_util.get_cached_result(entry)
+  if result is None:
+    items = ()
+  elif isinstance(result, Post):
+    items = (result,)
+  else:
+    items = result.items
+  size = sum(len(item.data) if isinstance(item, Post) else len(item) for item in items)
+  return max(1, size)
+
+def is_page_of_posts_sticky(post_ids):
+  """Returns whether a page of all posts with the given identifiers may be stale
+  on the read replicas, because a post was recently added or any of the posts
+  was recently starred or unstarred.
+  """
+  return db_util.is_sticky(_ALL_POSTS_KEY, *[_post_sticky_key(post_id) for post_id in post_ids])
+
+
 def _utcnow(now):
   """Returns the given time if not None, or datetime.utcnow() otherwise."""
   if now is None:
@@ -58,9 +168,12 @@ def _utcnow(now):
 
 
 @db_util.use_session
-def add_post(session, user_id, data, hash_tags, now=None):
+def add_post(session, user_id, data, hash_tags, now=None, enrich=False):
   """Creates a new post with the given properties.
 
+  If enrich is True, then the post is also added to the queue of posts whose URLs
+  are decoded by claim_post_enrichments and complete_post_enrichment.
+
   Returns the identifier of the created post.
   """
 
@@ -77,7 +190,11 @@ def add_post(session, user_id, data, hash_tags, now=None):
     for hash_tag_value in hash_tags:
       mapped_hash_tag = MappedHashTag(post_id=post_id, value=hash_tag_value, created_datetime=now)
       session.add(mapped_hash_tag)
+    if enrich:
+      session.add(MappedPendingEnrichment(post_id=post_id))
     session.commit()
+    db_util.record_write(_user_sticky_key(user_id), _ALL_POSTS_KEY,
+        *[_hash_tag_key(hash_tag_value) for hash_tag_value in hash_tags])
 
     return post_id
   except sa.exc.IntegrityError:
@@ -85,96 +202,432 @@ def add_post(session, user_id, data, hash_tags, now=None):
     raise db_util.DbException._chain()
 
 
-def _make_post(mapped_post, starred_post):
-  """Returns a Post constructed from the given MappedPost and hash tags."""
-  is_starred = bool(starred_post)
-  hash_tags = tuple(mapped_hash_tag.value for mapped_hash_tag in mapped_post.hash_tags)
-  return Post(mapped_post.id,
-      mapped_post.creator,
-      mapped_post.created_datetime,
-      mapped_post.data,
-      is_starred,
-      mapped_post.num_stars,
-      hash_tags)
+class NewPost:
+  """A post to create using add_posts."""
+
+  def __init__(self, user_id, data, hash_tags, now=None):
+    self.user_id = user_id
+    self.data = data
+    self.hash_tags = hash_tags
+    self.now = now
+
+  def __repr__(self):
+    return "NewPost(user_id=%r, data=%r, hash_tags=%r, now=%r)" % (
+        self.user_id,
+        self.data,
+        self.hash_tags,
+        self.now)
+
 
+class AddPostsResult:
+  """The result of calling add_posts.
 
-def _get_post_query(session, client_id):
-  return session.query(MappedPost, MappedStarredPost)\
-      .options(sa_orm.subqueryload(MappedPost.hash_tags))\
-      .outerjoin(MappedStarredPost, sa.and_(
-        MappedStarredPost.post_id == MappedPost.id,
-        MappedStarredPost.user_id == client_id))\
+  For each NewPost, post_ids contains the identifier of the created post, or
+  None if it could not be created. For each post that could not be created,
+  errors maps its index to the DbException describing why.
+  """
+
+  def __init__(self, post_ids, errors):
+    self.post_ids = post_ids
+    self.errors = errors
+
+  def __repr__(self):
+    return "AddPostsResult(post_ids=%r, errors=%r)" % (self.post_ids, self.errors)
 
 
 @db_util.use_session
+def add_posts(session, new_posts, now=None):
+  """Creates the given NewPost instances in one transaction.
+
+  The created_datetime of a NewPost with a now value of None is the given time.
+  Duplicate hash tags of a NewPost are ignored. If a post or one of its hash tags
+  violates an integrity constraint, then neither is created, the post is reported
+  in the returned AddPostsResult, and the remaining posts are still created.
+  """
+
+  now = _utcnow(now)
+
+  try:
+    post_insert = Posts.insert()
+    hash_tag_insert = HashTags.insert()
+    post_ids = []
+    errors = {}
+    written_keys = set([_ALL_POSTS_KEY])
+    for index, new_post in enumerate(new_posts):
+      created_datetime = new_post.now if new_post.now is not None else now
+      # Add each post and its hash tags in a savepoint, so that a failure rolls
+      # back only that post.
+      savepoint = session.begin_nested()
+      try:
+        result = session.execute(post_insert, {
+          "creator": new_post.user_id,
+          "created_datetime": created_datetime,
+          "data": new_post.data,
+        })
+        post_id = result.inserted_primary_key[0]
+        hash_tag_rows = []
+        added_hash_tags = set()
+        for hash_tag_value in new_post.hash_tags:
+          if hash_tag_value not in added_hash_tags:
+            added_hash_tags.add(hash_tag_value)
+            hash_tag_rows.append({
+              "post_id": post_id,
+              "value": hash_tag_value,
+              "created_datetime": created_datetime,
+            })
+        # Add the hash tags of the post using one executemany call.
+        if hash_tag_rows:
+          session.execute(hash_tag_insert, hash_tag_rows)
+        savepoint.commit()
+      except sa.exc.IntegrityError as e:
+        savepoint.rollback()
+        post_ids.append(None)
+        errors[index] = DbException(e)
+        continue
+
+      post_ids.append(post_id)
+      written_keys.add(_user_sticky_key(new_post.user_id))
+      written_keys.update(_hash_tag_key(hash_tag_value) for hash_tag_value in added_hash_tags)
+
+    session.commit()
+    db_util.record_write(*written_keys)
+
+    return AddPostsResult(post_ids, errors)
+  except sa.exc.IntegrityError:
+    session.rollback()
+    raise db_util.DbException._chain()
+
+
+def _get_star_count_delta(post_id_column):
+  """Returns the sum of the star count deltas not yet folded into the num_stars
+  value of the post with the identifier in the given column.
+  """
+  return sa.select([sa.func.coalesce(sa.func.sum(StarCountDeltas.c.delta), 0)])\
+      .where(StarCountDeltas.c.post_id == post_id_column)\
+      .as_scalar()
+
+
+# The hot read statements, built once with bind parameters and keyed by a tuple
+# describing each. For each call, only the parameters are bound.
+_statements = {}
+# The compiled form of each statement in _statements for each dialect.
+_compiled_cache = {}
+# The maximum number of statements in _statements before it is cleared.
+_MAX_STATEMENTS = 200
+
+def _get_statement(key, build_statement):
+  """Returns the statement for the given key, calling build_statement to build it
+  if it is not cached.
+  """
+  statement = _statements.get(key)
+  if statement is None:
+    if len(_statements) >= _MAX_STATEMENTS:
+      # Clear the caches in the unlikely event that callers use many page sizes.
+      _statements.clear()
+      _compiled_cache.clear()
+    statement = build_statement()
+    _statements[key] = statement
+  return statement
+
+def _execute_statement(session, statement, params):
+  """Executes the given statement from _get_statement, which is compiled only
+  once per dialect.
+  """
+  connection = session.connection().execution_options(compiled_cache=_compiled_cache)
+  return connection.execute(statement, params)
+
+
+def _get_post_select(from_clause=Posts):
+  """Returns a select of the columns needed by _make_posts from the given clause,
+  which must contain the Posts table.
+
+  The client_id parameter must be bound when it is executed.
+  """
+  return sa.select([
+        Posts.c.id,
+        Posts.c.creator,
+        Posts.c.created_datetime,
+        Posts.c.data,
+        (Posts.c.num_stars + _get_star_count_delta(Posts.c.id)).label("num_stars"),
+        StarredPosts.c.post_id.label("starred_post_id"),
+      ])\
+      .select_from(from_clause.outerjoin(StarredPosts, sa.and_(
+        StarredPosts.c.post_id == Posts.c.id,
+        StarredPosts.c.user_id == sa.bindparam("client_id"))))
+
+
+# The maximum number of identifiers bound in one query, below the SQLite limit of 999.
+_MAX_IDS_PER_QUERY = 900
+
+def _get_ids_params(ids):
+  """Returns the parameters for binding the given identifiers to a statement
+  built using _build_ids_clause.
+  """
+  return {"id_%d" % i: id for i, id in enumerate(ids)}
+
+def _build_ids_clause(column, num_ids):
+  """Returns a clause for whether the given column has one of num_ids
+  identifiers, which are bound using _get_ids_params.
+  """
+  return column.in_([sa.bindparam("id_%d" % i) for i in xrange(num_ids)])
+
+
+def _make_posts(session, rows):
+  """Returns a tuple of Post instances from the given rows of _get_post_select.
+
+  The hash tags of every 900 posts are read using one query.
+  """
+
+  hash_tags_by_post_id = {}
+  post_ids = [row.id for row in rows]
+  for i in xrange(0, len(post_ids), _MAX_IDS_PER_QUERY):
+    chunk_post_ids = post_ids[i:i + _MAX_IDS_PER_QUERY]
+    statement = _get_statement(("hash_tags", len(chunk_post_ids)),
+        lambda: sa.select([HashTags.c.post_id, HashTags.c.value])
+            .where(_build_ids_clause(HashTags.c.post_id, len(chunk_post_ids)))
+            .order_by(HashTags.c.post_id, HashTags.c.value))
+    hash_tag_rows = _execute_statement(session, statement, _get_ids_params(chunk_post_ids))
+    for post_id, hash_tag_value in hash_tag_rows:
+      hash_tags_by_post_id.setdefault(post_id, []).append(hash_tag_value)
+
+  return tuple(Post(row.id,
+        row.creator,
+        row.created_datetime,
+        row.data,
+        row.starred_post_id is not None,
+        row.num_stars,
+        tuple(hash_tags_by_post_id.get(row.id, ())))
+      for row in rows)
+
+
+_CURSOR_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+def _encode_cursor(created_datetime, id):
+  """Returns an opaque cursor for the item with the given creation time and identifier."""
+  cursor_string = "%s/%s" % (created_datetime.strftime(_CURSOR_DATETIME_FORMAT), id)
+  return base64.urlsafe_b64encode(cursor_string)
+
+def _decode_cursor(cursor):
+  """Returns the creation time and identifier encoded by the given cursor."""
+  try:
+    datetime_string, id_string = base64.urlsafe_b64decode(str(cursor)).split("/")
+    return datetime.strptime(datetime_string, _CURSOR_DATETIME_FORMAT), int(id_string)
+  except (TypeError, ValueError):
+    raise InvalidCursorException("Invalid cursor: %r" % cursor)
+
+def _cursor_for_post(post):
+  """Returns the cursor for the given Post."""
+  return _encode_cursor(post.created_datetime, post.id)
+
+
+def _get_page(session, name, build_select, datetime_column, id_column, params,
+    before, after, page_size):
+  """Returns a PaginatedSequence of posts for one page of the select returned by
+  build_select, which extends _get_post_select.
+
+  Rows are ordered by the given datetime and identifier columns, which must be
+  the trailing columns of an index so that the cost of a page does not depend
+  on how many rows precede it.
+  """
+
+  if (before is not None) and (after is not None):
+    raise InvalidCursorException("Only one of before and after can be specified")
+
+  params = dict(params)
+  if before is not None:
+    params["cursor_datetime"], params["cursor_id"] = _decode_cursor(before)
+  elif after is not None:
+    params["cursor_datetime"], params["cursor_id"] = _decode_cursor(after)
+
+  def _build_statement():
+    select = build_select()
+    cursor_datetime = sa.bindparam("cursor_datetime")
+    cursor_id = sa.bindparam("cursor_id")
+    if after is None:
+      # Walk from the newest row, or the row following the cursor, to older rows.
+      if before is not None:
+        select = select.where(sa.or_(
+            datetime_column < cursor_datetime,
+            sa.and_(datetime_column == cursor_datetime, id_column < cursor_id)))
+      select = select.order_by(datetime_column.desc(), id_column.desc())
+    else:
+      # Walk from the row preceding the cursor to newer rows.
+      select = select.where(sa.or_(
+          datetime_column > cursor_datetime,
+          sa.and_(datetime_column == cursor_datetime, id_column > cursor_id)))
+      select = select.order_by(datetime_column.asc(), id_column.asc())
+    # Fetch one more row than needed to determine whether another page exists.
+    return select.limit(page_size + 1)
+
+  statement_key = (name, before is not None, after is not None, page_size)
+  statement = _get_statement(statement_key, _build_statement)
+  rows = _execute_statement(session, statement, params).fetchall()
+  has_more = len(rows) > page_size
+  rows = rows[:page_size]
+  if after is not None:
+    rows.reverse()
+  posts = _make_posts(session, rows)
+
+  next_cursor = None
+  previous_cursor = None
+  if posts:
+    if has_more or (after is not None):
+      next_cursor = _cursor_for_post(posts[-1])
+    if (has_more and (after is not None)) or (before is not None):
+      previous_cursor = _cursor_for_post(posts[0])
+  return PaginatedSequence(posts, next_cursor, previous_cursor)
+
+
+@db_util.cache_results(_get_post_version_keys)
+@db_util.use_replica_session(_get_client_sticky_keys)
 def get_post(session, client_id, post_id, now=None):
   """Returns the post with the given identifier."""
 
   now = _utcnow(now)
 
+  statement = _get_statement(("post",),
+      lambda: _get_post_select().where(Posts.c.id == sa.bindparam("post_id")))
+  rows = _execute_statement(session, statement,
+      {"client_id": client_id, "post_id": post_id}).fetchall()
+  posts = _make_posts(session, rows)
+  if posts:
+    return posts[0]
+  return None
+
+
+def _to_post_id(post_id):
+  """Returns the given post identifier as an integer, or None if it is not one."""
   try:
-    result = _get_post_query(session, client_id)\
-        .filter(MappedPost.id == post_id)\
-        .one()
-    return _make_post(*result)
-  except sa_orm.exc.NoResultFound:
+    return int(post_id)
+  except (TypeError, ValueError):
     return None
 
 
-@db_util.use_session
-def get_posts(session, client_id, now=None):
-  """Returns all posts."""
+@db_util.use_replica_session(_get_client_sticky_keys)
+def get_posts_by_ids(session, client_id, post_ids, now=None):
+  """Returns a list containing the post for each of the given identifiers, or
+  None for each identifier that has no post.
+
+  This reads the posts, their hash tags and their stars by the client using a
+  constant number of queries for every 900 identifiers.
+  """
 
   now = _utcnow(now)
 
   try:
-    results = _get_post_query(session, client_id)\
-        .order_by(MappedPost.created_datetime.desc())
-    posts = tuple(_make_post(*result) for result in results)
-    return PaginatedSequence(posts)
+    unique_post_ids = list(set(
+        _to_post_id(post_id) for post_id in post_ids if _to_post_id(post_id) is not None))
+    rows = []
+    for i in xrange(0, len(unique_post_ids), _MAX_IDS_PER_QUERY):
+      chunk_post_ids = unique_post_ids[i:i + _MAX_IDS_PER_QUERY]
+      statement = _get_statement(("posts_by_ids", len(chunk_post_ids)),
+          lambda: _get_post_select().where(_build_ids_clause(Posts.c.id, len(chunk_post_ids))))
+      params = _get_ids_params(chunk_post_ids)
+      params["client_id"] = client_id
+      rows.extend(_execute_statement(session, statement, params))
+    posts_by_id = {post.id: post for post in _make_posts(session, rows)}
+    return [posts_by_id.get(_to_post_id(post_id)) for post_id in post_ids]
   except sa.exc.IntegrityError:
     session.rollback()
     raise db_util.DbException._chain()
 
 
-@db_util.use_session
-def get_posts_with_hashtag(session, client_id, hash_tag, now=None):
-  """Returns all posts with the given hash tag."""
+@db_util.cache_results(_get_posts_version_keys)
+@db_util.use_replica_session(_get_posts_sticky_keys, _get_posts_version_keys)
+def get_posts(session, client_id, now=None,
+    before=None, after=None, page_size=DEFAULT_PAGE_SIZE):
+  """Returns a page of all posts, from most recent to least recent."""
 
   now = _utcnow(now)
 
   try:
-    results = session.query(MappedHashTag, MappedStarredPost)\
-        .options(sa_orm.joinedload(MappedHashTag.post))\
-        .outerjoin(MappedStarredPost, sa.and_(
-          MappedStarredPost.post_id == MappedHashTag.post_id,
-          MappedStarredPost.user_id == client_id))\
-        .order_by(MappedHashTag.created_datetime.desc())\
-        .filter(MappedHashTag.value == hash_tag)
-    posts = tuple(_make_post(mapped_hash_tag.post, mapped_starred_post)
-        for mapped_hash_tag, mapped_starred_post in results)
-    return PaginatedSequence(posts)
+    return _get_page(session, "posts", _get_post_select,
+        Posts.c.created_datetime, Posts.c.id, {"client_id": client_id},
+        before, after, page_size)
   except sa.exc.IntegrityError:
     session.rollback()
     raise db_util.DbException._chain()
 
 
-@db_util.use_session
-def get_posts_by_user(session, client_id, user_id, now=None):
-  """Returns all posts by the given user."""
+@db_util.cache_results(_get_posts_with_hashtag_version_keys)
+@db_util.use_replica_session(_get_posts_with_hashtag_sticky_keys, _get_posts_with_hashtag_version_keys)
+def get_posts_with_hashtag(session, client_id, hash_tag, now=None,
+    before=None, after=None, page_size=DEFAULT_PAGE_SIZE):
+  """Returns a page of all posts with the given hash tag, from most recent to
+  least recent.
+  """
+
+  now = _utcnow(now)
+
+  try:
+    def _build_select():
+      return _get_post_select(HashTags.join(Posts, Posts.c.id == HashTags.c.post_id))\
+          .where(HashTags.c.value == sa.bindparam("hash_tag"))
+    # The created_datetime of a hash tag is the created_datetime of its post.
+    return _get_page(session, "posts_with_hashtag", _build_select,
+        HashTags.c.created_datetime, HashTags.c.post_id,
+        {"client_id": client_id, "hash_tag": hash_tag},
+        before, after, page_size)
+  except sa.exc.IntegrityError:
+    session.rollback()
+    raise db_util.DbException._chain()
+
+
+@db_util.cache_results(_get_posts_by_user_version_keys)
+@db_util.use_replica_session(_get_posts_by_user_sticky_keys, _get_posts_by_user_version_keys)
+def get_posts_by_user(session, client_id, user_id, now=None,
+    before=None, after=None, page_size=DEFAULT_PAGE_SIZE):
+  """Returns a page of all posts by the given user, from most recent to least
+  recent.
+  """
 
   now = _utcnow(now)
   try:
-    results = _get_post_query(session, client_id)\
-        .order_by(MappedPost.created_datetime.desc())\
-        .filter(MappedPost.creator == user_id)
-    posts = tuple(_make_post(*result) for result in results)
-    return PaginatedSequence(posts)
+    def _build_select():
+      return _get_post_select()\
+          .where(Posts.c.creator == sa.bindparam("user_id"))
+    return _get_page(session, "posts_by_user", _build_select,
+        Posts.c.created_datetime, Posts.c.id,
+        {"client_id": client_id, "user_id": user_id},
+        before, after, page_size)
   except sa.exc.IntegrityError:
     session.rollback()
     raise db_util.DbException._chain()
 
 
+def _iter_pages(get_page, batch_size):
+  """Yields every post from walking all pages returned by get_page.
+
+  Each page is read using its own session, so at most batch_size posts are held
+  in memory, and no transaction is held open while the caller consumes posts.
+  The pages are not cached, so that walking them does not evict hot results.
+  """
+  before = None
+  while True:
+    page = get_page(before=before, page_size=batch_size)
+    for post in page:
+      yield post
+    before = page.next_cursor
+    if before is None:
+      return
+
+def iter_posts(client_id, batch_size=DEFAULT_BATCH_SIZE):
+  """Returns an iterator over all posts, from most recent to least recent."""
+  return _iter_pages(functools.partial(get_posts.uncached, client_id), batch_size)
+
+def iter_posts_with_hashtag(client_id, hash_tag, batch_size=DEFAULT_BATCH_SIZE):
+  """Returns an iterator over all posts with the given hash tag, from most
+  recent to least recent.
+  """
+  return _iter_pages(functools.partial(get_posts_with_hashtag.uncached, client_id, hash_tag), batch_size)
+
+def iter_posts_by_user(client_id, user_id, batch_size=DEFAULT_BATCH_SIZE):
+  """Returns an iterator over all posts by the given user, from most recent to
+  least recent.
+  """
+  return _iter_pages(functools.partial(get_posts_by_user.uncached, client_id, user_id), batch_size)
+
+
 @db_util.use_session
 def star_post(session, user_id, post_id, now=None):
   now = _utcnow(now)
@@ -192,14 +645,41 @@ def star_post(session, user_id, post_id, now=None):
     return None
 
   # Increment the count of stars for the post.
-  session.execute(Posts.update()
-      .where(MappedPost.id == post_id)
-      .values({MappedPost.num_stars: MappedPost.num_stars + 1}))
+  _add_star_count_delta(session, post_id, 1)
 
   session.commit()
+  db_util.record_write(_user_sticky_key(user_id), _post_sticky_key(post_id))
 
 
-@db_util.use_session
+@db_util.use_replica_session(_get_client_sticky_keys)
+def get_starred_post_ids(session, client_id, post_ids, now=None):
+  """Returns a frozenset of the identifiers among the given ones of the posts
+  starred by the client.
+  """
+
+  now = _utcnow(now)
+
+  try:
+    unique_post_ids = list(set(
+        _to_post_id(post_id) for post_id in post_ids if _to_post_id(post_id) is not None))
+    starred_post_ids = set()
+    for i in xrange(0, len(unique_post_ids), _MAX_IDS_PER_QUERY):
+      chunk_post_ids = unique_post_ids[i:i + _MAX_IDS_PER_QUERY]
+      statement = _get_statement(("starred_post_ids", len(chunk_post_ids)),
+          lambda: sa.select([StarredPosts.c.post_id])
+              .where(StarredPosts.c.user_id == sa.bindparam("client_id"))
+              .where(_build_ids_clause(StarredPosts.c.post_id, len(chunk_post_ids))))
+      params = _get_ids_params(chunk_post_ids)
+      params["client_id"] = client_id
+      starred_post_ids.update(row.post_id for row in _execute_statement(session, statement, params))
+    return frozenset(starred_post_ids)
+  except sa.exc.IntegrityError:
+    session.rollback()
+    raise db_util.DbException._chain()
+
+
+@db_util.cache_results(_get_stars_version_keys)
+@db_util.use_replica_session(_get_post_sticky_keys)
 def get_stars(session, post_id, now=None):
   now = _utcnow(now)
 
@@ -228,9 +708,134 @@ def unstar_post(session, user_id, post_id, now=None):
     return
 
   # Decrement the count of stars for the post.
-  session.execute(Posts.update()
-      .where(MappedPost.id == post_id)
-      .values({MappedPost.num_stars: MappedPost.num_stars - 1}))
+  _add_star_count_delta(session, post_id, -1)
 
   session.commit()
+  db_util.record_write(_user_sticky_key(user_id), _post_sticky_key(post_id))
+
+
+def _fold_star_count_deltas(session):
+  """Applies all star count deltas to the num_stars values of their posts, and
+  then deletes them.
+
+  This is not committed.
+  """
+  max_delta_id = session.query(sa.func.max(MappedStarCountDelta.id)).scalar()
+  if max_delta_id is None:
+    return
+
+  post_deltas = session.query(MappedStarCountDelta.post_id, sa.func.sum(MappedStarCountDelta.delta))\
+      .filter(MappedStarCountDelta.id <= max_delta_id)\
+      .group_by(MappedStarCountDelta.post_id)\
+      .all()
+  for post_id, delta in post_deltas:
+    if delta:
+      session.execute(Posts.update()
+          .where(MappedPost.id == post_id)
+          .values({MappedPost.num_stars: MappedPost.num_stars + delta}))
+  session.execute(StarCountDeltas.delete()
+      .where(MappedStarCountDelta.id <= max_delta_id))
+
+
+def _add_star_count_delta(session, post_id, delta):
+  """Records the given change to the num_stars value of the given post.
+
+  Instead of updating the post, which makes its row a hotspot for concurrent
+  writers, this appends a delta that readers add to num_stars. Deltas are
+  periodically folded into the num_stars values of their posts.
+  """
+  result = session.execute(StarCountDeltas.insert().values(post_id=post_id, delta=delta))
+  delta_id = result.inserted_primary_key[0]
+  if not (delta_id % STAR_COUNT_FOLD_INTERVAL):
+    _fold_star_count_deltas(session)
 
+
+@db_util.use_session
+def fold_star_counts(session):
+  """Applies all recorded star count deltas to the num_stars values of their
+  posts, such as from a periodic job.
+  """
+
+  try:
+    _fold_star_count_deltas(session)
+    session.commit()
+  except sa.exc.IntegrityError:
+    session.rollback()
+    raise db_util.DbException._chain()
+
+
+class PostEnrichment:
+  """A post claimed for enrichment by claim_post_enrichments."""
+
+  def __init__(self, post_id, data, num_attempts):
+    self.post_id = post_id
+    self.data = data
+    self.num_attempts = num_attempts
+
+  def __repr__(self):
+    return "PostEnrichment(post_id=%r, data=%r, num_attempts=%r)" % (
+        self.post_id, self.data, self.num_attempts)
+
+
+@db_util.use_session
+def claim_post_enrichments(session, limit, claim_seconds, now=None):
+  """Claims up to the given number of posts queued for enrichment, in order of
+  identifier, and returns a list of their PostEnrichment instances.
+
+  A post is not claimed again for claim_seconds, so that concurrent workers do
+  not enrich the same post. If it is not completed by then, such as because its
+  worker stopped, then it is claimed again.
+  """
+
+  now = _utcnow(now)
+
+  try:
+    claimable = sa.or_(PendingEnrichments.c.claimed_until_datetime == None,
+        PendingEnrichments.c.claimed_until_datetime <= now)
+    rows = session.execute(
+        sa.select([PendingEnrichments.c.post_id, PendingEnrichments.c.num_attempts, Posts.c.data])
+            .select_from(PendingEnrichments.join(Posts, Posts.c.id == PendingEnrichments.c.post_id))
+            .where(claimable)
+            .order_by(PendingEnrichments.c.post_id)
+            .limit(limit)).fetchall()
+
+    post_enrichments = []
+    for row in rows:
+      # Another worker may have claimed the post since it was read.
+      result = session.execute(PendingEnrichments.update()
+          .where(sa.and_(PendingEnrichments.c.post_id == row.post_id, claimable))
+          .values(claimed_until_datetime=now + timedelta(seconds=claim_seconds),
+              num_attempts=PendingEnrichments.c.num_attempts + 1))
+      if result.rowcount:
+        post_enrichments.append(PostEnrichment(row.post_id, row.data, row.num_attempts + 1))
+    session.commit()
+    return post_enrichments
+  except sa.exc.IntegrityError:
+    session.rollback()
+    raise db_util.DbException._chain()
+
+
+@db_util.use_session
+def complete_post_enrichment(session, post_id, previous_data, data=None):
+  """Removes the given post from the queue of posts for enrichment.
+
+  If data is not None, then in the same transaction the data of the post is
+  replaced, but only if it is still previous_data. Returns whether it was
+  replaced.
+  """
+
+  try:
+    replaced = False
+    if data is not None:
+      result = session.execute(Posts.update()
+          .where(sa.and_(Posts.c.id == post_id, Posts.c.data == previous_data))
+          .values(data=data))
+      replaced = bool(result.rowcount)
+    session.execute(PendingEnrichments.delete().where(PendingEnrichments.c.post_id == post_id))
+    session.commit()
+    if replaced:
+      db_util.record_write(_post_sticky_key(post_id))
+    return replaced
+  except sa.exc.IntegrityError:
+    session.rollback()
+    raise db_util.DbException._chain()
@@ -37,14 +37,37 @@ class StarredPost(_Base):
   post = sa_orm.relationship("Post", backref=sa_orm.backref("stars"))
 
 
+class StarCountDelta(_Base):
+  """A change to the num_stars value of a post that is not yet applied to it."""
+  __tablename__ = "StarCountDeltas"
+
+  id = sa.Column(sa.Integer, primary_key=True)
+  post_id = sa.Column(sa.Integer, sa.ForeignKey("Posts.id"), nullable=False)
+  delta = sa.Column(sa.Integer, nullable=False)
+
+
+class PendingEnrichment(_Base):
+  """A post whose URLs are not yet decoded."""
+  __tablename__ = "PendingEnrichments"
+
+  post_id = sa.Column(sa.Integer, sa.ForeignKey("Posts.id"), primary_key=True)
+  num_attempts = sa.Column(sa.Integer, nullable=False, default=0)
+  # The time until which a worker has claimed the post, or None if unclaimed.
+  claimed_until_datetime = sa.Column(sa.DateTime, nullable=True)
+
+
 def _create_table_aliases():
   """Creates an alias for each table, for convenience."""
   global Posts
   global HashTags
   global StarredPosts
+  global StarCountDeltas
+  global PendingEnrichments
   Posts = Post.__table__
   HashTags = HashTag.__table__
   StarredPosts = StarredPost.__table__
+  StarCountDeltas = StarCountDelta.__table__
+  PendingEnrichments = PendingEnrichment.__table__
 
 _create_table_aliases()
 
@@ -53,8 +76,12 @@ def _define_indexes():
   """Defines the indexes needed for efficient queries."""
   # Return all posts sorted by time.
   sa_schema.Index("PostsByTime", Post.created_datetime, Post.id)
+  # Return all posts sorted by time for a given user.
+  sa_schema.Index("PostsByCreatorAndTime", Post.creator, Post.created_datetime, Post.id)
   # Return all posts sorted by time for a given hash tag.
   sa_schema.Index("HashTagsByTime", HashTag.value, HashTag.created_datetime, HashTag.post_id)
+  # Return the sum of the unapplied star count deltas for a given post.
+  sa_schema.Index("StarCountDeltasByPost", StarCountDelta.post_id, StarCountDelta.delta)
 
 _define_indexes()
 
@@ -78,6 +78,72 @@ class DbTest(unittest.TestCase):
     self.assertSequenceEqual(expected_stars, stars.items)
 
 
+  def test_add_posts(self):
+    all_insert_data = [
+        PostInsertData("user_id1", "data1", ["hash_tag1", "hash_tag2"], datetime(2012, 8, 25)),
+        PostInsertData("user_id2", "data2", [], datetime(2013, 9, 26)),
+        PostInsertData("user_id1", "data3", ["hash_tag2"], datetime(2014, 10, 27)),
+    ]
+    new_posts = [
+        db.NewPost(insert_data.user_id, insert_data.data, insert_data.hash_tags, insert_data.now)
+        for insert_data in all_insert_data]
+    result = db.add_posts(new_posts)
+    self.assertEqual(3, len(result.post_ids))
+    self.assertFalse(result.errors)
+
+    # Assert that the identifiers are returned in order.
+    for insert_data, post_id in zip(all_insert_data, result.post_ids):
+      self._assert_post(insert_data, db.get_post(self.client_id, post_id))
+    hash_tag_posts = db.get_posts_with_hashtag(self.client_id, "hash_tag2")
+    self.assertSequenceEqual(
+        [result.post_ids[2], result.post_ids[0]], [post.id for post in hash_tag_posts])
+
+  def test_add_posts_with_errors(self):
+    now = datetime(2013, 9, 26)
+    new_posts = [
+        db.NewPost("user_id1", "data1", ["hash_tag"]),
+        # The data cannot be None.
+        db.NewPost("user_id2", None, ["hash_tag"]),
+        # Duplicate hash tags are ignored.
+        db.NewPost("user_id3", "data3", ["hash_tag", "hash_tag"]),
+    ]
+    result = db.add_posts(new_posts, now)
+    self.assertEqual(3, len(result.post_ids))
+    self.assertIsNone(result.post_ids[1])
+    self.assertSequenceEqual([1], result.errors.keys())
+    self.assertIsInstance(result.errors[1], db.DbException)
+
+    # Assert that the other posts were added.
+    self._assert_post(PostInsertData("user_id1", "data1", ["hash_tag"], now),
+        db.get_post(self.client_id, result.post_ids[0]))
+    self._assert_post(PostInsertData("user_id3", "data3", ["hash_tag"], now),
+        db.get_post(self.client_id, result.post_ids[2]))
+    self.assertEqual(2, len(db.get_posts(self.client_id)))
+
+  def test_add_posts_with_hash_tag_errors(self):
+    now = datetime(2013, 9, 26)
+    new_posts = [
+        db.NewPost("user_id1", "data1", ["hash_tag"]),
+        # The hash tag cannot be None.
+        db.NewPost("user_id2", "data2", ["hash_tag", None]),
+        db.NewPost("user_id3", "data3", ["hash_tag"]),
+    ]
+    result = db.add_posts(new_posts, now)
+    self.assertIsNone(result.post_ids[1])
+    self.assertSequenceEqual([1], result.errors.keys())
+
+    # Assert that neither the failed post nor its valid hash tag was added.
+    self.assertEqual(2, len(db.get_posts(self.client_id)))
+    hash_tag_posts = db.get_posts_with_hashtag(self.client_id, "hash_tag")
+    self.assertSequenceEqual(
+        [result.post_ids[2], result.post_ids[0]], [post.id for post in hash_tag_posts])
+
+  def test_add_no_posts(self):
+    result = db.add_posts([])
+    self.assertFalse(result.post_ids)
+    self.assertFalse(result.errors)
+
+
   def test_get_missing_post(self):
     missing_post_id = "missing_post_id"
     post = db.get_post(self.client_id, missing_post_id)
@@ -110,6 +176,35 @@ class DbTest(unittest.TestCase):
     self._assert_post(insert_data1, all_posts[1], 0)
 
 
+  def test_get_posts_by_ids(self):
+    insert_data1 = PostInsertData("user_id1", "data1", ["hash_tag1", "hash_tag2"], datetime(2013, 9, 26))
+    post_id1 = self._add_post(insert_data1)
+    insert_data2 = PostInsertData("user_id2", "data2", [], datetime(2014, 10, 27))
+    post_id2 = self._add_post(insert_data2)
+    db.star_post(self.client_id, post_id2)
+
+    # Assert that the posts are returned in the given order, with None for missing posts.
+    posts = db.get_posts_by_ids(self.client_id,
+        [post_id2, "missing_post_id", post_id1, post_id2 + post_id1, str(post_id1)])
+    self.assertEqual(5, len(posts))
+    self._assert_post(insert_data2, posts[0], True, 1)
+    self.assertIsNone(posts[1])
+    self._assert_post(insert_data1, posts[2])
+    self.assertIsNone(posts[3])
+    self._assert_post(insert_data1, posts[4])
+
+    self.assertSequenceEqual([], db.get_posts_by_ids(self.client_id, []))
+
+  def test_get_posts_by_ids_many(self):
+    num_posts = 1200
+    result = db.add_posts([db.NewPost("user_id", "data%s" % i, ["hash_tag"])
+        for i in xrange(num_posts)])
+    post_ids = list(reversed(result.post_ids))
+    posts = db.get_posts_by_ids(self.client_id, post_ids)
+    self.assertSequenceEqual(post_ids, [post.id for post in posts])
+    self.assertSequenceEqual(("hash_tag",), posts[0].hash_tags)
+
+
   def test_get_posts_with_hashtag(self):
     hash_tag1 = "hash_tag1"
     hash_tag2 = "hash_tag2"
@@ -191,6 +286,126 @@ class DbTest(unittest.TestCase):
     self.assertEqual(0, len(user_posts))
 
 
+  def _add_posts_for_pages(self, user_ids, hash_tags):
+    """Inserts a post for each given user and returns the PostInsertData
+    instances from most recent to least recent.
+    """
+    all_insert_data = []
+    for i, user_id in enumerate(user_ids):
+      # Assign the last two posts the same time so that the identifier breaks the tie.
+      now = datetime(2010 + min(i, len(user_ids) - 2), 6, 23)
+      insert_data = PostInsertData(user_id, "data%s" % i, hash_tags, now)
+      self._add_post(insert_data)
+      all_insert_data.append(insert_data)
+    return list(reversed(all_insert_data))
+
+  def _assert_pages(self, get_page, expected_insert_data, page_size):
+    """Asserts that walking the pages returned by get_page forward and then
+    backward returns the given PostInsertData instances.
+    """
+
+    # Walk forward from the most recent page.
+    pages = [get_page(page_size=page_size)]
+    self.assertIsNone(pages[0].previous_cursor)
+    while pages[-1].next_cursor:
+      page = get_page(before=pages[-1].next_cursor, page_size=page_size)
+      self.assertIsNotNone(page.previous_cursor)
+      pages.append(page)
+    posts = [post for page in pages for post in page]
+    self.assertEqual(len(expected_insert_data), len(posts))
+    for insert_data, post in zip(expected_insert_data, posts):
+      self._assert_post(insert_data, post)
+
+    # Walk backward from the least recent page.
+    previous_cursor = pages[-1].previous_cursor
+    for expected_page in reversed(pages[:-1]):
+      page = get_page(after=previous_cursor, page_size=page_size)
+      self.assertSequenceEqual([post.id for post in expected_page], [post.id for post in page])
+      self.assertIsNotNone(page.next_cursor)
+      previous_cursor = page.previous_cursor
+    self.assertIsNone(previous_cursor)
+
+  def test_get_posts_pages(self):
+    expected_insert_data = self._add_posts_for_pages(["user_id"] * 5, [])
+    def _get_page(**kwargs):
+      return db.get_posts(self.client_id, **kwargs)
+    self._assert_pages(_get_page, expected_insert_data, 2)
+    self._assert_pages(_get_page, expected_insert_data, 5)
+
+  def test_get_posts_with_hashtag_pages(self):
+    hash_tag = "hash_tag"
+    expected_insert_data = self._add_posts_for_pages(["user_id"] * 5, [hash_tag])
+    def _get_page(**kwargs):
+      return db.get_posts_with_hashtag(self.client_id, hash_tag, **kwargs)
+    self._assert_pages(_get_page, expected_insert_data, 2)
+    self._assert_pages(_get_page, expected_insert_data, 5)
+
+  def test_get_posts_by_user_pages(self):
+    user_id1 = "user_id1"
+    all_insert_data = self._add_posts_for_pages([user_id1, "user_id2"] * 3, [])
+    expected_insert_data = [
+        insert_data for insert_data in all_insert_data if insert_data.user_id == user_id1]
+    def _get_page(**kwargs):
+      return db.get_posts_by_user(self.client_id, user_id1, **kwargs)
+    self._assert_pages(_get_page, expected_insert_data, 2)
+    self._assert_pages(_get_page, expected_insert_data, 3)
+
+  def _assert_iter(self, posts_iter, expected_insert_data):
+    """Asserts that the given iterator returns the given PostInsertData instances."""
+    posts = list(posts_iter)
+    self.assertEqual(len(expected_insert_data), len(posts))
+    for insert_data, post in zip(expected_insert_data, posts):
+      self._assert_post(insert_data, post)
+
+  def test_iter_posts(self):
+    hash_tag = "hash_tag"
+    user_id1 = "user_id1"
+    all_insert_data = self._add_posts_for_pages([user_id1, "user_id2"] * 3, [hash_tag])
+    user_insert_data = [
+        insert_data for insert_data in all_insert_data if insert_data.user_id == user_id1]
+
+    for batch_size in (1, 2, 6, 10):
+      self._assert_iter(db.iter_posts(self.client_id, batch_size), all_insert_data)
+      self._assert_iter(
+          db.iter_posts_with_hashtag(self.client_id, hash_tag, batch_size), all_insert_data)
+      self._assert_iter(
+          db.iter_posts_by_user(self.client_id, user_id1, batch_size), user_insert_data)
+
+  def test_iter_no_posts(self):
+    self._assert_iter(db.iter_posts(self.client_id), [])
+    self._assert_iter(db.iter_posts_with_hashtag(self.client_id, "hash_tag"), [])
+    self._assert_iter(db.iter_posts_by_user(self.client_id, "user_id"), [])
+
+
+  def test_statement_cache(self):
+    hash_tag = "hash_tag"
+    user_id = "user_id"
+    self._add_posts_for_pages([user_id] * 5, [hash_tag])
+
+    def _read_posts():
+      page = db.get_posts(self.client_id, page_size=2)
+      db.get_posts(self.client_id, before=page.next_cursor, page_size=2)
+      db.get_posts(self.client_id, after=page.next_cursor, page_size=2)
+      db.get_posts_with_hashtag(self.client_id, hash_tag, page_size=2)
+      db.get_posts_by_user(self.client_id, user_id, page_size=2)
+      db.get_post(self.client_id, page[0].id)
+
+    _read_posts()
+    num_statements = len(db._statements)
+    num_compiled = len(db._compiled_cache)
+    # Assert that reading again does not build or compile any statements.
+    _read_posts()
+    self.assertEqual(num_statements, len(db._statements))
+    self.assertEqual(num_compiled, len(db._compiled_cache))
+
+
+  def test_get_posts_invalid_cursor(self):
+    with self.assertRaises(db.InvalidCursorException):
+      db.get_posts(self.client_id, before="invalid_cursor")
+    with self.assertRaises(db.InvalidCursorException):
+      db.get_posts(self.client_id, after="invalid_cursor")
+
+
   def test_get_stars(self):
     user_id1 = "user_id1"
     user_id2 = "user_id2"
@@ -248,6 +463,20 @@ class DbTest(unittest.TestCase):
     _assert_user_id2_posts(db.get_posts_by_user(user_id2, creator_id))
 
 
+  def test_get_starred_post_ids(self):
+    post_id1 = self._add_post(PostInsertData("user_id1", "data1", [], datetime(2013, 9, 26)))
+    post_id2 = self._add_post(PostInsertData("user_id2", "data2", [], datetime(2014, 10, 27)))
+    post_id3 = self._add_post(PostInsertData("user_id3", "data3", [], datetime(2015, 11, 28)))
+    db.star_post(self.client_id, post_id1)
+    db.star_post(self.client_id, post_id3)
+    db.star_post("other_client_id", post_id2)
+
+    starred_post_ids = db.get_starred_post_ids(self.client_id,
+        [post_id1, post_id2, "missing_post_id", str(post_id3)])
+    self.assertEqual(frozenset([post_id1, post_id3]), starred_post_ids)
+    self.assertEqual(frozenset(), db.get_starred_post_ids(self.client_id, [post_id2]))
+    self.assertEqual(frozenset(), db.get_starred_post_ids(self.client_id, []))
+
   def test_star_missing_post(self):
     now = datetime(2013, 9, 26)
     db.star_post("user_id", "missing_post_id", now)
@@ -272,6 +501,61 @@ class DbTest(unittest.TestCase):
     self._assert_post(insert_data, db.get_post(user_id1, post_id), True, 1)
 
 
+  def _get_num_star_count_deltas(self):
+    return DbTest._engine.execute(
+        db_schema.StarCountDeltas.count()).scalar()
+
+  def test_fold_star_counts(self):
+    now = datetime(2013, 9, 26)
+    insert_data1 = PostInsertData("user_id1", "data1", ["hash_tag"], now)
+    post_id1 = self._add_post(insert_data1)
+    insert_data2 = PostInsertData("user_id2", "data2", ["hash_tag"], now)
+    post_id2 = self._add_post(insert_data2)
+
+    db.star_post("user_id1", post_id1, datetime(2014, 10, 27))
+    db.star_post("user_id2", post_id1, datetime(2015, 11, 28))
+    db.star_post("user_id3", post_id1, datetime(2016, 12, 29))
+    db.unstar_post("user_id2", post_id1)
+    db.star_post("user_id1", post_id2, datetime(2014, 10, 27))
+    self.assertEqual(5, self._get_num_star_count_deltas())
+    self._assert_stars(post_id1, ["user_id3", "user_id1"])
+    self._assert_stars(post_id2, ["user_id1"])
+
+    # Assert that the counts are unchanged after folding the deltas.
+    db.fold_star_counts()
+    self.assertEqual(0, self._get_num_star_count_deltas())
+    self._assert_stars(post_id1, ["user_id3", "user_id1"])
+    self._assert_stars(post_id2, ["user_id1"])
+    self._assert_post(insert_data1, db.get_post("user_id1", post_id1), True, 2)
+    self._assert_post(insert_data2, db.get_post("user_id1", post_id2), True, 1)
+
+    # Assert that deltas after folding are added to the folded counts.
+    db.unstar_post("user_id1", post_id1)
+    self._assert_stars(post_id1, ["user_id3"])
+    db.fold_star_counts()
+    self._assert_stars(post_id1, ["user_id3"])
+
+  def test_fold_star_counts_after_interval(self):
+    now = datetime(2013, 9, 26)
+    insert_data = PostInsertData("user_id1", "data1", ["hash_tag"], now)
+    post_id = self._add_post(insert_data)
+
+    fold_interval = db.STAR_COUNT_FOLD_INTERVAL
+    db.STAR_COUNT_FOLD_INTERVAL = 3
+    try:
+      db.star_post("user_id1", post_id, datetime(2014, 10, 27))
+      db.star_post("user_id2", post_id, datetime(2015, 11, 28))
+      self.assertEqual(2, self._get_num_star_count_deltas())
+      # Assert that recording the third delta folds all deltas.
+      db.star_post("user_id3", post_id, datetime(2016, 12, 29))
+      self.assertEqual(0, self._get_num_star_count_deltas())
+      self._assert_stars(post_id, ["user_id3", "user_id2", "user_id1"])
+      self._assert_post(insert_data, db.get_posts("user_id2")[0], True, 3)
+      self._assert_post(insert_data, db.get_posts_with_hashtag("user_id2", "hash_tag")[0], True, 3)
+    finally:
+      db.STAR_COUNT_FOLD_INTERVAL = fold_interval
+
+
   def test_unstar_post(self):
     user_id1 = "user_id1"
     user_id2 = "user_id2"
@@ -1,41 +1,245 @@
+import collections
+import contextlib
 import functools
+import itertools
 import sqlalchemy as sa
 import sqlalchemy.engine as sa_engine
 import sqlalchemy.orm as sa_orm
 import sys
+import threading
+import time
 
 
+_engine = None
 _session = None
+# The sessions for the read replicas, if any.
+_replica_sessions = []
+# Used to choose the replica for each read, in round-robin order.
+_replica_counter = itertools.count()
+# The number of seconds after a write during which reads go to the primary.
+_sticky_seconds = 0
+# Maps each sticky key to the time until which reads for it go to the primary.
+# This contains only the writes by this process.
+_sticky_keys = {}
+_sticky_keys_lock = threading.Lock()
+# If not None, the cache shared by all processes that is used instead of _sticky_keys.
+_sticky_store = None
+# The state of the shared session for the current thread, if any.
+_shared_session_state = threading.local()
+# The cache of the results of functions decorated by cache_results, if any.
+_result_cache = None
+# The number of seconds after which a cached result is read again, or None.
+_result_ttl_seconds = None
+# Maps each key passed to record_write to the number of writes affecting it.
+_write_versions = {}
+# Incremented by every write, so that a result read concurrently with a write
+# is not cached.
+_write_sequence = 0
+# Incremented whenever _write_versions is cleared, so that versions are not reused.
+_write_versions_epoch = 0
+# The maximum number of keys in _write_versions before it is cleared.
+_MAX_WRITE_VERSIONS = 100000
+_write_versions_lock = threading.Lock()
+# Maps the name of each function decorated by cache_results to its hits and misses.
+_result_cache_counts = collections.defaultdict(lambda: [0, 0])
 
-def create_engine(database_name, database_uri):
-  """Returns an engine for the given database."""
+class SqliteProfile:
+  """Performance settings for SQLite connections and the pool holding them.
+
+  See https://www.sqlite.org/pragma.html for details on each pragma.
+  """
+
+  def __init__(self,
+      journal_mode="WAL",
+      synchronous="NORMAL",
+      mmap_size=256 * 1024 * 1024,
+      cache_size=-16 * 1024,
+      busy_timeout=5000,
+      wal_autocheckpoint=1000,
+      maintenance_interval=60 * 60,
+      pool_size=5,
+      max_overflow=10,
+      pool_timeout=30):
+    # Use a write-ahead log so that readers do not block writers, and vice versa.
+    self.journal_mode = journal_mode
+    # With a write-ahead log, this is durable except across power loss.
+    self.synchronous = synchronous
+    # The number of bytes of the database to memory-map.
+    self.mmap_size = mmap_size
+    # If negative, the number of KiB of pages to cache per connection.
+    self.cache_size = cache_size
+    # The number of milliseconds to wait for a lock before failing.
+    self.busy_timeout = busy_timeout
+    # The number of pages in the write-ahead log that triggers a checkpoint.
+    self.wal_autocheckpoint = wal_autocheckpoint
+    # The minimum number of seconds between runs of run_sqlite_maintenance.
+    self.maintenance_interval = maintenance_interval
+    # The pool that holds connections to a SQLite file.
+    self.pool_size = pool_size
+    self.max_overflow = max_overflow
+    self.pool_timeout = pool_timeout
+
+  def get_pragmas(self):
+    """Returns the pragmas to execute on each new connection."""
+    return [
+      "PRAGMA journal_mode=%s" % self.journal_mode,
+      "PRAGMA synchronous=%s" % self.synchronous,
+      "PRAGMA mmap_size=%d" % self.mmap_size,
+      "PRAGMA cache_size=%d" % self.cache_size,
+      "PRAGMA busy_timeout=%d" % self.busy_timeout,
+      "PRAGMA wal_autocheckpoint=%d" % self.wal_autocheckpoint,
+    ]
+
+
+def run_sqlite_maintenance(dbapi_connection):
+  """Updates the statistics of the query planner and checkpoints the
+  write-ahead log, using the given SQLite connection.
+  """
+  cursor = dbapi_connection.cursor()
+  # This runs ANALYZE on only the tables that need it.
+  cursor.execute("PRAGMA optimize")
+  # Copy the write-ahead log into the database without blocking other connections.
+  cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+  cursor.close()
+
+
+class _SqliteMaintenanceScheduler:
+  """Runs run_sqlite_maintenance on a connection returned to the pool, at most
+  once every given number of seconds.
+  """
+
+  def __init__(self, interval):
+    self._interval = interval
+    self._last_run_time = time.time()
+    self._lock = threading.Lock()
+
+  def on_checkin(self, dbapi_connection, connection_record):
+    if dbapi_connection is None:
+      # The connection was invalidated.
+      return
+    elif time.time() - self._last_run_time < self._interval:
+      return
+    elif not self._lock.acquire(False):
+      # Another thread is running the maintenance.
+      return
+
+    try:
+      self._last_run_time = time.time()
+      run_sqlite_maintenance(dbapi_connection)
+    finally:
+      self._lock.release()
+
+
+def _is_sqlite_memory_database(database_uri):
+  database = sa_engine.url.make_url(database_uri).database
+  return database in (None, "", ":memory:")
+
+
+def create_engine(database_name, database_uri, sqlite_profile=None):
+  """Returns an engine for the given database.
+
+  If the database is SQLite and sqlite_profile is not None, then its settings
+  are applied to each connection and to the pool. If the database is SQLite in
+  memory, then all threads share one connection to it, one thread at a time.
+  """
+
+  engine_kwargs = {}
+  if database_name == "sqlite" and _is_sqlite_memory_database(database_uri):
+    # Each connection opens its own in-memory database, so share one connection
+    # so that other threads, such as the enrichment worker, see the same tables.
+    engine_kwargs.update({
+      "poolclass": sa.pool.StaticPool,
+      "connect_args": {"check_same_thread": False},
+    })
+  elif database_name == "sqlite" and sqlite_profile:
+    # By default SQLAlchemy opens a connection to a SQLite file for every
+    # checkout. Instead pool connections so that pragmas and caches persist.
+    engine_kwargs.update({
+      "poolclass": sa.pool.QueuePool,
+      "pool_size": sqlite_profile.pool_size,
+      "max_overflow": sqlite_profile.max_overflow,
+      "pool_timeout": sqlite_profile.pool_timeout,
+      "connect_args": {"check_same_thread": False},
+    })
+  engine = sa.create_engine(database_uri, convert_unicode=True, echo=False, **engine_kwargs)
 
   if database_name == "sqlite":
     # http://docs.sqlalchemy.org/en/rel_0_9/dialects/sqlite.html#foreign-key-support
-    @sa.event.listens_for(sa_engine.Engine, "connect")
+    @sa.event.listens_for(engine, "connect")
     def set_sqlite_pragma(dbapi_connection, connection_record):
+      # Stop pysqlite from emitting BEGIN and COMMIT itself, which breaks SAVEPOINT.
+      # http://docs.sqlalchemy.org/en/rel_0_9/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl
+      dbapi_connection.isolation_level = None
       cursor = dbapi_connection.cursor()
       cursor.execute("PRAGMA foreign_keys=ON")
+      if sqlite_profile:
+        for pragma in sqlite_profile.get_pragmas():
+          cursor.execute(pragma)
       cursor.close()
 
-  return sa.create_engine(database_uri, convert_unicode=True, echo=False)
+    @sa.event.listens_for(engine, "begin")
+    def do_begin(connection):
+      connection.execute("BEGIN")
 
+    if isinstance(engine.pool, sa.pool.StaticPool):
+      # Let one thread at a time check out the shared connection, so that the
+      # transactions of threads do not interleave.
+      connection_lock = threading.RLock()
+      sa.event.listen(engine, "checkout", lambda *pargs: connection_lock.acquire())
+      sa.event.listen(engine, "checkin", lambda *pargs: connection_lock.release())
 
-def create_session(engine):
-  """Creates the session."""
+    # An in-memory database needs no maintenance, and its shared connection may
+    # be in use by another thread once it is returned to the pool.
+    if sqlite_profile and not _is_sqlite_memory_database(database_uri):
+      scheduler = _SqliteMaintenanceScheduler(sqlite_profile.maintenance_interval)
+      sa.event.listen(engine, "checkin", scheduler.on_checkin)
+
+  return engine
+
+
+def _make_scoped_session(engine):
   # Use scoped_session with Flask: http://flask.pocoo.org/docs/patterns/sqlalchemy/
-  global _session
-  _session = sa_orm.scoped_session(sa_orm.sessionmaker(
+  return sa_orm.scoped_session(sa_orm.sessionmaker(
       autocommit=False, autoflush=False, bind=engine))
 
 
-def init_db(database_name, database_uri):
+def _clear_write_versions():
+  """Clears the versions of all keys, which invalidates all cached results."""
+  global _write_versions_epoch
+  with _write_versions_lock:
+    _write_versions.clear()
+    _write_versions_epoch += 1
+
+
+def create_session(engine, replica_engines=(), sticky_seconds=0):
+  """Creates the session, and a session for each given read replica.
+
+  For sticky_seconds after a write by a client, reads by that client go to the
+  primary instead of a replica, so that the client reads its own writes. Unless
+  set_sticky_store is called, this holds only for writes by this process.
+  """
+  global _engine
+  global _session
+  global _replica_sessions
+  global _sticky_seconds
+  _engine = engine
+  _session = _make_scoped_session(engine)
+  _replica_sessions = [_make_scoped_session(replica_engine) for replica_engine in replica_engines]
+  _sticky_seconds = sticky_seconds
+  with _sticky_keys_lock:
+    _sticky_keys.clear()
+  _clear_write_versions()
+
+
+def init_db(database_name, database_uri, sqlite_profile=None, replica_uris=(), sticky_seconds=0):
   """Initializes the database.
   
   This returns the Engine instance needed for creating the tables.
   """
-  engine = create_engine(database_name, database_uri)
-  create_session(engine)
+  engine = create_engine(database_name, database_uri, sqlite_profile)
+  replica_engines = [create_engine(database_name, replica_uri, sqlite_profile)
+      for replica_uri in replica_uris]
+  create_session(engine, replica_engines, sticky_seconds)
   return engine
 
 
@@ -44,17 +248,307 @@ def get_session():
   return _session
 
 
+def _get_shared_session_depth():
+  return getattr(_shared_session_state, "depth", 0)
+
+
+def begin_shared_session():
+  """Begins sharing one session and connection across all functions decorated
+  by use_session on this thread, until end_shared_session is called.
+
+  Calls can be nested, and only the outermost call to end_shared_session
+  releases the connection.
+  """
+  depth = _get_shared_session_depth()
+  if not depth:
+    # Bind a new session to one connection that is checked out until the end.
+    _session.remove()
+    _shared_session_state.connection = _engine.connect()
+    _session(bind=_shared_session_state.connection)
+  _shared_session_state.depth = depth + 1
+
+
+def end_shared_session():
+  """Ends sharing the session begun by begin_shared_session."""
+  depth = _get_shared_session_depth()
+  if not depth:
+    return
+
+  _shared_session_state.depth = depth - 1
+  if depth == 1:
+    _session.remove()
+    for replica_session in _replica_sessions:
+      replica_session.remove()
+    _shared_session_state.replica_session = None
+    _shared_session_state.connection.close()
+    _shared_session_state.connection = None
+
+
+@contextlib.contextmanager
+def shared_session():
+  """A context manager that shares one session, such as for a batch job."""
+  begin_shared_session()
+  try:
+    yield
+  finally:
+    end_shared_session()
+
+
+def use_shared_session_per_request(app):
+  """Configures the given Flask app so that each request shares one session."""
+  app.before_request(begin_shared_session)
+
+  @app.teardown_request
+  def _end_shared_session(exception):
+    end_shared_session()
+
+
+def _end_session(session):
+  """Closes the given session, or only ends its transaction if a shared session
+  was begun.
+
+  Ending the transaction releases the database locks that a read acquired, such
+  as the SHARED lock of SQLite, while the connection stays checked out.
+  """
+  if _get_shared_session_depth():
+    session.rollback()
+  else:
+    session.close()
+
+
 def use_session(f):
-  """A decorator that closes the session before returning a result."""
+  """A decorator that closes the session before returning a result.
+
+  If a shared session was begun, then its transaction is ended, but its
+  connection is left open for the next function.
+  """
 
   @functools.wraps(f)
   def decorated_function(*pargs, **kwargs):
     result = f(_session, *pargs, **kwargs)
-    _session.close()
+    _end_session(_session)
     return result
   return decorated_function
 
 
+def set_sticky_store(sticky_store):
+  """Stores the time until which reads for each sticky key go to the primary in
+  the given cache, such as a SqliteCache, instead of in this process.
+
+  Otherwise each process knows only of its own writes, so a client whose next
+  request is handled by another process may read a stale replica. If
+  sticky_store is None, then each process uses its own writes again.
+  """
+  global _sticky_store
+  _sticky_store = sticky_store
+
+
+def record_write(*sticky_keys):
+  """Records a write affecting the given keys, so that reads for them go to the
+  primary until the replicas have likely caught up, and so that cached results
+  depending on them are invalidated.
+  """
+  global _write_sequence
+  if len(_write_versions) >= _MAX_WRITE_VERSIONS:
+    _clear_write_versions()
+  with _write_versions_lock:
+    _write_sequence += 1
+    for sticky_key in sticky_keys:
+      _write_versions[sticky_key] = _write_versions.get(sticky_key, 0) + 1
+
+  if not (_replica_sessions and _sticky_seconds):
+    return
+
+  now = time.time()
+  if _sticky_store is not None:
+    for sticky_key in sticky_keys:
+      _sticky_store.put(sticky_key, now + _sticky_seconds)
+    return
+
+  with _sticky_keys_lock:
+    for sticky_key in sticky_keys:
+      _sticky_keys[sticky_key] = now + _sticky_seconds
+    # Remove the expired keys once there are many, so that this stays bounded.
+    if len(_sticky_keys) > 1000:
+      for expired_key in [key for key, sticky_until in _sticky_keys.iteritems() if sticky_until <= now]:
+        del _sticky_keys[expired_key]
+
+
+def is_sticky(*sticky_keys):
+  """Returns whether reads for any of the given keys go to the primary, because
+  record_write was recently called with it.
+  """
+  return any(_is_sticky(sticky_key) for sticky_key in sticky_keys)
+
+
+def _is_sticky(sticky_key):
+  if _sticky_store is not None:
+    sticky_until = _sticky_store.get(sticky_key)
+  else:
+    sticky_until = _sticky_keys.get(sticky_key)
+  return (sticky_until is not None) and (time.time() < sticky_until)
+
+
+def _get_replica_session():
+  """Returns the session for the replica to read from.
+
+  If a shared session was begun, then it uses the same replica until the end.
+  """
+  if not _get_shared_session_depth():
+    return _replica_sessions[next(_replica_counter) % len(_replica_sessions)]
+
+  replica_session = getattr(_shared_session_state, "replica_session", None)
+  if replica_session is None:
+    replica_session = _replica_sessions[next(_replica_counter) % len(_replica_sessions)]
+    _shared_session_state.replica_session = replica_session
+  return replica_session
+
+
+def use_replica_session(get_sticky_keys, get_result_sticky_keys=None):
+  """Returns a decorator like use_session, but that reads from a replica if any
+  are configured.
+
+  The given function returns the sticky keys from the arguments of the decorated
+  function. If record_write was recently called with any of those keys, then the
+  decorated function reads from the primary instead.
+
+  If get_result_sticky_keys is not None, then it returns more sticky keys from
+  the result and the arguments of the decorated function. If record_write was
+  recently called with any of those keys, then a result read from a replica is
+  read again from the primary.
+  """
+
+  def decorator(f):
+    def call(session, pargs, kwargs):
+      result = f(session, *pargs, **kwargs)
+      _end_session(session)
+      return result
+
+    @functools.wraps(f)
+    def decorated_function(*pargs, **kwargs):
+      if not _replica_sessions or is_sticky(*get_sticky_keys(*pargs, **kwargs)):
+        return call(_session, pargs, kwargs)
+
+      result = call(_get_replica_session(), pargs, kwargs)
+      if ((get_result_sticky_keys is not None) and
+          is_sticky(*get_result_sticky_keys(result, *pargs, **kwargs))):
+        result = call(_session, pargs, kwargs)
+      return result
+    return decorated_function
+  return decorator
+
+
+def set_result_cache(result_cache, ttl_seconds=None):
+  """Sets the cache of the results of functions decorated by cache_results, or
+  disables caching results if None.
+
+  The cache has the get and put methods of an LruCache. Because the versions of
+  keys are recorded by this process only, it must not be shared with other
+  processes. If other processes write to the database, then ttl_seconds bounds
+  how long their writes go unseen.
+  """
+  global _result_cache
+  global _result_ttl_seconds
+  _result_cache = result_cache
+  _result_ttl_seconds = ttl_seconds
+  with _write_versions_lock:
+    _result_cache_counts.clear()
+
+
+def _get_versions(version_keys):
+  """Returns the current versions of the given keys.
+
+  This must be called with _write_versions_lock held.
+  """
+  return (_write_versions_epoch,
+      tuple(_write_versions.get(version_key, 0) for version_key in version_keys))
+
+
+def cache_results(get_version_keys):
+  """Returns a decorator that caches the results of the decorated function by
+  its arguments, other than now.
+
+  The given function returns the keys of the writes that change a result, from
+  the result and the arguments of the decorated function. Once record_write is
+  called with any of those keys, the result is invalidated. A result read from a
+  replica shortly after such a write may be stale, and so it is not cached.
+
+  Cached results are shared by all callers, who must not modify them. The
+  uncached attribute of the decorated function reads without using the cache.
+  """
+
+  def decorator(f):
+    name = f.__name__
+
+    @functools.wraps(f)
+    def decorated_function(*pargs, **kwargs):
+      result_cache = _result_cache
+      if result_cache is None:
+        return f(*pargs, **kwargs)
+
+      cache_key = (name, pargs,
+          tuple(sorted((key, value) for key, value in kwargs.iteritems() if key != "now")))
+      entry = result_cache.get(cache_key)
+      if entry is not None:
+        result, version_keys, versions, read_time = entry
+        ttl_seconds = _result_ttl_seconds
+        with _write_versions_lock:
+          is_current = ((_get_versions(version_keys) == versions) and
+              ((ttl_seconds is None) or (time.time() - read_time < ttl_seconds)))
+          if is_current:
+            _result_cache_counts[name][0] += 1
+        if is_current:
+          return result
+
+      read_time = time.time()
+      with _write_versions_lock:
+        _result_cache_counts[name][1] += 1
+        write_sequence = _write_sequence
+      result = f(*pargs, **kwargs)
+      version_keys = tuple(get_version_keys(result, *pargs, **kwargs))
+      if _replica_sessions and is_sticky(*version_keys):
+        return result
+      with _write_versions_lock:
+        if write_sequence != _write_sequence:
+          # A write may have happened after reading the result.
+          return result
+        versions = _get_versions(version_keys)
+      result_cache.put(cache_key, (result, version_keys, versions, read_time))
+      return result
+    decorated_function.uncached = f
+    return decorated_function
+  return decorator
+
+
+def get_cached_result(entry):
+  """Returns the result in the given entry of the result cache, such as for
+  computing the size of the entry.
+  """
+  return entry[0]
+
+
+def get_result_cache_stats():
+  """Returns a dictionary of statistics for the results cached by cache_results,
+  or None if results are not cached.
+  """
+  result_cache = _result_cache
+  if result_cache is None:
+    return None
+
+  with _write_versions_lock:
+    counts = {name: tuple(name_counts) for name, name_counts in _result_cache_counts.iteritems()}
+  hits = sum(name_hits for name_hits, name_misses in counts.itervalues())
+  misses = sum(name_misses for name_hits, name_misses in counts.itervalues())
+  return {
+    "hits": hits,
+    "misses": misses,
+    "hit_rate": (float(hits) / (hits + misses)) if (hits + misses) else None,
+    "functions": {name: {"hits": name_hits, "misses": name_misses}
+        for name, (name_hits, name_misses) in counts.iteritems()},
+    "entries": len(result_cache),
+  }
+
+
 class DbException(Exception):
   """Exception class raised by the database."""
 
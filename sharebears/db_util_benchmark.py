@@ -0,0 +1,79 @@
+"""Compares connection checkouts and latency per request with and without a
+shared session.
+
+Run with: python sharebears/db_util_benchmark.py
+"""
+
+from datetime import datetime, timedelta
+import os
+import shutil
+import sqlalchemy as sa
+import tempfile
+import timeit
+
+import db
+import db_schema
+import db_util
+
+
+_NUM_POSTS = 200
+_NUM_REQUESTS = 200
+
+
+def _add_posts():
+  now = datetime(2014, 10, 27)
+  post_ids = []
+  for i in xrange(_NUM_POSTS):
+    post_id = db.add_post("user_id%s" % (i % 10), "data%s" % i, ["hash_tag"],
+        now=now + timedelta(seconds=i))
+    post_ids.append(post_id)
+  return post_ids
+
+
+def _simulate_request(post_id):
+  """Calls the database functions that a request for a post page would."""
+  client_id = "client_id"
+  post = db.get_post(client_id, post_id)
+  db.get_stars(post_id)
+  db.get_posts_by_user(client_id, post.creator)
+  db.get_posts_with_hashtag(client_id, "hash_tag")
+
+
+def _run_requests(post_ids, use_shared_session):
+  for i in xrange(_NUM_REQUESTS):
+    post_id = post_ids[i % len(post_ids)]
+    if use_shared_session:
+      with db_util.shared_session():
+        _simulate_request(post_id)
+    else:
+      _simulate_request(post_id)
+
+
+def _main():
+  # Use a file so that each checkout opens a connection, like in production.
+  temp_dir = tempfile.mkdtemp()
+  try:
+    database_uri = "sqlite:///%s" % os.path.join(temp_dir, "benchmark.db")
+    engine = db_util.init_db("sqlite", database_uri)
+    db_schema.create_all_tables(engine)
+    post_ids = _add_posts()
+
+    checkouts = [0]
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+      checkouts[0] += 1
+    sa.event.listen(engine.pool, "checkout", _on_checkout)
+
+    for use_shared_session in (False, True):
+      checkouts[0] = 0
+      seconds = timeit.timeit(
+          lambda: _run_requests(post_ids, use_shared_session), number=1)
+      print "shared_session=%-5s checkouts/request=%.2f ms/request=%.3f" % (
+          use_shared_session,
+          float(checkouts[0]) / _NUM_REQUESTS,
+          1000 * seconds / _NUM_REQUESTS)
+  finally:
+    shutil.rmtree(temp_dir)
+
+if __name__ == "__main__":
+  _main()
+
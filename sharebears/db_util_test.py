@@ -0,0 +1,466 @@
+from datetime import datetime
+import os
+import shutil
+import sqlalchemy as sa
+import tempfile
+import threading
+import unittest
+
+import db
+import db_schema
+import db_util
+from lru_cache import LruCache
+from sqlite_cache import SqliteCache
+
+
+class SharedSessionTest(unittest.TestCase):
+  # Use an in-memory SQLite database.
+  _DATABASE = "sqlite"
+  _DATABASE_URI = "sqlite://"
+  # Created by setUpClass.
+  _engine = None
+
+
+  @classmethod
+  def setUpClass(cls):
+    SharedSessionTest._engine = db_util.init_db(
+        SharedSessionTest._DATABASE, SharedSessionTest._DATABASE_URI)
+
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    db_schema.create_all_tables(SharedSessionTest._engine)
+
+    self.num_checkouts = 0
+    sa.event.listen(SharedSessionTest._engine.pool, "checkout", self._on_checkout)
+
+  def tearDown(self):
+    sa.event.remove(SharedSessionTest._engine.pool, "checkout", self._on_checkout)
+    db_schema.drop_all_tables(SharedSessionTest._engine)
+    unittest.TestCase.tearDown(self)
+
+
+  def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+    self.num_checkouts += 1
+
+  def _add_and_read_post(self):
+    """Calls several database functions, like a view would."""
+    user_id = "user_id"
+    post_id = db.add_post(user_id, "data", ["hash_tag"], datetime(2013, 9, 26))
+    db.star_post(user_id, post_id)
+    post = db.get_post(user_id, post_id)
+    self.assertTrue(post.is_starred)
+    self.assertEqual(1, post.num_stars)
+    self.assertEqual(1, len(db.get_posts(user_id)))
+    self.assertSequenceEqual([user_id], db.get_stars(post_id).items)
+
+
+  def test_without_shared_session(self):
+    self._add_and_read_post()
+    # Each function checks out its own connection.
+    self.assertEqual(5, self.num_checkouts)
+
+  def test_shared_session(self):
+    with db_util.shared_session():
+      self._add_and_read_post()
+    self.assertEqual(1, self.num_checkouts)
+
+  def test_nested_shared_session(self):
+    with db_util.shared_session():
+      with db_util.shared_session():
+        self._add_and_read_post()
+      # Assert that the inner shared session did not release the connection.
+      self.assertEqual(1, len(db.get_posts("user_id")))
+    self.assertEqual(1, self.num_checkouts)
+
+  def test_end_without_begin(self):
+    db_util.end_shared_session()
+    self._add_and_read_post()
+    self.assertEqual(5, self.num_checkouts)
+
+
+class SharedSessionLockTest(unittest.TestCase):
+  """Tests that a shared session does not block writers, using a SQLite file with
+  a rollback journal.
+  """
+
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.engine = db_util.init_db("sqlite", "sqlite:///%s" % os.path.join(self.temp_dir, "test.db"))
+    db_schema.create_all_tables(self.engine)
+
+  def tearDown(self):
+    self.engine.dispose()
+    shutil.rmtree(self.temp_dir)
+    unittest.TestCase.tearDown(self)
+
+
+  def test_concurrent_writer(self):
+    post_ids = []
+    def add_post():
+      post_ids.append(db.add_post("user_id", "data", []))
+
+    with db_util.shared_session():
+      db.get_posts("user_id")
+      # Assert that the read did not leave a lock that blocks writes in another thread.
+      writer = threading.Thread(target=add_post)
+      writer.start()
+      writer.join()
+      self.assertEqual(1, len(post_ids))
+      self.assertEqual(post_ids[0], db.get_posts("user_id")[0].id)
+
+
+class SqliteProfileTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.database_uri = "sqlite:///%s" % os.path.join(self.temp_dir, "test.db")
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+    unittest.TestCase.tearDown(self)
+
+
+  def _get_pragma(self, connection, name):
+    return connection.execute("PRAGMA %s" % name).scalar()
+
+  def test_no_profile(self):
+    engine = db_util.create_engine("sqlite", self.database_uri)
+    connection = engine.connect()
+    self.assertEqual(1, self._get_pragma(connection, "foreign_keys"))
+    self.assertEqual("delete", self._get_pragma(connection, "journal_mode"))
+    connection.close()
+    engine.dispose()
+
+  def test_profile(self):
+    profile = db_util.SqliteProfile(busy_timeout=1234, cache_size=-1024, pool_size=3)
+    engine = db_util.create_engine("sqlite", self.database_uri, profile)
+    self.assertIsInstance(engine.pool, sa.pool.QueuePool)
+    self.assertEqual(3, engine.pool.size())
+
+    connection = engine.connect()
+    self.assertEqual(1, self._get_pragma(connection, "foreign_keys"))
+    self.assertEqual("wal", self._get_pragma(connection, "journal_mode"))
+    # NORMAL has the value 1.
+    self.assertEqual(1, self._get_pragma(connection, "synchronous"))
+    self.assertEqual(1234, self._get_pragma(connection, "busy_timeout"))
+    self.assertEqual(-1024, self._get_pragma(connection, "cache_size"))
+    connection.close()
+    engine.dispose()
+
+  def test_profile_memory_database(self):
+    maintained_connections = []
+    run_sqlite_maintenance = db_util.run_sqlite_maintenance
+    db_util.run_sqlite_maintenance = maintained_connections.append
+    try:
+      engine = db_util.create_engine("sqlite", "sqlite://",
+          db_util.SqliteProfile(maintenance_interval=0))
+      # Assert that the pool still returns the same in-memory database.
+      self.assertNotIsInstance(engine.pool, sa.pool.QueuePool)
+      connection = engine.connect()
+      self.assertEqual(1, self._get_pragma(connection, "foreign_keys"))
+      connection.close()
+      # Assert that no maintenance runs on the connection shared by all threads.
+      self.assertSequenceEqual([], maintained_connections)
+    finally:
+      db_util.run_sqlite_maintenance = run_sqlite_maintenance
+
+  def test_maintenance(self):
+    maintained_connections = []
+    run_sqlite_maintenance = db_util.run_sqlite_maintenance
+    def _run_sqlite_maintenance(dbapi_connection):
+      maintained_connections.append(dbapi_connection)
+      run_sqlite_maintenance(dbapi_connection)
+
+    db_util.run_sqlite_maintenance = _run_sqlite_maintenance
+    try:
+      profile = db_util.SqliteProfile(maintenance_interval=0)
+      engine = db_util.create_engine("sqlite", self.database_uri, profile)
+      db_schema.create_all_tables(engine)
+      engine.execute(db_schema.Posts.insert().values(
+          creator="user_id", created_datetime=datetime(2013, 9, 26), data="data"))
+      # Assert that returning each connection to the pool ran the maintenance.
+      self.assertTrue(maintained_connections)
+      num_maintained_connections = len(maintained_connections)
+
+      profile = db_util.SqliteProfile(maintenance_interval=60 * 60)
+      engine = db_util.create_engine("sqlite", self.database_uri, profile)
+      engine.execute(db_schema.Posts.select())
+      # Assert that the maintenance is not run again before the interval elapses.
+      self.assertEqual(num_maintained_connections, len(maintained_connections))
+    finally:
+      db_util.run_sqlite_maintenance = run_sqlite_maintenance
+
+
+class ReplicaTest(unittest.TestCase):
+  """Tests reading from replicas, using a separate SQLite file for each."""
+
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.engines = []
+
+  def tearDown(self):
+    for engine in self.engines:
+      engine.dispose()
+    shutil.rmtree(self.temp_dir)
+    unittest.TestCase.tearDown(self)
+
+
+  def _get_database_uri(self, name):
+    return "sqlite:///%s" % os.path.join(self.temp_dir, "%s.db" % name)
+
+  def _init_db(self, num_replicas, sticky_seconds):
+    replica_uris = [self._get_database_uri("replica%s" % i) for i in xrange(num_replicas)]
+    primary_engine = db_util.init_db(
+        "sqlite", self._get_database_uri("primary"), None, replica_uris, sticky_seconds)
+    self.engines.append(primary_engine)
+    db_schema.create_all_tables(primary_engine)
+    for replica_uri in replica_uris:
+      replica_engine = db_util.create_engine("sqlite", replica_uri)
+      self.engines.append(replica_engine)
+      db_schema.create_all_tables(replica_engine)
+      # Each replica contains a post that the primary does not.
+      replica_engine.execute(db_schema.Posts.insert().values(id=1000,
+          creator="replica_user_id", created_datetime=datetime(2013, 9, 26), data=replica_uri))
+
+  def test_no_replicas(self):
+    self._init_db(0, 10)
+    post_id = db.add_post("user_id", "data", [])
+    self.assertEqual(post_id, db.get_posts("other_user_id")[0].id)
+
+  def test_reads_use_replicas(self):
+    self._init_db(2, 0)
+    post_id = db.add_post("user_id", "data", [])
+
+    # Assert that the reads are from each replica in turn.
+    replica_data = set(db.get_posts("user_id")[0].data for i in xrange(4))
+    self.assertSetEqual(
+        set([self._get_database_uri("replica0"), self._get_database_uri("replica1")]),
+        replica_data)
+    self.assertIsNone(db.get_post("user_id", post_id))
+
+  def test_reads_after_writes_use_primary(self):
+    self._init_db(2, 10)
+    post_id = db.add_post("user_id", "data", [])
+
+    # Assert that the writer reads from the primary, but other clients do not.
+    self.assertEqual(post_id, db.get_posts("user_id")[0].id)
+    self.assertEqual(post_id, db.get_post("user_id", post_id).id)
+    self.assertIsNone(db.get_post("other_user_id", post_id))
+
+    # Assert that reading the stars of a starred post reads from the primary.
+    db.star_post("other_user_id", post_id)
+    self.assertSequenceEqual(["other_user_id"], db.get_stars(post_id).items)
+    self.assertTrue(db.get_post("other_user_id", post_id).is_starred)
+
+  def test_pages_after_writes_use_primary(self):
+    self._init_db(2, 10)
+    post_id = db.add_post("user_id", "data", ["hash_tag"])
+
+    # Assert that all clients read the pages that the new post was added to from the primary.
+    self.assertSequenceEqual([post_id], [post.id for post in db.get_posts("other_user_id")])
+    self.assertSequenceEqual([post_id],
+        [post.id for post in db.get_posts_with_hashtag("other_user_id", "hash_tag")])
+    self.assertSequenceEqual([post_id],
+        [post.id for post in db.get_posts_by_user("other_user_id", "user_id")])
+    self.assertTrue(db.is_page_of_posts_sticky([]))
+
+  def test_pages_with_starred_posts_use_primary(self):
+    self._init_db(2, 10)
+    # Add the same post to the primary and replicas, without recording a write.
+    for engine in self.engines:
+      engine.execute(db_schema.Posts.insert().values(id=1,
+          creator="user_id", created_datetime=datetime(2014, 10, 27), data="data"))
+    self.assertFalse(db.is_page_of_posts_sticky([1]))
+
+    db.star_post("user_id", 1)
+    # Assert that the page read from a replica contains the post, and so is read again from the primary.
+    posts = db.get_posts("other_user_id")
+    self.assertSequenceEqual([1], [post.id for post in posts])
+    self.assertEqual(1, posts[0].num_stars)
+    self.assertTrue(db.is_page_of_posts_sticky([1]))
+
+  def test_sticky_store(self):
+    self._init_db(2, 10)
+    cache_path = os.path.join(self.temp_dir, "cache.db")
+    db_util.set_sticky_store(SqliteCache(cache_path, 1024 * 1024, namespace="sticky_keys"))
+    try:
+      post_id = db.add_post("user_id", "data", [])
+      # Assert that another process sharing the file reads from the primary.
+      db_util.set_sticky_store(SqliteCache(cache_path, 1024 * 1024, namespace="sticky_keys"))
+      self.assertEqual(post_id, db.get_post("user_id", post_id).id)
+      self.assertIsNone(db.get_post("other_user_id", post_id))
+    finally:
+      db_util.set_sticky_store(None)
+
+  def test_shared_session_uses_one_replica(self):
+    self._init_db(2, 0)
+    with db_util.shared_session():
+      replica_data = set(db.get_posts("user_id")[0].data for i in xrange(4))
+    self.assertEqual(1, len(replica_data))
+
+
+class ResultCacheTest(unittest.TestCase):
+  # Use an in-memory SQLite database.
+  _DATABASE = "sqlite"
+  _DATABASE_URI = "sqlite://"
+  # Created by setUpClass.
+  _engine = None
+
+
+  @classmethod
+  def setUpClass(cls):
+    ResultCacheTest._engine = db_util.init_db(
+        ResultCacheTest._DATABASE, ResultCacheTest._DATABASE_URI)
+
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    db_schema.create_all_tables(ResultCacheTest._engine)
+    db_util.create_session(ResultCacheTest._engine)
+    self.result_cache = LruCache(100, lambda entry: 1)
+    db_util.set_result_cache(self.result_cache)
+
+  def tearDown(self):
+    db_util.set_result_cache(None)
+    db_schema.drop_all_tables(ResultCacheTest._engine)
+    unittest.TestCase.tearDown(self)
+
+
+  def _get_counts(self, name):
+    function_stats = db_util.get_result_cache_stats()["functions"][name]
+    return (function_stats["hits"], function_stats["misses"])
+
+  def test_no_result_cache(self):
+    db_util.set_result_cache(None)
+    self.assertIsNone(db_util.get_result_cache_stats())
+    post_id = db.add_post("user_id", "data", [])
+    self.assertEqual(0, len(db.get_stars(post_id)))
+    self.assertEqual(0, len(db.get_stars(post_id)))
+
+  def test_cache_stars(self):
+    post_id = db.add_post("user_id", "data", [])
+    other_post_id = db.add_post("user_id", "data", [])
+    self.assertSequenceEqual([], db.get_stars(post_id).items)
+    self.assertSequenceEqual([], db.get_stars(post_id, now=datetime(2013, 9, 26)).items)
+    self.assertEqual((1, 1), self._get_counts("get_stars"))
+
+    # Starring another post does not invalidate the result.
+    db.star_post("user_id", other_post_id)
+    self.assertSequenceEqual([], db.get_stars(post_id).items)
+    self.assertEqual((2, 1), self._get_counts("get_stars"))
+
+    # Starring and unstarring the post invalidates the result.
+    db.star_post("user_id", post_id)
+    self.assertSequenceEqual(["user_id"], db.get_stars(post_id).items)
+    db.unstar_post("user_id", post_id)
+    self.assertSequenceEqual([], db.get_stars(post_id).items)
+    self.assertEqual((2, 3), self._get_counts("get_stars"))
+
+  def test_cache_posts_with_hashtag(self):
+    post_id = db.add_post("user_id", "data", ["hash_tag"])
+    self.assertEqual([post_id], [post.id for post in db.get_posts_with_hashtag("client_id", "hash_tag")])
+
+    # Adding a post with another hash tag does not invalidate the result.
+    db.add_post("user_id", "data", ["other_hash_tag"])
+    self.assertEqual([post_id], [post.id for post in db.get_posts_with_hashtag("client_id", "hash_tag")])
+    self.assertEqual((1, 1), self._get_counts("get_posts_with_hashtag"))
+
+    # Adding a post with the hash tag invalidates the result.
+    new_post_ids = db.add_posts([db.NewPost("user_id", "data", ["hash_tag"])]).post_ids
+    self.assertEqual(new_post_ids + [post_id],
+        [post.id for post in db.get_posts_with_hashtag("client_id", "hash_tag")])
+    self.assertEqual((1, 2), self._get_counts("get_posts_with_hashtag"))
+
+  def test_cache_posts_by_user(self):
+    post_id = db.add_post("user_id", "data", [])
+    self.assertEqual(0, db.get_posts_by_user("client_id", "user_id")[0].num_stars)
+
+    # Adding a post by another user does not invalidate the result.
+    other_post_id = db.add_post("other_user_id", "data", [])
+    self.assertEqual(0, db.get_posts_by_user("client_id", "user_id")[0].num_stars)
+    self.assertEqual((1, 1), self._get_counts("get_posts_by_user"))
+
+    # Starring a post on the page invalidates the result for all clients.
+    db.star_post("other_user_id", post_id)
+    post = db.get_posts_by_user("client_id", "user_id")[0]
+    self.assertEqual(1, post.num_stars)
+    self.assertFalse(post.is_starred)
+    self.assertEqual((1, 2), self._get_counts("get_posts_by_user"))
+
+    # Starring another post by the client invalidates the result for the client.
+    db.star_post("client_id", other_post_id)
+    self.assertEqual(1, db.get_posts_by_user("client_id", "user_id")[0].num_stars)
+    self.assertEqual((1, 3), self._get_counts("get_posts_by_user"))
+
+  def test_cache_missing_post(self):
+    self.assertIsNone(db.get_post("user_id", 1))
+    post_id = db.add_post("user_id", "data", [])
+    self.assertEqual(1, post_id)
+    self.assertEqual(post_id, db.get_post("user_id", post_id).id)
+
+  def test_ttl(self):
+    db_util.set_result_cache(self.result_cache, ttl_seconds=0)
+    post_id = db.add_post("user_id", "data", [])
+    db.get_stars(post_id)
+    db.get_stars(post_id)
+    self.assertEqual((0, 2), self._get_counts("get_stars"))
+
+  def test_write_during_read(self):
+    values = ["value"]
+    @db_util.cache_results(lambda result, key: [key])
+    def read(key):
+      # Record a write of another key during the read.
+      db_util.record_write("other_key")
+      return values[0]
+
+    self.assertEqual("value", read("key"))
+    self.assertEqual(0, len(self.result_cache))
+
+  def test_entry_size(self):
+    result_cache = LruCache(1000, db.get_result_cache_entry_size)
+    db_util.set_result_cache(result_cache)
+    post_id = db.add_post("user_id", "x" * 30, [])
+    db.add_post("user_id", "y" * 40, [])
+    db.get_post("user_id", post_id)
+    db.get_posts("user_id")
+    db.get_stars(post_id)
+    db.get_post("user_id", "missing_post_id")
+    # Assert that each entry is sized by the data of its posts, and others by 1.
+    self.assertEqual(30 + 70 + 1 + 1, result_cache.get_stats()["size"])
+
+    # Assert that a page of a large post evicts the least recently used posts.
+    db.add_post("user_id", "z" * 990, [])
+    db.get_posts_by_user("user_id", "user_id", page_size=1)
+    self.assertEqual(3, len(result_cache))
+    self.assertEqual(1 + 1 + 990, result_cache.get_stats()["size"])
+
+  def test_iter_posts_not_cached(self):
+    for i in xrange(3):
+      db.add_post("user_id", "data%s" % i, ["hash_tag"])
+    self.assertEqual(3, len(list(db.iter_posts("user_id", batch_size=2))))
+    self.assertEqual(3, len(list(db.iter_posts_with_hashtag("user_id", "hash_tag", batch_size=2))))
+    self.assertEqual(3, len(list(db.iter_posts_by_user("user_id", "user_id", batch_size=2))))
+    self.assertEqual(0, len(self.result_cache))
+
+  def test_stats(self):
+    post_id = db.add_post("user_id", "data", [])
+    for i in xrange(4):
+      db.get_stars(post_id)
+    db.get_post("user_id", post_id)
+    stats = db_util.get_result_cache_stats()
+    self.assertEqual(3, stats["hits"])
+    self.assertEqual(2, stats["misses"])
+    self.assertEqual(0.6, stats["hit_rate"])
+    self.assertEqual(2, stats["entries"])
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(SharedSessionTest))
+  suite.addTest(unittest.makeSuite(SharedSessionLockTest))
+  suite.addTest(unittest.makeSuite(SqliteProfileTest))
+  suite.addTest(unittest.makeSuite(ReplicaTest))
+  suite.addTest(unittest.makeSuite(ResultCacheTest))
+  return suite
+
@@ -1,36 +1,88 @@
 import requests
 from requests.auth import HTTPBasicAuth
+import time
 
 
 class GitHubClientException(Exception):
   """An exception raised by a GitHubClient."""
 
-  def __init__(self, reason):
+  def __init__(self, reason, status_code=None):
     Exception.__init__(self)
     self.reason = reason
+    self.status_code = status_code
 
   def __str__(self):
     return str(self.reason)
 
 
+class _CachedResponse:
+  """The JSON and ETag of a response from the GitHub API, when it was fetched,
+  and the number of bytes of its body.
+  """
+
+  def __init__(self, json, etag, fetched_time, size):
+    self.json = json
+    self.etag = etag
+    self.fetched_time = fetched_time
+    self.size = size
+
+
+def get_response_size(cached_response):
+  """Returns the size of the given cached response for an LruCache."""
+  return cached_response.size
+
+
 class GitHubClient:
-  """A client for communicating with the GitHub API."""
+  """A client for communicating with the GitHub API.
+
+  If given a response cache, which is an LruCache with get_response_size as its
+  get_size or a SqliteCache, then it caches the response for each path. A cached response is returned without a request
+  until it is older than the TTL of its endpoint. After that, its ETag is sent
+  so that GitHub can reply with 304 Not Modified, which does not count against
+  the rate limit.
+  """
 
   _ROOT_ENDPOINT = "https://api.github.com"
 
+  REPOSITORY_ENDPOINT = "repository"
+  COMMIT_ENDPOINT = "commit"
+
+  # The default number of seconds before revalidating a response of each endpoint.
+  DEFAULT_TTL_SECONDS = {
+    REPOSITORY_ENDPOINT: 60 * 60,
+    # A commit never changes.
+    COMMIT_ENDPOINT: 7 * 24 * 60 * 60,
+  }
+
+  # The number of seconds to wait to connect to GitHub, or for a response.
+  DEFAULT_TIMEOUT_SECONDS = 5
+
   @staticmethod
-  def for_oauth_token(oauth_token):
+  def for_oauth_token(oauth_token, **kwargs):
     """Returns a GitHubClient instance that authenticates using the given OAuth token.
     
     See https://developer.github.com/v3/auth/#via-oauth-tokens for details.
     """
     def _oauth_strategy():
       return HTTPBasicAuth(oauth_token, "x-oauth-basic")
-    return GitHubClient(_oauth_strategy)
+    return GitHubClient(_oauth_strategy, **kwargs)
 
 
-  def __init__(self, auth_strategy=None):
+  def __init__(self, auth_strategy=None,
+      response_cache=None, ttl_seconds=None, root_endpoint=_ROOT_ENDPOINT,
+      timeout_seconds=DEFAULT_TIMEOUT_SECONDS, get_time=time.time):
     self.auth_strategy = auth_strategy
+    self._timeout_seconds = timeout_seconds
+    self._response_cache = response_cache
+    self._ttl_seconds = dict(GitHubClient.DEFAULT_TTL_SECONDS)
+    if ttl_seconds:
+      self._ttl_seconds.update(ttl_seconds)
+    self._root_endpoint = root_endpoint
+    self._get_time = get_time
+
+    self.fresh_hits = 0
+    self.revalidated_hits = 0
+    self.misses = 0
 
   def _get_auth(self):
     # Unauthenticated requests are subject to more stringent rate limiting.
@@ -39,25 +91,64 @@ class GitHubClient:
       return self.auth_strategy()
     return None
 
-  def _json_from_response_for_path(self, path):
-    url = "%s/%s" % (GitHubClient._ROOT_ENDPOINT, path)
-    response = requests.get(url, auth=self._get_auth())
-    if response.status_code == 200:
-      return response.json()
+  def _json_from_response_for_path(self, path, endpoint):
+    url = "%s/%s" % (self._root_endpoint, path)
+    if self._response_cache is None:
+      response = requests.get(url, auth=self._get_auth(), timeout=self._timeout_seconds)
+      if response.status_code == 200:
+        return response.json()
+      else:
+        raise GitHubClientException(
+            "Status code was not 200 but was %s" % response.status_code, response.status_code)
+
+    now = self._get_time()
+    cached_response = self._response_cache.get(path)
+    if cached_response is not None:
+      if now - cached_response.fetched_time < self._ttl_seconds[endpoint]:
+        self.fresh_hits += 1
+        return cached_response.json
+
+    headers = {}
+    if (cached_response is not None) and cached_response.etag:
+      headers["If-None-Match"] = cached_response.etag
+    response = requests.get(url,
+        auth=self._get_auth(), headers=headers, timeout=self._timeout_seconds)
+    if (response.status_code == 304) and (cached_response is not None):
+      # Reuse the cached JSON until it is older than the TTL again.
+      self.revalidated_hits += 1
+      json = cached_response.json
+      size = cached_response.size
+    elif response.status_code == 200:
+      self.misses += 1
+      json = response.json()
+      size = len(response.content)
     else:
-      raise GitHubClientException("Status code was not 200 but was %s" % response.status_code)
+      raise GitHubClientException(
+          "Status code was not 200 but was %s" % response.status_code, response.status_code)
+
+    etag = response.headers.get("ETag") or (cached_response.etag if cached_response is not None else None)
+    self._response_cache.put(path, _CachedResponse(json, etag, now, size))
+    return json
+
+  def get_stats(self):
+    """Returns a dictionary of statistics for the response cache."""
+    return {
+      "fresh_hits": self.fresh_hits,
+      "revalidated_hits": self.revalidated_hits,
+      "misses": self.misses,
+    }
   
   def get_repository(self, owner, repo):
     """Returns the JSON for the given repository by the given owner."""
 
     # See https://developer.github.com/v3/repos/#get
     path = "repos/%s/%s" % (owner, repo)
-    return self._json_from_response_for_path(path)
+    return self._json_from_response_for_path(path, GitHubClient.REPOSITORY_ENDPOINT)
 
   def get_commit(self, owner, repo, sha):
     """Returns the JSON for the commit with the given SHA."""
 
     # See https://developer.github.com/v3/git/commits/#get-a-commit
     path = "repos/%s/%s/git/commits/%s" % (owner, repo, sha)
-    return self._json_from_response_for_path(path)
+    return self._json_from_response_for_path(path, GitHubClient.COMMIT_ENDPOINT)
 
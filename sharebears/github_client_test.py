@@ -0,0 +1,164 @@
+import BaseHTTPServer
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import github_client
+from github_client import GitHubClient, GitHubClientException
+from lru_cache import LruCache
+from sqlite_cache import SqliteCache
+
+
+class _StubGitHubServer(BaseHTTPServer.HTTPServer):
+  """A local HTTP server that stands in for the GitHub API."""
+
+  def __init__(self):
+    BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), _StubGitHubHandler)
+    # Maps each path to the status code, JSON and ETag of its response.
+    self.responses = {}
+    # The path and If-None-Match header of each request.
+    self.requests = []
+
+  def get_root_endpoint(self):
+    return "http://127.0.0.1:%s" % self.server_address[1]
+
+
+class _StubGitHubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  def do_GET(self):
+    if_none_match = self.headers.get("If-None-Match")
+    self.server.requests.append((self.path, if_none_match))
+
+    status_code, response_json, etag = self.server.responses.get(self.path, (404, None, None))
+    if (etag is not None) and (if_none_match == etag):
+      status_code = 304
+    self.send_response(status_code)
+    if etag is not None:
+      self.send_header("ETag", etag)
+    if status_code == 200:
+      body = json.dumps(response_json)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    else:
+      self.send_header("Content-Length", "0")
+      self.end_headers()
+
+  def log_message(self, format, *args):
+    pass
+
+
+class GitHubClientTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.server = _StubGitHubServer()
+    self.server_thread = threading.Thread(
+        target=self.server.serve_forever, kwargs={"poll_interval": 0.01})
+    self.server_thread.start()
+
+    self.temp_dir = tempfile.mkdtemp()
+    self.response_cache = SqliteCache(os.path.join(self.temp_dir, "cache.db"), 1024 * 1024)
+    self.now = 1000.0
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server_thread.join()
+    self.server.server_close()
+    shutil.rmtree(self.temp_dir)
+    unittest.TestCase.tearDown(self)
+
+
+  def _get_time(self):
+    return self.now
+
+  def _make_client(self, response_cache=None, ttl_seconds=None):
+    return GitHubClient(response_cache=response_cache, ttl_seconds=ttl_seconds,
+        root_endpoint=self.server.get_root_endpoint(), get_time=self._get_time)
+
+  def test_without_cache(self):
+    self.server.responses["/repos/mgp/sharebears"] = (200, {"name": "sharebears"}, '"etag1"')
+    client = self._make_client()
+    self.assertEqual({"name": "sharebears"}, client.get_repository("mgp", "sharebears"))
+    self.assertEqual({"name": "sharebears"}, client.get_repository("mgp", "sharebears"))
+    self.assertSequenceEqual(
+        [("/repos/mgp/sharebears", None), ("/repos/mgp/sharebears", None)], self.server.requests)
+
+  def test_missing_repository(self):
+    client = self._make_client(self.response_cache)
+    self.assertRaises(GitHubClientException, client.get_repository, "mgp", "missing")
+    # Assert that the error is not cached.
+    self.assertRaises(GitHubClientException, client.get_repository, "mgp", "missing")
+    self.assertEqual(2, len(self.server.requests))
+
+  def test_fresh_response(self):
+    self.server.responses["/repos/mgp/sharebears"] = (200, {"name": "sharebears"}, '"etag1"')
+    client = self._make_client(self.response_cache, {GitHubClient.REPOSITORY_ENDPOINT: 60})
+    self.assertEqual({"name": "sharebears"}, client.get_repository("mgp", "sharebears"))
+    self.now += 59
+    self.assertEqual({"name": "sharebears"}, client.get_repository("mgp", "sharebears"))
+    self.assertEqual(1, len(self.server.requests))
+    self.assertEqual({"fresh_hits": 1, "revalidated_hits": 0, "misses": 1}, client.get_stats())
+
+  def test_revalidated_response(self):
+    self.server.responses["/repos/mgp/sharebears"] = (200, {"name": "sharebears"}, '"etag1"')
+    client = self._make_client(self.response_cache, {GitHubClient.REPOSITORY_ENDPOINT: 60})
+    client.get_repository("mgp", "sharebears")
+
+    # Assert that the ETag is sent, and the cached JSON is reused upon 304 Not Modified.
+    self.now += 60
+    self.assertEqual({"name": "sharebears"}, client.get_repository("mgp", "sharebears"))
+    self.assertEqual(("/repos/mgp/sharebears", '"etag1"'), self.server.requests[-1])
+    # Assert that the revalidated response is fresh again.
+    self.now += 59
+    client.get_repository("mgp", "sharebears")
+    self.assertEqual(2, len(self.server.requests))
+
+    # Assert that a changed response replaces the cached response.
+    self.server.responses["/repos/mgp/sharebears"] = (200, {"name": "sharebears2"}, '"etag2"')
+    self.now += 1
+    self.assertEqual({"name": "sharebears2"}, client.get_repository("mgp", "sharebears"))
+    self.now += 60
+    client.get_repository("mgp", "sharebears")
+    self.assertEqual(("/repos/mgp/sharebears", '"etag2"'), self.server.requests[-1])
+    self.assertEqual({"fresh_hits": 1, "revalidated_hits": 2, "misses": 2}, client.get_stats())
+
+  def test_endpoint_ttls(self):
+    self.server.responses["/repos/mgp/sharebears"] = (200, {"name": "sharebears"}, '"etag1"')
+    self.server.responses["/repos/mgp/sharebears/git/commits/sha"] = (200, {"sha": "sha"}, '"etag2"')
+    client = self._make_client(self.response_cache, {GitHubClient.REPOSITORY_ENDPOINT: 60})
+    client.get_repository("mgp", "sharebears")
+    client.get_commit("mgp", "sharebears", "sha")
+    # Only the repository is revalidated.
+    self.now += 60
+    client.get_repository("mgp", "sharebears")
+    client.get_commit("mgp", "sharebears", "sha")
+    self.assertEqual(3, len(self.server.requests))
+
+  def test_shared_by_clients(self):
+    self.server.responses["/repos/mgp/sharebears"] = (200, {"name": "sharebears"}, '"etag1"')
+    self._make_client(self.response_cache).get_repository("mgp", "sharebears")
+    # Another client, possibly in another process, reuses the response.
+    response_cache = SqliteCache(os.path.join(self.temp_dir, "cache.db"), 1024 * 1024)
+    self.assertEqual({"name": "sharebears"},
+        self._make_client(response_cache).get_repository("mgp", "sharebears"))
+    self.assertEqual(1, len(self.server.requests))
+
+  def test_lru_cache(self):
+    self.server.responses["/repos/mgp/sharebears"] = (200, {"name": "sharebears"}, '"etag1"')
+    response_cache = LruCache(1024, github_client.get_response_size)
+    client = self._make_client(response_cache)
+    self.assertEqual({"name": "sharebears"}, client.get_repository("mgp", "sharebears"))
+    self.assertEqual({"name": "sharebears"}, client.get_repository("mgp", "sharebears"))
+    self.assertEqual(1, len(self.server.requests))
+    # Assert that the size of the response is the size of its body.
+    self.assertEqual(len(json.dumps({"name": "sharebears"})), response_cache.get_stats()["size"])
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(GitHubClientTest))
+  return suite
+
@@ -0,0 +1,94 @@
+import collections
+import threading
+
+
+class LruCache:
+  """A cache that evicts its least recently used entries once the total size of
+  its values exceeds a maximum size, or once it has more than a maximum number
+  of entries.
+
+  This is safe to use from multiple threads.
+  """
+
+  def __init__(self, max_size, get_size=len, max_entries=None):
+    self._max_size = max_size
+    self._max_entries = max_entries
+    self._get_size = get_size
+    # Maps each key to its value and size, from least to most recently used.
+    self._entries = collections.OrderedDict()
+    self._size = 0
+    self._lock = threading.Lock()
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __repr__(self):
+    return "LruCache(max_size=%r, size=%r, entries=%r)" % (
+        self._max_size, self._size, len(self._entries))
+
+  def get(self, key, default=None):
+    """Returns the value for the given key, or default if it is not cached."""
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        self.misses += 1
+        return default
+      # Reinsert the entry so that it is the most recently used.
+      self._entries[key] = entry
+      self.hits += 1
+      return entry[0]
+
+  def put(self, key, value):
+    """Caches the given value for the given key.
+
+    If the value is larger than the maximum size, then it is not cached.
+    """
+    size = self._get_size(value)
+    with self._lock:
+      self._remove_entry(key)
+      if size > self._max_size:
+        return
+
+      self._entries[key] = (value, size)
+      self._size += size
+      while self._size > self._max_size or self._has_too_many_entries():
+        evicted_key, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+        self._size -= evicted_size
+        self.evictions += 1
+
+  def _has_too_many_entries(self):
+    return self._max_entries is not None and len(self._entries) > self._max_entries
+
+  def _remove_entry(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self._size -= entry[1]
+
+  def remove(self, key):
+    """Removes the value for the given key, if any."""
+    with self._lock:
+      self._remove_entry(key)
+
+  def clear(self):
+    """Removes all values."""
+    with self._lock:
+      self._entries.clear()
+      self._size = 0
+
+  def get_stats(self):
+    """Returns a dictionary of statistics for this cache."""
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "entries": len(self._entries),
+        "size": self._size,
+        "max_size": self._max_size,
+        "max_entries": self._max_entries,
+      }
+
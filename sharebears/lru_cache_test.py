@@ -0,0 +1,96 @@
+import unittest
+
+from lru_cache import LruCache
+
+
+class LruCacheTest(unittest.TestCase):
+  def test_get_missing(self):
+    cache = LruCache(10)
+    self.assertIsNone(cache.get("key"))
+    self.assertEqual("default", cache.get("key", "default"))
+    self.assertEqual(0, cache.hits)
+    self.assertEqual(2, cache.misses)
+
+  def test_put_and_get(self):
+    cache = LruCache(10)
+    cache.put("key1", "value1")
+    cache.put("key2", "v2")
+    self.assertEqual("value1", cache.get("key1"))
+    self.assertEqual("v2", cache.get("key2"))
+    self.assertEqual(2, len(cache))
+    self.assertEqual(2, cache.hits)
+    self.assertEqual(0, cache.misses)
+
+    # Replacing a value updates the size.
+    cache.put("key1", "v1")
+    self.assertEqual("v1", cache.get("key1"))
+    self.assertEqual(4, cache.get_stats()["size"])
+
+  def test_evicts_least_recently_used(self):
+    cache = LruCache(6)
+    cache.put("key1", "v1")
+    cache.put("key2", "v2")
+    cache.put("key3", "v3")
+    # Use the first key so that the second key is the least recently used.
+    cache.get("key1")
+    cache.put("key4", "v4")
+    self.assertIsNone(cache.get("key2"))
+    self.assertEqual("v1", cache.get("key1"))
+    self.assertEqual("v3", cache.get("key3"))
+    self.assertEqual("v4", cache.get("key4"))
+    self.assertEqual(1, cache.evictions)
+
+    # Assert that a large value evicts several values.
+    cache.put("key5", "value5")
+    self.assertEqual(1, len(cache))
+    self.assertEqual("value5", cache.get("key5"))
+    self.assertEqual(4, cache.evictions)
+
+  def test_value_too_large(self):
+    cache = LruCache(4)
+    cache.put("key1", "v1")
+    cache.put("key2", "value2")
+    self.assertIsNone(cache.get("key2"))
+    self.assertEqual("v1", cache.get("key1"))
+
+  def test_remove_and_clear(self):
+    cache = LruCache(10)
+    cache.put("key1", "v1")
+    cache.put("key2", "v2")
+    cache.remove("key1")
+    cache.remove("missing_key")
+    self.assertIsNone(cache.get("key1"))
+    self.assertEqual(2, cache.get_stats()["size"])
+    cache.clear()
+    self.assertEqual(0, len(cache))
+    self.assertEqual(0, cache.get_stats()["size"])
+
+  def test_get_size(self):
+    cache = LruCache(10, lambda value: value * 2)
+    cache.put("key1", 3)
+    cache.put("key2", 3)
+    self.assertIsNone(cache.get("key1"))
+    self.assertEqual(3, cache.get("key2"))
+
+  def test_max_entries(self):
+    cache = LruCache(10, max_entries=2)
+    cache.put("key1", "v1")
+    cache.put("key2", "v2")
+    cache.put("key3", "v3")
+    self.assertEqual(2, len(cache))
+    self.assertIsNone(cache.get("key1"))
+    self.assertEqual("v2", cache.get("key2"))
+    self.assertEqual("v3", cache.get("key3"))
+    self.assertEqual(1, cache.evictions)
+
+    # Replacing a value does not evict another.
+    cache.put("key2", "value2")
+    self.assertEqual(2, len(cache))
+    self.assertEqual(1, cache.evictions)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(LruCacheTest))
+  return suite
+
@@ -1,3 +1,7 @@
+import codecs
+import re
+
+
 class Token:
   """A token returned by the parse method."""
 
@@ -27,57 +31,160 @@ class Token:
 
 _URL_PREFIXES = ["http://", "https://", "www."]
 _TLDS = ["biz", "ca", "co", "co.uk", "com", "de", "edu", "es", "eu", "gov", "info", "io", "me", "mobi", "net", "org", "us"]
-_URL_SUFFIXES = []
-for tld in _TLDS:
-  _URL_SUFFIXES.append(".%s" % tld)
-  _URL_SUFFIXES.append(".%s/" % tld)
+_URL_PREFIX_REGEX = re.compile("|".join(re.escape(url_prefix) for url_prefix in _URL_PREFIXES))
+_TLD_SET = frozenset(_TLDS)
+# The maximum number of labels in a TLD.
+_MAX_TLD_LABELS = max(tld.count(".") + 1 for tld in _TLDS)
+
+# Like str.split and unicode.split, which split on different whitespace.
+_STR_TOKEN_REGEX = re.compile(r"\S+")
+_UNICODE_TOKEN_REGEX = re.compile(r"\S+", re.UNICODE)
 
 def _is_url(token_string):
   # Can use something more complicated like
   # https://github.com/django/django/blob/695956376ff09b0d6fd5c438f912b9eb05459145/django/core/validators.py#L68
-  for url_prefix in _URL_PREFIXES:
-    if token_string.startswith(url_prefix):
-      return True
-  for url_prefix in _URL_SUFFIXES:
-    if token_string.endswith(url_prefix):
+  if _URL_PREFIX_REGEX.match(token_string):
+    return True
+
+  # A URL ends with a dot and a TLD, followed by an optional slash.
+  if token_string.endswith("/"):
+    token_string = token_string[:-1]
+  dot_index = len(token_string)
+  for i in xrange(_MAX_TLD_LABELS):
+    dot_index = token_string.rfind(".", 0, dot_index)
+    if dot_index < 0:
+      return False
+    if token_string[dot_index + 1:] in _TLD_SET:
       return True
   return False
 
 
-def parse(string):
-  """Parses the given string as a list of Token instances."""
+class ParseLimitException(Exception):
+  """An exception raised when a string exceeds a limit of iter_tokens."""
 
-  token_strings = string.strip().split()
+  def __init__(self, reason):
+    Exception.__init__(self)
+    self.reason = reason
+
+  def __str__(self):
+    return str(self.reason)
 
-  # Extract the tokens for hash tags.
-  hash_tag_tokens = []
-  for token_string in reversed(token_strings):
-    if token_string.startswith("#"):
-      hash_tag_token = Token.hash_tag(token_string[1:])
-      hash_tag_tokens.append(hash_tag_token)
-    else:
-      break
 
-  if hash_tag_tokens:
-    hash_tag_tokens = list(reversed(hash_tag_tokens))
-    # Extract text or URLs from the preceding tokens.
-    token_strings = token_strings[:-len(hash_tag_tokens)]
+# The number of characters read at a time by read_chunks by default.
+DEFAULT_CHUNK_SIZE = 64 * 1024
 
-  tokens = []
-  def _add_token_for_words(words):
-    tokens.append(Token.text(" ".join(words)))
+def read_chunks(stream, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None):
+  """Yields the contents of the given file-like object in chunks for iter_tokens.
 
+  If encoding is not None, then the chunks are decoded as unicode strings.
+  """
+  decoder = codecs.getincrementaldecoder(encoding)() if encoding is not None else None
+  while True:
+    chunk = stream.read(chunk_size)
+    if not chunk:
+      break
+    if decoder is not None:
+      chunk = decoder.decode(chunk)
+    yield chunk
+  if decoder is not None:
+    chunk = decoder.decode("", final=True)
+    if chunk:
+      yield chunk
+
+
+def _iter_words(chunks, max_length):
+  """Yields each whitespace-separated word in the string that is split into the
+  given chunks, like the split method of that string.
+  """
+  length = 0
+  # The pieces of a word that may continue in the next chunk.
+  word_pieces = []
+  for chunk in chunks:
+    if not chunk:
+      continue
+    length += len(chunk)
+    if (max_length is not None) and (length > max_length):
+      raise ParseLimitException("String is longer than %s characters" % max_length)
+
+    token_regex = _UNICODE_TOKEN_REGEX if isinstance(chunk, unicode) else _STR_TOKEN_REGEX
+    position = 0
+    if word_pieces:
+      match = token_regex.match(chunk)
+      if match is not None:
+        if match.end() == len(chunk):
+          # The word continues in the next chunk.
+          word_pieces.append(chunk)
+          continue
+        word_pieces.append(match.group())
+        position = match.end()
+      yield "".join(word_pieces)
+      word_pieces = []
+
+    for match in token_regex.finditer(chunk, position):
+      if match.end() == len(chunk):
+        word_pieces.append(match.group())
+      else:
+        yield match.group()
+  if word_pieces:
+    yield "".join(word_pieces)
+
+
+def iter_tokens(chunks, max_length=None, max_tokens=None):
+  """Yields the Token instances of the string that is split into the given
+  chunks, which can be read from a stream by read_chunks.
+
+  This reads each whitespace-separated word once, and holds only the words of
+  the current text token and of the hash tags that may end the string. The hash
+  tags at the end of the string are yielded as hash tag tokens, and all other
+  words are grouped into text and URL tokens.
+
+  If the string is longer than max_length characters, or has more than
+  max_tokens tokens, then ParseLimitException is raised.
+  """
+  num_tokens = 0
   words = []
-  for token_string in token_strings:
-    if _is_url(token_string):
+  # The words starting with # since the last word that did not, which are hash
+  # tags if they end the string.
+  hash_tag_strings = []
+
+  for word in _iter_words(chunks, max_length):
+    if word.startswith("#"):
+      hash_tag_strings.append(word)
+      continue
+
+    if hash_tag_strings:
+      # The preceding words starting with # are not hash tags.
+      hash_tag_strings.append(word)
+      token_strings = hash_tag_strings
+      hash_tag_strings = []
+    else:
+      token_strings = (word,)
+    for token_string in token_strings:
+      if not _is_url(token_string):
+        words.append(token_string)
+        continue
+
       if words:
-        _add_token_for_words(words)
+        yield Token.text(" ".join(words))
         words = []
-      tokens.append(Token.url(token_string))
-    else:
-      words.append(token_string)
+        num_tokens += 1
+      yield Token.url(token_string)
+      num_tokens += 1
+      if (max_tokens is not None) and (num_tokens > max_tokens):
+        raise ParseLimitException("String has more than %s tokens" % max_tokens)
+
   if words:
-    _add_token_for_words(words)
+    yield Token.text(" ".join(words))
+    num_tokens += 1
+  if (max_tokens is not None) and (num_tokens + len(hash_tag_strings) > max_tokens):
+    raise ParseLimitException("String has more than %s tokens" % max_tokens)
+  for hash_tag_string in hash_tag_strings:
+    yield Token.hash_tag(hash_tag_string[1:])
+
 
-  return tokens + hash_tag_tokens
+def parse(string, max_length=None, max_tokens=None):
+  """Parses the given string as a list of Token instances.
 
+  See iter_tokens for details.
+  """
+  return list(iter_tokens((string,), max_length, max_tokens))
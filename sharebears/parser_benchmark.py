@@ -0,0 +1,114 @@
+"""Measures the bytes per second of parsing short and very long posts by
+splitting the whole string and testing each word with startswith and endswith,
+as before, and with the single-pass tokenizer of parser.parse.
+
+Run with: python sharebears/parser_benchmark.py
+"""
+
+import random
+import time
+
+import parser
+from parser import Token
+
+
+_MIN_SECONDS = 1.0
+
+
+_URL_PREFIXES = ["http://", "https://", "www."]
+_URL_SUFFIXES = []
+for tld in parser._TLDS:
+  _URL_SUFFIXES.append(".%s" % tld)
+  _URL_SUFFIXES.append(".%s/" % tld)
+
+def _is_url_before(token_string):
+  for url_prefix in _URL_PREFIXES:
+    if token_string.startswith(url_prefix):
+      return True
+  for url_prefix in _URL_SUFFIXES:
+    if token_string.endswith(url_prefix):
+      return True
+  return False
+
+def _parse_before(string):
+  token_strings = string.strip().split()
+
+  hash_tag_tokens = []
+  for token_string in reversed(token_strings):
+    if token_string.startswith("#"):
+      hash_tag_tokens.append(Token.hash_tag(token_string[1:]))
+    else:
+      break
+  if hash_tag_tokens:
+    hash_tag_tokens = list(reversed(hash_tag_tokens))
+    token_strings = token_strings[:-len(hash_tag_tokens)]
+
+  tokens = []
+  words = []
+  for token_string in token_strings:
+    if _is_url_before(token_string):
+      if words:
+        tokens.append(Token.text(" ".join(words)))
+        words = []
+      tokens.append(Token.url(token_string))
+    else:
+      words.append(token_string)
+  if words:
+    tokens.append(Token.text(" ".join(words)))
+  return tokens + hash_tag_tokens
+
+
+_WORDS = ["the", "build", "failed", "again", "after", "upgrading", "#not-a-tag", "see",
+    "stack.trace", "/var/log/app.log", "ERROR", "2014-10-27", "timeout=30s"]
+_URLS = ["https://github.com/mgp/sharebears", "www.example.com", "example.co.uk/",
+    "http://host/image.jpg", "docs.python.org"]
+
+def _make_post(random, num_words):
+  words = []
+  for i in xrange(num_words):
+    if random.random() < 0.05:
+      words.append(random.choice(_URLS))
+    else:
+      words.append(random.choice(_WORDS))
+    words.append("\n" if random.random() < 0.1 else " ")
+  words.append("#ht0 #ht1")
+  return "".join(words)
+
+def _get_corpus():
+  """Returns a list of the name and posts of each part of the corpus."""
+  rng = random.Random(0)
+  return [
+    ("short", [_make_post(rng, rng.randint(5, 40)) for i in xrange(100)]),
+    ("long", [_make_post(rng, 20000) for i in xrange(2)]),
+    ("very long", [_make_post(rng, 500000)]),
+  ]
+
+
+def _bytes_per_second(parse, posts):
+  num_bytes = 0
+  start_time = time.time()
+  while True:
+    for post in posts:
+      parse(post)
+      num_bytes += len(post)
+    seconds = time.time() - start_time
+    if seconds >= _MIN_SECONDS:
+      return num_bytes / seconds
+
+
+def _main():
+  for name, posts in _get_corpus():
+    # Assert that both produce the same tokens.
+    for post in posts:
+      before_tokens = [(token.type, token.value) for token in _parse_before(post)]
+      after_tokens = [(token.type, token.value) for token in parser.parse(post)]
+      assert before_tokens == after_tokens
+
+    before_bytes_per_second = _bytes_per_second(_parse_before, posts)
+    after_bytes_per_second = _bytes_per_second(parser.parse, posts)
+    print "posts=%-10s before MB/second=%-7.2f after MB/second=%-7.2f speedup=%.2fx" % (
+        name, before_bytes_per_second / 1e6, after_bytes_per_second / 1e6,
+        after_bytes_per_second / before_bytes_per_second)
+
+if __name__ == "__main__":
+  _main()
@@ -1,3 +1,4 @@
+import StringIO
 import unittest
 
 import parser
@@ -35,6 +36,13 @@ class ParserTest(unittest.TestCase):
     self.assertTrue(parser._is_url("foo.com"))
     self.assertTrue(parser._is_url("foo.com/"))
     self.assertFalse(parser._is_url("foo.com$"))
+    self.assertFalse(parser._is_url("foo.com//"))
+    self.assertTrue(parser._is_url(".com"))
+    self.assertFalse(parser._is_url("com"))
+    # Test TLDs with several labels.
+    self.assertTrue(parser._is_url("foo.co.uk"))
+    self.assertTrue(parser._is_url("foo.co.uk/"))
+    self.assertFalse(parser._is_url("foo.uk"))
 
   def test_parse_empty(self):
     tokens = parser.parse("")
@@ -109,6 +117,89 @@ class ParserTest(unittest.TestCase):
     self._assert_text_token(tokens[1], "text1")
     self._assert_url_token(tokens[2], "http://url2")
 
+  def test_hash_tags_before_text(self):
+    # Only the hash tags at the end are hash tag tokens.
+    tokens = parser.parse("#text0 text1 #ht2")
+    self.assertEqual(2, len(tokens))
+    self._assert_text_token(tokens[0], "#text0 text1")
+    self._assert_hash_tag_token(tokens[1], "ht2")
+
+    # A word starting with # that is not a hash tag can be a URL.
+    tokens = parser.parse("#url0.com text1")
+    self.assertEqual(2, len(tokens))
+    self._assert_url_token(tokens[0], "#url0.com")
+    self._assert_text_token(tokens[1], "text1")
+
+  def test_parse_whitespace(self):
+    tokens = parser.parse(" text0\ttext1\n\nhttp://url2\r\n#ht3 ")
+    self.assertEqual(3, len(tokens))
+    self._assert_text_token(tokens[0], "text0 text1")
+    self._assert_url_token(tokens[1], "http://url2")
+    self._assert_hash_tag_token(tokens[2], "ht3")
+
+    # Assert that Unicode strings are also split on Unicode whitespace.
+    tokens = parser.parse(u"text0\u00a0text1\u3000#ht2")
+    self.assertEqual(2, len(tokens))
+    self._assert_text_token(tokens[0], u"text0 text1")
+    self._assert_hash_tag_token(tokens[1], u"ht2")
+    tokens = parser.parse("text0\xa0text1")
+    self.assertEqual(1, len(tokens))
+    self._assert_text_token(tokens[0], "text0\xa0text1")
+
+  def _assert_tokens(self, expected_tokens, tokens):
+    self.assertEqual(expected_tokens, [(token.type, token.value) for token in tokens])
+
+  def test_iter_tokens_chunks(self):
+    string = "text0 http://url1  text2 #ht3\n#ht4"
+    expected_tokens = [(token.type, token.value) for token in parser.parse(string)]
+    # Assert that each way of splitting the string yields the same tokens.
+    for i in xrange(len(string) + 1):
+      for j in xrange(i, len(string) + 1):
+        chunks = [string[:i], string[i:j], string[j:]]
+        self._assert_tokens(expected_tokens, parser.iter_tokens(chunks))
+
+  def test_iter_tokens_lazily(self):
+    read_chunks = []
+    def _chunks():
+      for chunk in ["text0 http://url1 ", "text2"]:
+        read_chunks.append(chunk)
+        yield chunk
+    tokens = parser.iter_tokens(_chunks())
+    self._assert_text_token(next(tokens), "text0")
+    self._assert_url_token(next(tokens), "http://url1")
+    # Assert that the tokens of the first chunk are yielded before reading the second.
+    self.assertEqual(1, len(read_chunks))
+    self._assert_text_token(next(tokens), "text2")
+    self.assertRaises(StopIteration, next, tokens)
+
+  def test_max_length(self):
+    string = "text0 http://url1 #ht2"
+    self.assertEqual(3, len(parser.parse(string, max_length=len(string))))
+    self.assertRaises(parser.ParseLimitException, parser.parse, string, max_length=len(string) - 1)
+
+    # Assert that the limit is enforced before reading the remaining chunks.
+    chunks = iter(["text0 ", "text1 ", "text2"])
+    tokens = parser.iter_tokens(chunks, max_length=8)
+    self.assertRaises(parser.ParseLimitException, list, tokens)
+    self.assertEqual(["text2"], list(chunks))
+
+  def test_max_tokens(self):
+    string = "text0 http://url1 text2 #ht3 #ht4"
+    self.assertEqual(5, len(parser.parse(string, max_tokens=5)))
+    self.assertRaises(parser.ParseLimitException, parser.parse, string, max_tokens=4)
+    self.assertRaises(parser.ParseLimitException, parser.parse, "http://url0 http://url1", max_tokens=1)
+
+  def test_read_chunks(self):
+    stream = StringIO.StringIO("text0 text1")
+    self.assertEqual(["text0", " text", "1"], list(parser.read_chunks(stream, chunk_size=5)))
+
+    # Assert that characters split across chunks are decoded.
+    stream = StringIO.StringIO(u"text0 \u2603 #ht1".encode("utf-8"))
+    chunks = list(parser.read_chunks(stream, chunk_size=1, encoding="utf-8"))
+    self.assertEqual(u"text0 \u2603 #ht1", u"".join(chunks))
+    self._assert_tokens([(parser.Token.TEXT, u"text0 \u2603"), (parser.Token.HASH_TAG, u"ht1")],
+        parser.iter_tokens(chunks))
+
 
 def suite():
   suite = unittest.TestSuite()
@@ -0,0 +1,116 @@
+import json
+import logging
+import threading
+
+import db
+from post_processor import IncompleteDecodingException
+
+
+# The number of seconds that a worker has to enrich a post before it is claimed again.
+DEFAULT_CLAIM_SECONDS = 5 * 60
+# The number of times that enriching a post is attempted before it is given up.
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+def _enrich_post(post_processor, post_enrichment, max_attempts):
+  """Decodes the URLs of the claimed post and stores its new data.
+
+  Unless this is the last attempt, raises IncompleteDecodingException if a URL
+  could be decoded by retrying. Returns whether its data was replaced.
+  """
+  data = json.loads(post_enrichment.data)
+  enriched_data = post_processor.decode_urls(data,
+      raise_if_incomplete=(post_enrichment.num_attempts < max_attempts))
+  if enriched_data == data:
+    # The post has no decodable URLs.
+    return db.complete_post_enrichment(post_enrichment.post_id, post_enrichment.data)
+  return db.complete_post_enrichment(post_enrichment.post_id, post_enrichment.data,
+      json.dumps(enriched_data))
+
+
+def enrich_posts(post_processor,
+    batch_size=db.DEFAULT_BATCH_SIZE,
+    claim_seconds=DEFAULT_CLAIM_SECONDS,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+    on_enriched=None):
+  """Decodes the URLs of all posts queued for enrichment, using the given
+  PostProcessor, until the queue has no unclaimed posts.
+
+  If on_enriched is not None, then it is called with the identifier of each post
+  whose data was replaced. A post that fails to be enriched, or that has a URL
+  whose decoder timed out or was unavailable, is retried once its claim expires,
+  until max_attempts is reached.
+
+  Returns the number of posts whose data was replaced.
+  """
+  num_posts = 0
+  while True:
+    post_enrichments = db.claim_post_enrichments(batch_size, claim_seconds)
+    if not post_enrichments:
+      return num_posts
+
+    for post_enrichment in post_enrichments:
+      try:
+        if _enrich_post(post_processor, post_enrichment, max_attempts):
+          num_posts += 1
+          if on_enriched is not None:
+            on_enriched(post_enrichment.post_id)
+      except IncompleteDecodingException:
+        # Leave the post claimed, so that it is retried.
+        logging.warning("Could not decode all URLs of post %s", post_enrichment.post_id)
+      except Exception:
+        logging.exception("Could not enrich post %s", post_enrichment.post_id)
+        if post_enrichment.num_attempts >= max_attempts:
+          # Leave the post with its unrecognized URLs.
+          db.complete_post_enrichment(post_enrichment.post_id, post_enrichment.data)
+
+
+class EnrichmentWorker:
+  """A daemon thread that runs enrich_posts whenever it is notified of a new
+  post, and otherwise every poll_seconds.
+
+  Because the queue is stored in the database, posts that were queued before a
+  restart are enriched once a new worker starts.
+  """
+
+  def __init__(self, post_processor, poll_seconds=60, on_enriched=None, **enrich_posts_kwargs):
+    self._post_processor = post_processor
+    self._poll_seconds = poll_seconds
+    self._on_enriched = on_enriched
+    self._enrich_posts_kwargs = enrich_posts_kwargs
+    self._notified = threading.Event()
+    self._stopped = False
+    self._thread = None
+    self._lock = threading.Lock()
+
+  def start(self):
+    """Starts the thread, if it is not already running."""
+    with self._lock:
+      if (self._thread is not None) and self._thread.is_alive():
+        return
+      self._stopped = False
+      self._thread = threading.Thread(target=self._run, name="EnrichmentWorker")
+      self._thread.daemon = True
+      self._thread.start()
+
+  def notify(self):
+    """Wakes the thread to enrich a newly queued post."""
+    self._notified.set()
+
+  def stop(self):
+    """Stops the thread after its current run of enrich_posts."""
+    with self._lock:
+      thread = self._thread
+      self._stopped = True
+      self._notified.set()
+    if thread is not None:
+      thread.join()
+
+  def _run(self):
+    while not self._stopped:
+      self._notified.clear()
+      try:
+        enrich_posts(self._post_processor, on_enriched=self._on_enriched, **self._enrich_posts_kwargs)
+      except Exception:
+        logging.exception("Could not enrich posts")
+      self._notified.wait(self._poll_seconds)
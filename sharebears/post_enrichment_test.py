@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import db
+import db_schema
+import db_util
+import post_enrichment
+from post_enrichment import EnrichmentWorker
+from post_processor import PostProcessor
+from url_decoder_breaker import UrlDecoderUnavailableException
+from url_decoder_image import ImageUrlDecoder
+
+
+class PostEnrichmentTest(unittest.TestCase):
+  # Use an in-memory SQLite database.
+  _DATABASE = "sqlite"
+  _DATABASE_URI = "sqlite://"
+  # Created by setUpClass.
+  _engine = None
+
+
+  @classmethod
+  def setUpClass(cls):
+    PostEnrichmentTest._engine = db_util.init_db(
+        PostEnrichmentTest._DATABASE, PostEnrichmentTest._DATABASE_URI)
+
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    db_schema.create_all_tables(PostEnrichmentTest._engine)
+    self.decoder = ImageUrlDecoder()
+    self.processor = PostProcessor([self.decoder])
+
+  def tearDown(self):
+    db_schema.drop_all_tables(PostEnrichmentTest._engine)
+    unittest.TestCase.tearDown(self)
+
+
+  def _add_post(self, string):
+    processed_post = self.processor.process(string, decode_urls=False)
+    return db.add_post("user_id", json.dumps(processed_post.data), [], enrich=True)
+
+  def _get_data(self, post_id):
+    return json.loads(db.get_post("client_id", post_id).data)
+
+  def test_enrich_posts(self):
+    post_ids = [self._add_post("text http://host/image%s.jpg" % i) for i in xrange(3)]
+    text_post_id = self._add_post("text")
+    # Assert that readers see unrecognized URLs until the posts are enriched.
+    self.assertEqual("url", self._get_data(post_ids[0])[1]["type"])
+
+    enriched_post_ids = []
+    self.assertEqual(3, post_enrichment.enrich_posts(self.processor,
+        batch_size=2, on_enriched=enriched_post_ids.append))
+    self.assertSequenceEqual(post_ids, enriched_post_ids)
+    for post_id in post_ids:
+      self.assertEqual(self.processor.process(
+          "text http://host/image%s.jpg" % (post_id - 1)).data, self._get_data(post_id))
+    self.assertEqual([{"type": "text", "value": "text"}], self._get_data(text_post_id))
+
+    # Assert that no posts remain in the queue.
+    self.assertSequenceEqual([], db.claim_post_enrichments(10, 60))
+    self.assertEqual(0, post_enrichment.enrich_posts(self.processor))
+
+  def test_claim_post_enrichments(self):
+    post_id = self._add_post("http://host/image.jpg")
+    now = datetime(2013, 9, 26)
+    post_enrichments = db.claim_post_enrichments(10, 60, now)
+    self.assertEqual(1, len(post_enrichments))
+    self.assertEqual(post_id, post_enrichments[0].post_id)
+    self.assertEqual(1, post_enrichments[0].num_attempts)
+
+    # Assert that the post is claimed again only after its claim expires.
+    self.assertSequenceEqual([], db.claim_post_enrichments(10, 60, now + timedelta(seconds=59)))
+    post_enrichments = db.claim_post_enrichments(10, 60, now + timedelta(seconds=60))
+    self.assertEqual(1, len(post_enrichments))
+    self.assertEqual(2, post_enrichments[0].num_attempts)
+
+  def test_changed_data_not_replaced(self):
+    post_id = self._add_post("http://host/image.jpg")
+    post_enrichment = db.claim_post_enrichments(10, 60)[0]
+    self.assertFalse(db.complete_post_enrichment(post_id, "[]", "new_data"))
+    self.assertEqual(json.loads(post_enrichment.data), self._get_data(post_id))
+    self.assertTrue(db.complete_post_enrichment(post_id, post_enrichment.data, "[]"))
+    self.assertEqual([], self._get_data(post_id))
+
+  def test_retry_until_max_attempts(self):
+    post_id = self._add_post("http://host/image.jpg")
+    num_calls = [0]
+    def _decode_url(url, parsed_url):
+      num_calls[0] += 1
+      raise ValueError("Could not decode %s" % url)
+    self.decoder.decode_url = _decode_url
+
+    # Do not log the expected exceptions.
+    logging.disable(logging.ERROR)
+    try:
+      self.assertEqual(0, post_enrichment.enrich_posts(self.processor, claim_seconds=0, max_attempts=3))
+    finally:
+      logging.disable(logging.NOTSET)
+    self.assertEqual(3, num_calls[0])
+    # Assert that the post keeps its unrecognized URL and is no longer queued.
+    self.assertEqual("url", self._get_data(post_id)[0]["type"])
+    self.assertSequenceEqual([], db.claim_post_enrichments(10, 0))
+
+  def test_retry_after_timeout(self):
+    post_id = self._add_post("http://host/image.jpg")
+    processor = PostProcessor([self.decoder], max_workers=2, decoder_timeout_seconds=0.05)
+    unblocked = threading.Event()
+    num_calls = [0]
+    image_decode_url = self.decoder.decode_url
+    def _decode_url(url, parsed_url):
+      num_calls[0] += 1
+      if num_calls[0] == 1:
+        # Only the first call is slower than the timeout.
+        unblocked.wait(5)
+      return image_decode_url(url, parsed_url)
+    self.decoder.decode_url = _decode_url
+
+    logging.disable(logging.WARNING)
+    try:
+      self.assertEqual(1, post_enrichment.enrich_posts(processor, claim_seconds=0))
+    finally:
+      logging.disable(logging.NOTSET)
+      unblocked.set()
+    # Assert that the timed out post was retried instead of completed.
+    self.assertEqual(1, processor.timeouts)
+    self.assertEqual(2, num_calls[0])
+    self.assertEqual("url-image", self._get_data(post_id)[0]["type"])
+    self.assertSequenceEqual([], db.claim_post_enrichments(10, 0))
+
+  def test_retry_unavailable_decoder(self):
+    post_id = self._add_post("http://host/image.jpg")
+    num_calls = [0]
+    def _decode_url(url, parsed_url):
+      num_calls[0] += 1
+      raise UrlDecoderUnavailableException("Decoder %s is unavailable" % self.decoder.name())
+    self.decoder.decode_url = _decode_url
+
+    logging.disable(logging.WARNING)
+    try:
+      self.assertEqual(0, post_enrichment.enrich_posts(self.processor, claim_seconds=0, max_attempts=3))
+    finally:
+      logging.disable(logging.NOTSET)
+    self.assertEqual(3, num_calls[0])
+    # Assert that the post keeps its unrecognized URL after the last attempt.
+    self.assertEqual("url", self._get_data(post_id)[0]["type"])
+    self.assertSequenceEqual([], db.claim_post_enrichments(10, 0))
+
+
+class EnrichmentWorkerTest(unittest.TestCase):
+  """Tests the worker thread, which must see the same database as other threads."""
+
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.engine = None
+    self.processor = PostProcessor([ImageUrlDecoder()])
+
+  def tearDown(self):
+    self.engine.dispose()
+    shutil.rmtree(self.temp_dir)
+    unittest.TestCase.tearDown(self)
+
+
+  def _init_db(self, database_uri):
+    self.engine = db_util.init_db("sqlite", database_uri)
+    db_schema.create_all_tables(self.engine)
+
+  def _assert_worker_enriches_post(self):
+    enriched = threading.Event()
+    worker = EnrichmentWorker(self.processor,
+        poll_seconds=60, on_enriched=lambda post_id: enriched.set())
+    worker.start()
+    try:
+      processed_post = self.processor.process("http://host/image.jpg", decode_urls=False)
+      post_id = db.add_post("user_id", json.dumps(processed_post.data), [], enrich=True)
+      worker.notify()
+      enriched.wait(5)
+      self.assertTrue(enriched.is_set())
+      data = json.loads(db.get_post("client_id", post_id).data)
+      self.assertEqual("url-image", data[0]["type"])
+    finally:
+      worker.stop()
+
+  def test_worker(self):
+    self._init_db("sqlite:///%s" % os.path.join(self.temp_dir, "test.db"))
+    self._assert_worker_enriches_post()
+
+  def test_worker_memory_database(self):
+    self._init_db("sqlite://")
+    self._assert_worker_enriches_post()
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(PostEnrichmentTest))
+  suite.addTest(unittest.makeSuite(EnrichmentWorkerTest))
+  return suite
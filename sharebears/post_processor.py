@@ -1,3 +1,10 @@
+import collections
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+import time
 import urlparse
 
 import album_item
@@ -5,6 +12,8 @@ import parser
 from parser import Token
 import paragraph_item
 from renderable_item import RenderableItem
+from url_decoder import UrlDecoderException
+from url_decoder_breaker import UrlDecoderUnavailableException
 
 
 class ProcessedPost:
@@ -13,16 +22,83 @@ class ProcessedPost:
     self.hash_tags = hash_tags
 
 
+class IncompleteDecodingException(Exception):
+  """An exception raised when a URL was not decoded because its decoder timed
+  out or was unavailable, and so decoding it again may succeed."""
+  pass
+
+
 class PostProcessor:
-  """Processes a post so that it is suitable for storage or rendering."""
+  """Processes a post so that it is suitable for storage or rendering.
+
+  If max_workers is greater than 1, then the URLs of a post are decoded
+  concurrently on a pool of that many threads, even if there is only one URL, so
+  that its timeout applies. A URL whose decoder takes more than its timeout, or
+  that is not decoded before the deadline for the post, is stored as an
+  unrecognized URL. The timeouts and the deadline include the time spent waiting
+  for a thread.
+
+  A post longer than max_length characters, or with more than max_tokens parser
+  tokens, raises parser.ParseLimitException.
+  """
 
   _TEXT_TYPE = "text"
   _URL_TYPE = "url"
   _DECODED_URL_TYPE_PREFIX = "%s-" % _URL_TYPE
 
-  def __init__(self, decoders):
+  def __init__(self, decoders,
+      max_workers=None,
+      decoder_timeout_seconds=None,
+      timeout_seconds_by_decoder=None,
+      deadline_seconds=None,
+      max_length=None,
+      max_tokens=None,
+      get_time=time.time):
     self._decoders = decoders
     self._decoders_by_name = {decoder.name(): decoder for decoder in decoders}
+    self._build_host_index()
+    self._max_workers = max_workers
+    self._decoder_timeout_seconds = decoder_timeout_seconds
+    self._timeout_seconds_by_decoder = timeout_seconds_by_decoder or {}
+    self._deadline_seconds = deadline_seconds
+    self._max_length = max_length
+    self._max_tokens = max_tokens
+    self._get_time = get_time
+    # The thread pool of this process, which is recreated after a fork.
+    self._pool = None
+    self._pool_pid = None
+    self._pool_lock = threading.Lock()
+
+    self.timeouts = 0
+
+  def get_decoders(self):
+    """Returns the URL decoders of this processor."""
+    return self._decoders
+
+  def _build_host_index(self):
+    """Indexes the decoders by the host prefixes that they declare."""
+    self._decoder_indexes = {id(decoder): index for index, decoder in enumerate(self._decoders)}
+    # The decoders that may accept URLs with any host.
+    self._any_host_decoders = [
+        decoder for decoder in self._decoders if decoder.host_prefixes() is None]
+    # Maps each host prefix to the decoders that may accept URLs with hosts that
+    # match it, including those that accept any host, in order of registration.
+    decoders_by_host_prefix = collections.defaultdict(list)
+    for decoder in self._decoders:
+      host_prefixes = decoder.host_prefixes()
+      for host_prefix in (host_prefixes if host_prefixes is not None else ()):
+        decoders_by_host_prefix[host_prefix].append(decoder)
+    self._decoders_by_host_prefix = {}
+    for host_prefix, host_decoders in decoders_by_host_prefix.iteritems():
+      self._decoders_by_host_prefix[host_prefix] = self._sort_decoders(
+          set(host_decoders + self._any_host_decoders))
+    # The maximum number of dots in a host prefix, after which a host matches no prefix.
+    self._max_host_prefix_dots = max([host_prefix.count(".")
+        for host_prefix in self._decoders_by_host_prefix] or [0])
+
+  def _sort_decoders(self, decoders):
+    """Returns the given decoders in order of registration."""
+    return sorted(decoders, key=lambda decoder: self._decoder_indexes[id(decoder)])
 
 
   @staticmethod
@@ -42,45 +118,189 @@ class PostProcessor:
       return decoder_type[len(PostProcessor._DECODED_URL_TYPE_PREFIX):]
     raise Exception("Unknown decoder type: %s" % decoder_type)
 
+  def _decoders_for_host(self, host):
+    """Returns the decoders that may accept URLs with the given host, in order of
+    registration.
+    """
+    matched_decoder_lists = []
+    decoders = self._decoders_by_host_prefix.get(host)
+    if decoders is not None:
+      matched_decoder_lists.append(decoders)
+    # Match each prefix of the host that ends with a dot.
+    dot_index = -1
+    for i in xrange(self._max_host_prefix_dots):
+      dot_index = host.find(".", dot_index + 1)
+      if dot_index < 0:
+        break
+      decoders = self._decoders_by_host_prefix.get(host[:dot_index + 1])
+      if decoders is not None:
+        matched_decoder_lists.append(decoders)
+
+    if not matched_decoder_lists:
+      return self._any_host_decoders
+    elif len(matched_decoder_lists) == 1:
+      return matched_decoder_lists[0]
+    return self._sort_decoders(set(itertools.chain(*matched_decoder_lists)))
+
   def _decoder_for_url(self, url, parsed_url):
-    """Returns the decoder that matches the given URL, if any."""
-    for decoder in self._decoders:
+    """Returns the first decoder that matches the given URL, if any.
+
+    Only the decoders that may accept the host of the URL are tried.
+    """
+    for decoder in self._decoders_for_host(parsed_url.netloc):
       if decoder.can_decode_url(url, parsed_url):
         return decoder
     return None
 
 
-  def process(self, string):
-    """Returns a ProcessedPost instance from the given string."""
+  def _data_element_for_url(self, url):
+    """Returns the data element for the given URL, which is decoded if possible,
+    and whether that element is final.
+
+    The element is not final if the decoder of the URL is unavailable.
+    """
+    parsed_url = urlparse.urlparse(url)
+    token_decoder = self._decoder_for_url(url, parsed_url)
+    decoded_url = None
+    is_final = True
+    if token_decoder != None:
+      try:
+        decoded_url = token_decoder.decode_url(url, parsed_url)
+      except UrlDecoderUnavailableException:
+        # Store the URL as an unrecognized URL for now.
+        is_final = False
+      except UrlDecoderException:
+        # Store the URL as an unrecognized URL.
+        pass
+    if decoded_url is None:
+      return PostProcessor._make_data_element(PostProcessor._URL_TYPE, url), is_final
+    decoder_type = PostProcessor._type_for_decoder(token_decoder)
+    return PostProcessor._make_data_element(decoder_type, decoded_url), is_final
+
+  def _get_pool(self):
+    pid = os.getpid()
+    with self._pool_lock:
+      if (self._pool is None) or (self._pool_pid != pid):
+        self._pool = ThreadPool(self._max_workers)
+        self._pool_pid = pid
+      return self._pool
+
+  def _get_timeout_seconds(self, decoder):
+    """Returns the number of seconds to wait for the given decoder, or None."""
+    return self._timeout_seconds_by_decoder.get(decoder.name(), self._decoder_timeout_seconds)
 
-    parser_tokens = parser.parse(string)
+  def _data_elements_for_urls(self, urls):
+    """Returns the data element for each of the given URLs, in order, and whether
+    that element is final.
+
+    An element is not final if its decoder timed out or was unavailable.
+    """
+    if (not self._max_workers) or (self._max_workers <= 1) or (not urls):
+      return [self._data_element_for_url(url) for url in urls]
+
+    start_time = self._get_time()
+    deadline_time = None
+    if self._deadline_seconds is not None:
+      deadline_time = start_time + self._deadline_seconds
+
+    # Decode all URLs that have a decoder concurrently.
+    pool = self._get_pool()
+    decodings = []
+    for url in urls:
+      parsed_url = urlparse.urlparse(url)
+      decoder = self._decoder_for_url(url, parsed_url)
+      if decoder is None:
+        decodings.append(None)
+      else:
+        decodings.append((decoder, pool.apply_async(self._data_element_for_url, (url,))))
+
+    data_elements = []
+    for url, decoding in zip(urls, decodings):
+      if decoding is None:
+        data_elements.append(
+            (PostProcessor._make_data_element(PostProcessor._URL_TYPE, url), True))
+        continue
+
+      decoder, async_result = decoding
+      end_times = [deadline_time] if (deadline_time is not None) else []
+      timeout_seconds = self._get_timeout_seconds(decoder)
+      if timeout_seconds is not None:
+        end_times.append(start_time + timeout_seconds)
+      try:
+        if end_times:
+          data_elements.append(async_result.get(max(0, min(end_times) - self._get_time())))
+        else:
+          data_elements.append(async_result.get())
+      except multiprocessing.TimeoutError:
+        # The decoder keeps running, but store the URL as an unrecognized URL.
+        self.timeouts += 1
+        data_elements.append(
+            (PostProcessor._make_data_element(PostProcessor._URL_TYPE, url), False))
+    return data_elements
+
+  def process(self, string, decode_urls=True):
+    """Returns a ProcessedPost instance from the given string.
+
+    If decode_urls is False, then all URLs are stored as unrecognized URLs, which
+    decode_urls can decode later.
+    """
+    return self.process_chunks((string,), decode_urls)
+
+  def process_chunks(self, chunks, decode_urls=True):
+    """Like process, but for the string that is split into the given chunks, such
+    as those yielded by parser.read_chunks.
+
+    The chunks are parsed lazily, so that the whole string is not held in memory.
+    """
 
     data = []
     hash_tags = []
-    for parser_token in parser_tokens:
+    added_hash_tags = set()
+    for parser_token in parser.iter_tokens(chunks, self._max_length, self._max_tokens):
       token_type = parser_token.type
       token_value = parser_token.value
 
       if token_type == Token.TEXT:
         data.append(PostProcessor._make_data_element(PostProcessor._TEXT_TYPE, token_value))
       elif token_type == Token.HASH_TAG:
-        if token_value not in hash_tags:
+        if token_value not in added_hash_tags:
+          added_hash_tags.add(token_value)
           hash_tags.append(token_value)
       elif token_type == Token.URL:
-        url = token_value
-        parsed_url = urlparse.urlparse(url)
-        token_decoder = self._decoder_for_url(url, parsed_url)
-        if token_decoder == None:
-          data.append(PostProcessor._make_data_element(PostProcessor._URL_TYPE, token_value))
-        else:
-          decoder_type = PostProcessor._type_for_decoder(token_decoder)
-          decoded_url = token_decoder.decode_url(url, parsed_url)
-          data.append(PostProcessor._make_data_element(decoder_type, decoded_url))
+        data.append(PostProcessor._make_data_element(PostProcessor._URL_TYPE, token_value))
       else:
         raise Exception("Unknown token type: %s" % token_type)
 
+    if decode_urls:
+      self._decode_urls_in_place(data)
     return ProcessedPost(data, hash_tags)
 
+  def _decode_urls_in_place(self, post_data):
+    """Decodes each unrecognized URL of the given data list if possible.
+
+    Returns whether all of the new data elements are final.
+    """
+    url_indexes = [index for index, element in enumerate(post_data)
+        if element["type"] == PostProcessor._URL_TYPE]
+    url_elements = self._data_elements_for_urls([post_data[index]["value"] for index in url_indexes])
+    all_final = True
+    for index, (url_element, is_final) in zip(url_indexes, url_elements):
+      post_data[index] = url_element
+      all_final = all_final and is_final
+    return all_final
+
+  def decode_urls(self, post_data, raise_if_incomplete=False):
+    """Returns a copy of the data list of a processed post, where each
+    unrecognized URL is decoded if possible.
+
+    If raise_if_incomplete is True and a URL was not decoded because its decoder
+    timed out or was unavailable, then IncompleteDecodingException is raised.
+    """
+    decoded_data = list(post_data)
+    if not self._decode_urls_in_place(decoded_data) and raise_if_incomplete:
+      raise IncompleteDecodingException("Could not decode all URLs")
+    return decoded_data
+
 
   def _renderable_item_for_data_element(self, data_element):
     element_type = data_element["type"]
@@ -0,0 +1,106 @@
+"""Measures the URLs per second of finding the decoder for a URL by trying every
+decoder in order, as before, and by indexing the decoders by host.
+
+Run with: python sharebears/post_processor_benchmark.py
+"""
+
+import re
+import time
+import urlparse
+
+from post_processor import PostProcessor
+from url_decoder import UrlDecoder
+from url_decoder_github import GitHubCommitUrlDecoder, GitHubGistUrlDecoder, GitHubRepositoryUrlDecoder
+from url_decoder_image import ImageUrlDecoder
+from url_decoder_twitter import TwitterTimelineUrlDecoder, TwitterTweetUrlDecoder
+from url_decoder_youtube import YouTubeUrlDecoder
+
+
+_NUM_SITE_DECODERS = [0, 10, 50, 100]
+_MIN_SECONDS = 1.0
+
+
+class _SiteUrlDecoder(UrlDecoder):
+  """A decoder for the pages of one site, like most decoders."""
+
+  _PATH_REGEX = re.compile("^/\w+/(?P<id>\d+)$")
+
+  def __init__(self, site):
+    self._name = "site-%s" % site
+    self._host_prefix = "www.%s." % site
+
+  def name(self):
+    return self._name
+
+  def host_prefixes(self):
+    return (self._host_prefix,)
+
+  def can_decode_url(self, url, parsed_url):
+    if not parsed_url.netloc.startswith(self._host_prefix):
+      return False
+    elif not _SiteUrlDecoder._PATH_REGEX.match(parsed_url.path):
+      return False
+    return True
+
+
+def _get_decoders(num_site_decoders):
+  decoders = [
+    GitHubGistUrlDecoder(),
+    GitHubRepositoryUrlDecoder(None),
+    GitHubCommitUrlDecoder(None),
+    TwitterTimelineUrlDecoder(),
+    TwitterTweetUrlDecoder(),
+    YouTubeUrlDecoder(),
+  ]
+  decoders.extend(_SiteUrlDecoder("site%s" % i) for i in xrange(num_site_decoders))
+  decoders.append(ImageUrlDecoder())
+  return decoders
+
+
+def _get_parsed_urls(num_site_decoders):
+  urls = [
+    "https://github.com/mgp/sharebears",
+    "https://www.youtube.com/watch?v=abc",
+    "https://twitter.com/mgp/status/1234",
+    "http://example.com/image.jpg",
+    "http://example.com/unrecognized",
+    "http://blog.example.org/2014/10/27/post.html",
+  ]
+  urls.extend("http://www.site%s.com/page/%s" % (i, i) for i in xrange(0, num_site_decoders, 10))
+  return [(url, urlparse.urlparse(url)) for url in urls]
+
+
+def _linear_decoder_for_url(decoders, url, parsed_url):
+  for decoder in decoders:
+    if decoder.can_decode_url(url, parsed_url):
+      return decoder
+  return None
+
+
+def _urls_per_second(decoder_for_url, parsed_urls):
+  num_urls = 0
+  start_time = time.time()
+  while True:
+    for url, parsed_url in parsed_urls:
+      decoder_for_url(url, parsed_url)
+    num_urls += len(parsed_urls)
+    seconds = time.time() - start_time
+    if seconds >= _MIN_SECONDS:
+      return num_urls / seconds
+
+
+def _main():
+  for num_site_decoders in _NUM_SITE_DECODERS:
+    decoders = _get_decoders(num_site_decoders)
+    processor = PostProcessor(decoders)
+    parsed_urls = _get_parsed_urls(num_site_decoders)
+
+    linear_urls_per_second = _urls_per_second(
+        lambda url, parsed_url: _linear_decoder_for_url(decoders, url, parsed_url), parsed_urls)
+    indexed_urls_per_second = _urls_per_second(processor._decoder_for_url, parsed_urls)
+    print "decoders=%-4s linear urls/second=%-9.0f indexed urls/second=%-9.0f speedup=%.2fx" % (
+        len(decoders), linear_urls_per_second, indexed_urls_per_second,
+        indexed_urls_per_second / linear_urls_per_second)
+
+if __name__ == "__main__":
+  _main()
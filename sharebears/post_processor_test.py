@@ -1,10 +1,17 @@
+import threading
 import unittest
 import urlparse
 
 import paragraph_item
+import parser
 from post_processor import PostProcessor
 from renderable_item import RenderableItem
 from test_util import TestDecoder
+from url_decoder import UrlDecoderException
+from url_decoder_github import GitHubCommitUrlDecoder, GitHubGistUrlDecoder, GitHubRepositoryUrlDecoder
+from url_decoder_image import ImageUrlDecoder
+from url_decoder_twitter import TwitterTimelineUrlDecoder, TwitterTweetUrlDecoder
+from url_decoder_youtube import YouTubeUrlDecoder
 
 class PostProcessorTest(unittest.TestCase):
   def setUp(self):
@@ -71,6 +78,191 @@ class PostProcessorTest(unittest.TestCase):
     self._assert_recognized_url_element(processed_post.data[1], url1, self.decoder1)
     self.assertEqual(0, len(processed_post.hash_tags))
 
+  def test_process_undecodable_url(self):
+    def _decode_url(url, parsed_url):
+      raise UrlDecoderException("URL is not decodeable: %s" % url)
+    self.decoder0.decode_url = _decode_url
+
+    # Assert that the URL is processed as an unrecognized URL.
+    url0 = "http://decoder0/path0"
+    url1 = "http://decoder1/path1"
+    processed_post = self.processor.process("%s %s" % (url0, url1))
+    self.assertEqual(2, len(processed_post.data))
+    self._assert_unrecognized_url_element(processed_post.data[0], url0)
+    self._assert_recognized_url_element(processed_post.data[1], url1, self.decoder1)
+
+  def test_process_without_decoding_urls(self):
+    url0 = "http://decoder0/path0"
+    url1 = "http://url1"
+    processed_post = self.processor.process("text0 %s %s #ht0" % (url0, url1), decode_urls=False)
+    self.assertEqual(3, len(processed_post.data))
+    self._assert_text_element(processed_post.data[0], "text0")
+    self._assert_unrecognized_url_element(processed_post.data[1], url0)
+    self._assert_unrecognized_url_element(processed_post.data[2], url1)
+    self.assertSequenceEqual(["ht0"], processed_post.hash_tags)
+
+    # Assert that decoding the URLs later is like decoding them at first.
+    decoded_data = self.processor.decode_urls(processed_post.data)
+    self.assertEqual(self.processor.process("text0 %s %s" % (url0, url1)).data, decoded_data)
+    self._assert_recognized_url_element(decoded_data[1], url0, self.decoder0)
+    self._assert_unrecognized_url_element(decoded_data[2], url1)
+
+  def _make_blocking_decoder(self, name, started, unblocked):
+    """Returns a decoder that signals started and then waits for unblocked."""
+    decoder = TestDecoder(name, "http://%s" % name)
+    test_decode_url = decoder.decode_url
+    def _decode_url(url, parsed_url):
+      started.set()
+      unblocked.wait(5)
+      return test_decode_url(url, parsed_url)
+    decoder.decode_url = _decode_url
+    return decoder
+
+  def test_process_concurrently(self):
+    started0 = threading.Event()
+    started1 = threading.Event()
+    # Each decoder returns only once the other has started.
+    decoder0 = self._make_blocking_decoder("decoder0", started0, started1)
+    decoder1 = self._make_blocking_decoder("decoder1", started1, started0)
+    processor = PostProcessor([decoder0, decoder1], max_workers=2, deadline_seconds=5)
+
+    url0 = "http://decoder0/path0"
+    url1 = "http://decoder1/path1"
+    processed_post = processor.process("%s text %s http://url2" % (url0, url1))
+    self.assertEqual(4, len(processed_post.data))
+    self._assert_recognized_url_element(processed_post.data[0], url0, self.decoder0)
+    self._assert_text_element(processed_post.data[1], "text")
+    self._assert_recognized_url_element(processed_post.data[2], url1, self.decoder1)
+    self._assert_unrecognized_url_element(processed_post.data[3], "http://url2")
+    self.assertEqual(0, processor.timeouts)
+
+  def test_process_decoder_timeout(self):
+    unblocked = threading.Event()
+    decoder0 = self._make_blocking_decoder("decoder0", threading.Event(), unblocked)
+    processor = PostProcessor([decoder0, self.decoder1],
+        max_workers=2, decoder_timeout_seconds=5, timeout_seconds_by_decoder={"decoder0": 0.01})
+
+    url0 = "http://decoder0/path0"
+    url1 = "http://decoder1/path1"
+    try:
+      processed_post = processor.process("%s %s" % (url0, url1))
+    finally:
+      unblocked.set()
+    # Assert that only the URL of the slow decoder is an unrecognized URL.
+    self._assert_unrecognized_url_element(processed_post.data[0], url0)
+    self._assert_recognized_url_element(processed_post.data[1], url1, self.decoder1)
+    self.assertEqual(1, processor.timeouts)
+
+  def test_process_single_url_timeout(self):
+    unblocked = threading.Event()
+    decoder0 = self._make_blocking_decoder("decoder0", threading.Event(), unblocked)
+    processor = PostProcessor([decoder0], max_workers=2, decoder_timeout_seconds=0.01)
+
+    url0 = "http://decoder0/path0"
+    try:
+      processed_post = processor.process("text %s" % url0)
+    finally:
+      unblocked.set()
+    # Assert that the only URL, of the slow decoder, is an unrecognized URL.
+    self._assert_unrecognized_url_element(processed_post.data[1], url0)
+    self.assertEqual(1, processor.timeouts)
+
+  def test_process_deadline(self):
+    unblocked = threading.Event()
+    decoder0 = self._make_blocking_decoder("decoder0", threading.Event(), unblocked)
+    processor = PostProcessor([decoder0], max_workers=2, deadline_seconds=0.01)
+
+    urls = ["http://decoder0/path0", "http://decoder0/path1"]
+    try:
+      processed_post = processor.process(" ".join(urls))
+    finally:
+      unblocked.set()
+    self._assert_unrecognized_url_element(processed_post.data[0], urls[0])
+    self._assert_unrecognized_url_element(processed_post.data[1], urls[1])
+    self.assertEqual(2, processor.timeouts)
+
+
+  def test_process_chunks(self):
+    url0 = "http://decoder0/path0"
+    chunks = ["text0 http://deco", "der0/path0 te", "xt1 #ht0 #ht0 #h", "t1"]
+    processed_post = self.processor.process_chunks(iter(chunks))
+    self.assertEqual(3, len(processed_post.data))
+    self._assert_text_element(processed_post.data[0], "text0")
+    self._assert_recognized_url_element(processed_post.data[1], url0, self.decoder0)
+    self._assert_text_element(processed_post.data[2], "text1")
+    self.assertSequenceEqual(["ht0", "ht1"], processed_post.hash_tags)
+
+  def test_process_limits(self):
+    string = "text0 http://url1 #ht2"
+    processor = PostProcessor([self.decoder0], max_length=len(string), max_tokens=3)
+    self.assertEqual(2, len(processor.process(string).data))
+    self.assertRaises(parser.ParseLimitException, processor.process, string + " #ht3")
+    self.assertRaises(parser.ParseLimitException, processor.process, "text0 http://url1 text2 http://url3")
+
+  def _make_host_decoder(self, name, host_prefixes):
+    """Returns a decoder for the given hosts that counts its calls of can_decode_url."""
+    decoder = TestDecoder(name, "http://")
+    decoder.host_prefixes = lambda: host_prefixes
+    decoder.num_calls = 0
+    test_can_decode_url = decoder.can_decode_url
+    def _can_decode_url(url, parsed_url):
+      decoder.num_calls += 1
+      return test_can_decode_url(url, parsed_url)
+    decoder.can_decode_url = _can_decode_url
+    return decoder
+
+  def test_decoder_for_url_by_host(self):
+    any_host_decoder = self._make_host_decoder("any", None)
+    any_host_decoder.can_decode_url = lambda url, parsed_url: url.endswith(".any")
+    decoder0 = self._make_host_decoder("decoder0", ("host0.",))
+    decoder1 = self._make_host_decoder("decoder1", ("host1.example.com",))
+    decoder2 = self._make_host_decoder("decoder2", ("www.host0.",))
+    processor = PostProcessor([any_host_decoder, decoder0, decoder1, decoder2])
+
+    def _decoder_name_for_url(url):
+      decoder = processor._decoder_for_url(url, urlparse.urlparse(url))
+      return decoder.name() if decoder is not None else None
+
+    self.assertEqual("decoder0", _decoder_name_for_url("http://host0.com/path"))
+    self.assertEqual(1, decoder0.num_calls)
+    self.assertEqual("decoder2", _decoder_name_for_url("http://www.host0.org/path"))
+    self.assertEqual("decoder1", _decoder_name_for_url("http://host1.example.com/path"))
+    # Assert that a host must match a host exactly, and a host prefix by labels.
+    self.assertIsNone(_decoder_name_for_url("http://host1.example.com.au/path"))
+    self.assertIsNone(_decoder_name_for_url("http://host00.com/path"))
+    # Assert that decoders for any host are tried first if registered first.
+    self.assertEqual("any", _decoder_name_for_url("http://host0.com/image.any"))
+    self.assertEqual("any", _decoder_name_for_url("http://other.com/image.any"))
+
+    # Assert that only the decoders for the host of each URL were tried.
+    self.assertEqual(1, decoder0.num_calls)
+    self.assertEqual(1, decoder1.num_calls)
+    self.assertEqual(1, decoder2.num_calls)
+
+  def test_decoder_for_url_matches_all_decoders(self):
+    decoders = [GitHubGistUrlDecoder(), GitHubRepositoryUrlDecoder(None), GitHubCommitUrlDecoder(None),
+        ImageUrlDecoder(), TwitterTimelineUrlDecoder(), TwitterTweetUrlDecoder(), YouTubeUrlDecoder()]
+    processor = PostProcessor(decoders)
+    urls = [
+      "https://gist.github.com/mgp/1234",
+      "https://github.com/mgp/sharebears",
+      "https://github.com/mgp/sharebears/commit/0123456789abcdef",
+      "https://github.com/mgp/sharebears/image.png",
+      "https://twitter.com/mgp",
+      "https://twitter.com/mgp/status/1234",
+      "https://twitter.example.com/image.jpg",
+      "https://www.youtube.com/watch?v=abc",
+      "https://youtube.com/watch?v=abc",
+      "http://host/image.gif",
+      "http://host",
+    ]
+    # Assert that each URL has the same decoder as when trying every decoder.
+    for url in urls:
+      parsed_url = urlparse.urlparse(url)
+      expected_decoders = [decoder for decoder in decoders if decoder.can_decode_url(url, parsed_url)]
+      expected_decoder = expected_decoders[0] if expected_decoders else None
+      self.assertIs(expected_decoder, processor._decoder_for_url(url, parsed_url))
+
 
   def _assert_text_item(self, renderable_item, expected_text):
     self.assertEqual(RenderableItem.TEXT_TYPE, renderable_item.type)
@@ -0,0 +1,88 @@
+import hashlib
+
+
+class RenderedPostContent:
+  """The rendered HTML of the content of a post, and the resources it requires.
+
+  This is the same for all viewers of the post.
+  """
+
+  def __init__(self, html, resource_summary):
+    self.html = html
+    self.resource_summary = resource_summary
+
+  def __repr__(self):
+    return "RenderedPostContent(html=%r, resource_summary=%r)" % (self.html, self.resource_summary)
+
+
+class RenderedPost:
+  """A post with rendered content that is ready for rendering in a page."""
+
+  def __init__(self, id, creator, created_datetime, content, is_starred, num_stars, hash_tags):
+    self.id = id
+    self.creator = creator
+    self.created_datetime = created_datetime
+    self.content = content
+    self.is_starred = is_starred
+    self.num_stars = num_stars
+    self.hash_tags = hash_tags
+
+  def __repr__(self):
+    return "RenderedPost(id=%r, creator=%r, created=%r, content=%r, is_starred=%r, num_stars=%r, hash_tags=%r)" % (
+        self.id,
+        self.creator,
+        self.created_datetime,
+        self.content,
+        self.is_starred,
+        self.num_stars,
+        self.hash_tags)
+
+
+def with_is_starred(post, is_starred):
+  """Returns a copy of the given RenderedPost with the given starred flag."""
+  return RenderedPost(post.id,
+      post.creator,
+      post.created_datetime,
+      post.content,
+      is_starred,
+      post.num_stars,
+      post.hash_tags)
+
+
+def get_content_size(content):
+  """Returns the size of the given RenderedPostContent for an LruCache."""
+  return len(content.html)
+
+
+def _get_cache_key(post):
+  """Returns the key of the content of the given Post in the cache.
+
+  This includes a hash of the data so that content rendered from stale data is
+  never returned after a post is reprocessed.
+  """
+  data = post.data
+  if isinstance(data, unicode):
+    data = data.encode("utf-8")
+  return (post.id, hashlib.sha1(data).hexdigest())
+
+
+def get_rendered_post(cache, post, render_content):
+  """Returns a RenderedPost for the given Post.
+
+  Its RenderedPostContent is read from the given LruCache. Upon a miss, it is
+  returned by calling render_content with the post and then added to the cache.
+  """
+  cache_key = _get_cache_key(post)
+  content = cache.get(cache_key)
+  if content is None:
+    content = render_content(post)
+    cache.put(cache_key, content)
+
+  return RenderedPost(post.id,
+      post.creator,
+      post.created_datetime,
+      content,
+      post.is_starred,
+      post.num_stars,
+      post.hash_tags)
+
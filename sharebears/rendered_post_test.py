@@ -0,0 +1,70 @@
+from datetime import datetime
+import unittest
+
+from db import Post
+from lru_cache import LruCache
+import rendered_post
+from rendered_post import RenderedPostContent
+from resource_summary import ResourceSummary
+
+
+class RenderedPostTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.cache = LruCache(100, rendered_post.get_content_size)
+    self.rendered_posts = []
+
+  def _render_content(self, post):
+    self.rendered_posts.append(post)
+    return RenderedPostContent("html-%s" % post.data, ResourceSummary())
+
+  def _make_post(self, id, data, is_starred=False, num_stars=0):
+    return Post(id, "creator", datetime(2013, 9, 26), data, is_starred, num_stars, ("hash_tag",))
+
+  def _get_rendered_post(self, post):
+    return rendered_post.get_rendered_post(self.cache, post, self._render_content)
+
+
+  def test_get_rendered_post(self):
+    post = self._make_post(1, u"data\u2603", True, 2)
+    rendered = self._get_rendered_post(post)
+    self.assertEqual(1, rendered.id)
+    self.assertEqual("creator", rendered.creator)
+    self.assertEqual(datetime(2013, 9, 26), rendered.created_datetime)
+    self.assertEqual(u"html-data\u2603", rendered.content.html)
+    self.assertTrue(rendered.is_starred)
+    self.assertEqual(2, rendered.num_stars)
+    self.assertSequenceEqual(("hash_tag",), rendered.hash_tags)
+    self.assertEqual(1, self.cache.misses)
+
+  def test_content_is_cached(self):
+    self._get_rendered_post(self._make_post(1, "data"))
+    # Assert that the cached content is used for another viewer.
+    rendered = self._get_rendered_post(self._make_post(1, "data", True, 1))
+    self.assertEqual("html-data", rendered.content.html)
+    self.assertTrue(rendered.is_starred)
+    self.assertEqual(1, rendered.num_stars)
+    self.assertEqual(1, len(self.rendered_posts))
+    self.assertEqual(1, self.cache.hits)
+
+  def test_changed_data_is_rendered(self):
+    self._get_rendered_post(self._make_post(1, "data"))
+    rendered = self._get_rendered_post(self._make_post(1, "new_data"))
+    self.assertEqual("html-new_data", rendered.content.html)
+    self.assertEqual(2, len(self.rendered_posts))
+
+  def test_with_is_starred(self):
+    rendered = self._get_rendered_post(self._make_post(1, "data", False, 3))
+    starred = rendered_post.with_is_starred(rendered, True)
+    self.assertTrue(starred.is_starred)
+    self.assertFalse(rendered.is_starred)
+    self.assertEqual(1, starred.id)
+    self.assertIs(rendered.content, starred.content)
+    self.assertEqual(3, starred.num_stars)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(RenderedPostTest))
+  return suite
+
@@ -24,7 +24,7 @@ class ResourceSummary:
         self.has_github_repos)
 
 
-def _update_summary_for_renderable_item(summary, renderable_item, post_index, item_index):
+def _update_summary_for_renderable_item(summary, renderable_item, post_id, item_index):
   renderer_name = renderable_item.get_renderer_name()
   if renderer_name is None:
     return
@@ -34,27 +34,38 @@ def _update_summary_for_renderable_item(summary, renderable_item, post_index, it
   elif renderer_name == TwitterTweetUrlDecoder.name():
     summary.has_tweets = True
   elif renderer_name == YouTubeUrlDecoder.name():
-    summary.youtube_videos.append((renderable_item.item.video_id, post_index, item_index))
+    summary.youtube_videos.append((renderable_item.item.video_id, post_id, item_index))
   elif renderer_name == album_item._ALBUM_ITEM_TYPE:
     summary.has_albums = True
   elif renderer_name == GitHubRepositoryUrlDecoder.name():
     summary.has_github_repos = True
 
-def _update_summary_for_renderable_post(summary, post, post_index):
+def _update_summary_for_renderable_post(summary, post):
   for item_index, renderable_item in enumerate(post.renderable_items):
-    _update_summary_for_renderable_item(summary, renderable_item, post_index, item_index)
+    _update_summary_for_renderable_item(summary, renderable_item, post.id, item_index)
 
 
 def summary_for_renderable_post(post):
   """Returns a ResourceSummary for the given RenderablePost instance."""
   summary = ResourceSummary()
-  _update_summary_for_renderable_post(summary, post, 0)
+  _update_summary_for_renderable_post(summary, post)
   return summary
 
 def summary_for_renderable_post_sequence(post_sequence):
   """Returns a ResourceSummary for the given sequence of RenderablePost instances."""
   summary = ResourceSummary()
-  for post_index, post in enumerate(post_sequence):
-    _update_summary_for_renderable_post(summary, post, post_index)
+  for post in post_sequence:
+    _update_summary_for_renderable_post(summary, post)
   return summary
 
+def merge_summaries(summaries):
+  """Returns a ResourceSummary that merges the given ResourceSummary instances."""
+  merged_summary = ResourceSummary()
+  for summary in summaries:
+    merged_summary.has_images = merged_summary.has_images or summary.has_images
+    merged_summary.has_tweets = merged_summary.has_tweets or summary.has_tweets
+    merged_summary.youtube_videos.extend(summary.youtube_videos)
+    merged_summary.has_albums = merged_summary.has_albums or summary.has_albums
+    merged_summary.has_github_repos = merged_summary.has_github_repos or summary.has_github_repos
+  return merged_summary
+
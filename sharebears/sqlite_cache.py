@@ -0,0 +1,220 @@
+import contextlib
+import cPickle as pickle
+import os
+import sqlite3
+import threading
+import time
+
+
+class SqliteCache:
+  """A cache that stores its values in a SQLite file, so that it is shared by
+  all processes on the same host.
+
+  Once the total size of the pickled values in the file exceeds a maximum
+  size, the least recently used values are evicted. Values that were put more
+  than a given number of seconds ago are expired. Several caches with
+  different namespaces can share a file, and its maximum size.
+
+  Reads do not lock the file, because it uses a write-ahead log. The time that
+  a value was last used is updated at most once every access_resolution
+  seconds, so that most reads do not write. Writers lock the file only for the
+  duration of a short transaction.
+
+  This is safe to use from multiple threads and processes.
+  """
+
+  _SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS CacheEntries (
+      namespace TEXT NOT NULL,
+      key TEXT NOT NULL,
+      value BLOB NOT NULL,
+      size INTEGER NOT NULL,
+      expires_time REAL,
+      access_time REAL NOT NULL,
+      PRIMARY KEY (namespace, key))""",
+    "CREATE INDEX IF NOT EXISTS CacheEntriesByAccessTime ON CacheEntries (access_time)",
+    # A single row holding the total size of all values in the file.
+    "CREATE TABLE IF NOT EXISTS CacheSize (id INTEGER PRIMARY KEY, size INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO CacheSize (id, size) VALUES (0, 0)",
+  ]
+
+  def __init__(self, path, max_size,
+      namespace="", ttl_seconds=None, access_resolution=60, busy_timeout=5000, get_time=time.time):
+    self._path = path
+    self._max_size = max_size
+    self._namespace = namespace
+    self._ttl_seconds = ttl_seconds
+    self._access_resolution = access_resolution
+    self._busy_timeout = busy_timeout
+    self._get_time = get_time
+    # The connection of each thread, which is recreated after a fork.
+    self._local = threading.local()
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    connection = self._get_connection()
+    with self._transaction(connection):
+      for statement in SqliteCache._SCHEMA:
+        connection.execute(statement)
+
+  def __repr__(self):
+    return "SqliteCache(path=%r, max_size=%r, namespace=%r)" % (
+        self._path, self._max_size, self._namespace)
+
+  def __len__(self):
+    cursor = self._get_connection().execute(
+        "SELECT COUNT(*) FROM CacheEntries WHERE namespace = ?", (self._namespace,))
+    return cursor.fetchone()[0]
+
+  def _get_connection(self):
+    pid = os.getpid()
+    connection = getattr(self._local, "connection", None)
+    if (connection is None) or (self._local.pid != pid):
+      # Manage transactions explicitly instead of through the sqlite3 module.
+      connection = sqlite3.connect(self._path,
+          timeout=self._busy_timeout / 1000.0, isolation_level=None)
+      connection.text_factory = str
+      connection.execute("PRAGMA journal_mode=WAL")
+      connection.execute("PRAGMA synchronous=NORMAL")
+      self._local.connection = connection
+      self._local.pid = pid
+    return connection
+
+  @contextlib.contextmanager
+  def _transaction(self, connection):
+    # Acquire the write lock immediately to avoid deadlocking with other writers.
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+      yield
+    except:
+      connection.execute("ROLLBACK")
+      raise
+    connection.execute("COMMIT")
+
+  @staticmethod
+  def _get_key(key):
+    return repr(key)
+
+  def get(self, key, default=None):
+    """Returns the value for the given key, or default if it is not cached."""
+    connection = self._get_connection()
+    cache_key = SqliteCache._get_key(key)
+    row = connection.execute(
+        "SELECT value, expires_time, access_time FROM CacheEntries WHERE namespace = ? AND key = ?",
+        (self._namespace, cache_key)).fetchone()
+    now = self._get_time()
+    if (row is None) or ((row[1] is not None) and (row[1] <= now)):
+      self.misses += 1
+      return default
+
+    value, expires_time, access_time = row
+    if now - access_time >= self._access_resolution:
+      # This does not need a transaction, and a lost update is harmless.
+      try:
+        connection.execute(
+            "UPDATE CacheEntries SET access_time = ? WHERE namespace = ? AND key = ?",
+            (now, self._namespace, cache_key))
+      except sqlite3.OperationalError:
+        # Another writer held the lock for longer than the busy timeout.
+        pass
+    self.hits += 1
+    return pickle.loads(str(value))
+
+  def _remove_entry(self, connection, cache_key):
+    row = connection.execute(
+        "SELECT size FROM CacheEntries WHERE namespace = ? AND key = ?",
+        (self._namespace, cache_key)).fetchone()
+    if row is not None:
+      connection.execute(
+          "DELETE FROM CacheEntries WHERE namespace = ? AND key = ?",
+          (self._namespace, cache_key))
+      connection.execute("UPDATE CacheSize SET size = size - ?", (row[0],))
+
+  def _evict_entries(self, connection, now):
+    # Remove all expired values, across all namespaces.
+    size, count = connection.execute(
+        "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM CacheEntries WHERE expires_time <= ?",
+        (now,)).fetchone()
+    if count:
+      connection.execute("DELETE FROM CacheEntries WHERE expires_time <= ?", (now,))
+      connection.execute("UPDATE CacheSize SET size = size - ?", (size,))
+
+    # Remove the least recently used values until the total size is small enough.
+    total_size = connection.execute("SELECT size FROM CacheSize").fetchone()[0]
+    excess_size = total_size - self._max_size
+    if excess_size <= 0:
+      return
+
+    evicted_rowids = []
+    evicted_size = 0
+    cursor = connection.execute(
+        "SELECT rowid, size FROM CacheEntries ORDER BY access_time")
+    for rowid, size in cursor:
+      evicted_rowids.append((rowid,))
+      evicted_size += size
+      if evicted_size >= excess_size:
+        break
+    cursor.close()
+    connection.executemany("DELETE FROM CacheEntries WHERE rowid = ?", evicted_rowids)
+    connection.execute("UPDATE CacheSize SET size = size - ?", (evicted_size,))
+    self.evictions += len(evicted_rowids)
+
+  def put(self, key, value):
+    """Caches the given value for the given key.
+
+    If the pickled value is larger than the maximum size, then it is not cached.
+    """
+    pickled_value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    size = len(pickled_value)
+    now = self._get_time()
+    expires_time = (now + self._ttl_seconds) if self._ttl_seconds is not None else None
+    cache_key = SqliteCache._get_key(key)
+
+    connection = self._get_connection()
+    with self._transaction(connection):
+      self._remove_entry(connection, cache_key)
+      if size > self._max_size:
+        return
+
+      connection.execute(
+          "INSERT INTO CacheEntries (namespace, key, value, size, expires_time, access_time) "
+          "VALUES (?, ?, ?, ?, ?, ?)",
+          (self._namespace, cache_key, sqlite3.Binary(pickled_value), size, expires_time, now))
+      connection.execute("UPDATE CacheSize SET size = size + ?", (size,))
+      self._evict_entries(connection, now)
+
+  def remove(self, key):
+    """Removes the value for the given key, if any."""
+    connection = self._get_connection()
+    with self._transaction(connection):
+      self._remove_entry(connection, SqliteCache._get_key(key))
+
+  def clear(self):
+    """Removes all values in the namespace of this cache."""
+    connection = self._get_connection()
+    with self._transaction(connection):
+      size = connection.execute(
+          "SELECT COALESCE(SUM(size), 0) FROM CacheEntries WHERE namespace = ?",
+          (self._namespace,)).fetchone()[0]
+      connection.execute("DELETE FROM CacheEntries WHERE namespace = ?", (self._namespace,))
+      connection.execute("UPDATE CacheSize SET size = size - ?", (size,))
+
+  def get_stats(self):
+    """Returns a dictionary of statistics for this cache.
+
+    The hits, misses and evictions are those of this process only.
+    """
+    connection = self._get_connection()
+    entries, size = connection.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM CacheEntries WHERE namespace = ?",
+        (self._namespace,)).fetchone()
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "evictions": self.evictions,
+      "entries": entries,
+      "size": size,
+      "max_size": self._max_size,
+    }
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlite_cache import SqliteCache
+
+
+class SqliteCacheTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.temp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.temp_dir, "cache.db")
+    self.now = 1000.0
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+    unittest.TestCase.tearDown(self)
+
+
+  def _get_time(self):
+    return self.now
+
+  def _make_cache(self, max_size=1000, **kwargs):
+    return SqliteCache(self.path, max_size, get_time=self._get_time, **kwargs)
+
+  def test_get_missing(self):
+    cache = self._make_cache()
+    self.assertIsNone(cache.get("key"))
+    self.assertEqual("default", cache.get("key", "default"))
+    self.assertEqual(2, cache.misses)
+
+  def test_put_and_get(self):
+    cache = self._make_cache()
+    cache.put((1, "hash"), {"html": u"value\u2603"})
+    cache.put(2, ["value2"])
+    self.assertEqual({"html": u"value\u2603"}, cache.get((1, "hash")))
+    self.assertEqual(["value2"], cache.get(2))
+    self.assertEqual(2, len(cache))
+    self.assertEqual(2, cache.hits)
+
+    # Replacing a value does not add an entry.
+    cache.put(2, ["new_value2"])
+    self.assertEqual(["new_value2"], cache.get(2))
+    self.assertEqual(2, len(cache))
+
+  def test_shared_by_caches(self):
+    cache1 = self._make_cache()
+    cache2 = self._make_cache()
+    cache1.put("key", "value")
+    self.assertEqual("value", cache2.get("key"))
+    cache2.remove("key")
+    self.assertIsNone(cache1.get("key"))
+
+  def test_shared_by_processes(self):
+    cache = self._make_cache()
+    pid = os.fork()
+    if pid == 0:
+      # The child process opens its own connection.
+      try:
+        cache.put("key", "child_value")
+      finally:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    self.assertEqual("child_value", cache.get("key"))
+
+  def test_namespaces(self):
+    cache1 = self._make_cache(namespace="namespace1")
+    cache2 = self._make_cache(namespace="namespace2")
+    cache1.put("key", "value1")
+    cache2.put("key", "value2")
+    self.assertEqual("value1", cache1.get("key"))
+    self.assertEqual("value2", cache2.get("key"))
+
+    cache1.clear()
+    self.assertIsNone(cache1.get("key"))
+    self.assertEqual("value2", cache2.get("key"))
+    self.assertEqual(0, cache1.get_stats()["entries"])
+    self.assertEqual(1, cache2.get_stats()["entries"])
+
+  def test_evicts_least_recently_used(self):
+    cache = self._make_cache(access_resolution=0)
+    cache.put("key1", "v" * 100)
+    size = cache.get_stats()["size"]
+    cache = self._make_cache(max_size=3 * size, access_resolution=0)
+    self.now += 1
+    cache.put("key2", "v" * 100)
+    self.now += 1
+    cache.put("key3", "v" * 100)
+    # Use the first key so that the second key is the least recently used.
+    self.now += 1
+    cache.get("key1")
+    self.now += 1
+    cache.put("key4", "v" * 100)
+
+    self.assertIsNone(cache.get("key2"))
+    for key in ("key1", "key3", "key4"):
+      self.assertIsNotNone(cache.get(key))
+    self.assertEqual(1, cache.evictions)
+    self.assertEqual(3 * size, cache.get_stats()["size"])
+
+  def test_access_resolution(self):
+    cache = self._make_cache(access_resolution=60)
+    cache.put("key1", "v" * 100)
+    size = cache.get_stats()["size"]
+    cache = self._make_cache(max_size=2 * size, access_resolution=60)
+    self.now += 1
+    cache.put("key2", "v" * 100)
+    # This read is too soon after the write to update the access time.
+    self.now += 1
+    cache.get("key1")
+    cache.put("key3", "v" * 100)
+    self.assertIsNone(cache.get("key1"))
+    self.assertIsNotNone(cache.get("key2"))
+
+  def test_ttl(self):
+    cache = self._make_cache(ttl_seconds=60)
+    cache.put("key1", "value1")
+    self.now += 30
+    cache.put("key2", "value2")
+    self.now += 30
+    self.assertIsNone(cache.get("key1"))
+    self.assertEqual("value2", cache.get("key2"))
+
+    # Putting a value removes all expired values.
+    cache.put("key3", "value3")
+    self.assertEqual(2, len(cache))
+
+  def test_value_too_large(self):
+    cache = self._make_cache(max_size=50)
+    cache.put("key1", "v1")
+    cache.put("key2", "v" * 100)
+    self.assertIsNone(cache.get("key2"))
+    self.assertEqual("v1", cache.get("key1"))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(SqliteCacheTest))
+  return suite
+
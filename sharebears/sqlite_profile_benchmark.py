@@ -0,0 +1,86 @@
+"""Measures the latency of reading posts while another thread stars and
+unstars posts, with and without the SQLite performance profile.
+
+Run with: python sharebears/sqlite_profile_benchmark.py
+"""
+
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import db
+import db_schema
+import db_util
+
+
+_NUM_POSTS = 200
+_NUM_READS = 300
+
+
+def _add_posts():
+  now = datetime(2014, 10, 27)
+  return [db.add_post("user_id", "data%s" % i, ["hash_tag"], now=now + timedelta(seconds=i))
+      for i in xrange(_NUM_POSTS)]
+
+
+def _write_stars(post_ids, stop_event):
+  """Stars and unstars posts until the given event is set."""
+  i = 0
+  while not stop_event.is_set():
+    post_id = post_ids[i % len(post_ids)]
+    user_id = "user_id%s" % (i % 7)
+    db.star_post(user_id, post_id)
+    db.unstar_post(user_id, post_id)
+    i += 1
+
+
+def _read_latencies():
+  latencies = []
+  for i in xrange(_NUM_READS):
+    start_time = time.time()
+    db.get_posts("client_id")
+    latencies.append(time.time() - start_time)
+  latencies.sort()
+  return latencies
+
+
+def _percentile_ms(sorted_latencies, percentile):
+  index = min(len(sorted_latencies) - 1, int(len(sorted_latencies) * percentile))
+  return 1000 * sorted_latencies[index]
+
+
+def _run(description, sqlite_profile):
+  temp_dir = tempfile.mkdtemp()
+  try:
+    database_uri = "sqlite:///%s" % os.path.join(temp_dir, "benchmark.db")
+    engine = db_util.init_db("sqlite", database_uri, sqlite_profile)
+    db_schema.create_all_tables(engine)
+    post_ids = _add_posts()
+
+    stop_event = threading.Event()
+    writer = threading.Thread(target=_write_stars, args=(post_ids, stop_event))
+    writer.start()
+    try:
+      latencies = _read_latencies()
+    finally:
+      stop_event.set()
+      writer.join()
+    print "%-8s p50=%.3fms p90=%.3fms p99=%.3fms" % (description,
+        _percentile_ms(latencies, 0.5),
+        _percentile_ms(latencies, 0.9),
+        _percentile_ms(latencies, 0.99))
+    engine.dispose()
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+def _main():
+  _run("default", None)
+  _run("profile", db_util.SqliteProfile())
+
+if __name__ == "__main__":
+  _main()
+
@@ -0,0 +1,71 @@
+"""Measures the throughput of many threads starring the same post, when
+updating num_stars directly and when recording star count deltas.
+
+Run with: python sharebears/star_storm_benchmark.py
+"""
+
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import db
+from db_schema import Post as MappedPost, Posts, StarredPost as MappedStarredPost
+import db_schema
+import db_util
+
+
+_NUM_THREADS = 8
+_NUM_STARS_PER_THREAD = 100
+
+
+@db_util.use_session
+def _star_post_with_update(session, user_id, post_id):
+  """Stars the post by updating its num_stars value directly."""
+  session.add(MappedStarredPost(post_id=post_id, user_id=user_id, starred_datetime=datetime.utcnow()))
+  session.flush()
+  session.execute(Posts.update()
+      .where(MappedPost.id == post_id)
+      .values({MappedPost.num_stars: MappedPost.num_stars + 1}))
+  session.commit()
+
+
+def _star_storm(star_post, post_id, thread_index):
+  for i in xrange(_NUM_STARS_PER_THREAD):
+    star_post("user_id%s-%s" % (thread_index, i), post_id)
+
+
+def _run(description, star_post):
+  temp_dir = tempfile.mkdtemp()
+  try:
+    database_uri = "sqlite:///%s" % os.path.join(temp_dir, "benchmark.db")
+    engine = db_util.init_db("sqlite", database_uri, db_util.SqliteProfile())
+    db_schema.create_all_tables(engine)
+    post_id = db.add_post("user_id", "data", ["hash_tag"])
+
+    threads = [threading.Thread(target=_star_storm, args=(star_post, post_id, thread_index))
+        for thread_index in xrange(_NUM_THREADS)]
+    start_time = time.time()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    seconds = time.time() - start_time
+
+    num_stars = db.get_post("client_id", post_id).num_stars
+    assert num_stars == _NUM_THREADS * _NUM_STARS_PER_THREAD
+    print "%-8s stars/second=%.0f" % (description, num_stars / seconds)
+    engine.dispose()
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+def _main():
+  _run("update", _star_post_with_update)
+  _run("deltas", db.star_post)
+
+if __name__ == "__main__":
+  _main()
+
@@ -0,0 +1,51 @@
+"""Measures the per-call overhead of the hot read functions in db when building
+and compiling their statements for each call, as before, and when reusing the
+cached statements.
+
+Run with: python sharebears/statement_cache_benchmark.py
+"""
+
+from datetime import datetime, timedelta
+import timeit
+
+import db
+import db_schema
+import db_util
+
+
+_NUM_CALLS = 2000
+
+
+def _clear_statement_cache():
+  db._statements.clear()
+  db._compiled_cache.clear()
+
+
+def _main():
+  engine = db_util.init_db("sqlite", "sqlite://")
+  db_schema.create_all_tables(engine)
+  now = datetime(2014, 10, 27)
+  result = db.add_posts([db.NewPost("user_id", "data%s" % i, ["hash_tag"], now + timedelta(seconds=i))
+      for i in xrange(3)])
+  post_id = result.post_ids[0]
+  cursor = db.get_posts("client_id", page_size=1).next_cursor
+
+  calls = [
+    ("get_post", lambda: db.get_post("client_id", post_id)),
+    ("get_posts", lambda: db.get_posts("client_id", before=cursor)),
+    ("get_posts_by_user", lambda: db.get_posts_by_user("client_id", "user_id")),
+    ("get_posts_with_hashtag", lambda: db.get_posts_with_hashtag("client_id", "hash_tag")),
+  ]
+  for name, call in calls:
+    def _call_uncached():
+      _clear_statement_cache()
+      call()
+    uncached_seconds = timeit.timeit(_call_uncached, number=_NUM_CALLS)
+    cached_seconds = timeit.timeit(call, number=_NUM_CALLS)
+    print "%-24s uncached=%.1fus/call cached=%.1fus/call" % (name,
+        1e6 * uncached_seconds / _NUM_CALLS,
+        1e6 * cached_seconds / _NUM_CALLS)
+
+if __name__ == "__main__":
+  _main()
+
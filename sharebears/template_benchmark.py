@@ -0,0 +1,53 @@
+"""Measures the time for a freshly started worker to load all templates, which
+its first requests would otherwise pay for: when compiling them from source, as
+before, and when loading them from a bytecode cache filled by
+"make compile-templates".
+
+Run with: python sharebears/template_benchmark.py
+"""
+
+import shutil
+import tempfile
+import timeit
+
+import flask
+
+import filters
+import template_cache
+
+
+_NUM_STARTS = 20
+
+
+def _start_worker(bytecode_cache_dir):
+  """Returns the Jinja environment of a new app with all templates loaded."""
+  app = flask.Flask(__name__)
+  app.config["DEBUG"] = False
+  app.config["JINJA_TRIM_BLOCKS"] = True
+  app.config["JINJA_BYTECODE_CACHE_DIR"] = bytecode_cache_dir
+  template_cache.configure_jinja_options(app)
+  filters.add_to_environment(app.jinja_env)
+  template_cache.precompile_templates(app.jinja_env)
+  return app.jinja_env
+
+
+def _main():
+  bytecode_cache_dir = tempfile.mkdtemp()
+  try:
+    compile_seconds = timeit.timeit(lambda: _start_worker(None), number=_NUM_STARTS)
+    # Fill the bytecode cache, like the build step.
+    environment = _start_worker(bytecode_cache_dir)
+    bytecode_cache_seconds = timeit.timeit(
+        lambda: _start_worker(bytecode_cache_dir), number=_NUM_STARTS)
+    # Measure loading a template that a started worker already loaded.
+    loaded_seconds = timeit.timeit(
+        lambda: environment.get_template("post_sequence.html"), number=_NUM_STARTS)
+  finally:
+    shutil.rmtree(bytecode_cache_dir)
+
+  print "%-32s %.2fms/start" % ("compile from source", 1e3 * compile_seconds / _NUM_STARTS)
+  print "%-32s %.2fms/start" % ("load from bytecode cache", 1e3 * bytecode_cache_seconds / _NUM_STARTS)
+  print "%-32s %.3fms/lookup" % ("already loaded", 1e3 * loaded_seconds / _NUM_STARTS)
+
+if __name__ == "__main__":
+  _main()
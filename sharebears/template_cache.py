@@ -0,0 +1,30 @@
+import jinja2
+
+
+def configure_jinja_options(app):
+  """Configures how the Jinja environment of the given app loads templates.
+
+  This must be called before the jinja_env attribute of the app is first used.
+  """
+  options = dict(app.jinja_options)
+  options["trim_blocks"] = app.config["JINJA_TRIM_BLOCKS"]
+  # Check whether each template changed on disk only while debugging.
+  options["auto_reload"] = app.config["DEBUG"]
+  bytecode_cache_dir = app.config["JINJA_BYTECODE_CACHE_DIR"]
+  if bytecode_cache_dir:
+    # Compiled templates are shared by all workers, and by restarts.
+    options["bytecode_cache"] = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+  app.jinja_options = options
+
+
+def precompile_templates(environment):
+  """Loads every HTML template of the given Jinja environment, so that none is
+  compiled while serving a request.
+
+  If the environment has a bytecode cache, then this also fills it. Returns the
+  names of the templates.
+  """
+  names = environment.list_templates(extensions=["html"])
+  for name in names:
+    environment.get_template(name)
+  return names
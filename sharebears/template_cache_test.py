@@ -0,0 +1,63 @@
+import flask
+import os
+import shutil
+import tempfile
+import unittest
+
+import filters
+import template_cache
+
+
+class TemplateCacheTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+    unittest.TestCase.tearDown(self)
+
+
+  def _make_app(self, debug, bytecode_cache_dir=None):
+    # The app uses the templates in the same directory as this test.
+    app = flask.Flask(__name__)
+    app.config["DEBUG"] = debug
+    app.config["JINJA_TRIM_BLOCKS"] = True
+    app.config["JINJA_BYTECODE_CACHE_DIR"] = bytecode_cache_dir
+    template_cache.configure_jinja_options(app)
+    filters.add_to_environment(app.jinja_env)
+    return app
+
+  def test_options(self):
+    app = self._make_app(True)
+    self.assertTrue(app.jinja_env.auto_reload)
+    self.assertTrue(app.jinja_env.trim_blocks)
+    self.assertIsNone(app.jinja_env.bytecode_cache)
+
+    app = self._make_app(False, self.temp_dir)
+    self.assertFalse(app.jinja_env.auto_reload)
+    self.assertIsNotNone(app.jinja_env.bytecode_cache)
+
+  def test_precompile_templates(self):
+    app = self._make_app(False, self.temp_dir)
+    names = template_cache.precompile_templates(app.jinja_env)
+    self.assertIn("layout.html", names)
+    self.assertIn("render_item_macro.html", names)
+    self.assertEqual(len(os.listdir(os.path.join(os.path.dirname(__file__), "templates"))), len(names))
+    # Assert that every template is in the bytecode cache.
+    self.assertEqual(len(names), len(os.listdir(self.temp_dir)))
+
+    # Assert that another app loads the templates from the bytecode cache.
+    app = self._make_app(False, self.temp_dir)
+    bytecode_cache = app.jinja_env.bytecode_cache
+    def _dump_bytecode(bucket):
+      self.fail("Compiled template %s" % bucket.key)
+    bytecode_cache.dump_bytecode = _dump_bytecode
+    template_cache.precompile_templates(app.jinja_env)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(TemplateCacheTest))
+  return suite
+
@@ -6,6 +6,9 @@ class TestDecoder:
   def name(self):
     return self._name
 
+  def host_prefixes(self):
+    return None
+
   def can_decode_url(self, url, parsed_url):
     return url.startswith(self._matched_url_prefix)
 
@@ -0,0 +1,151 @@
+import collections
+import threading
+import time
+
+
+class _Build:
+  """A rebuild of a page that concurrent misses on the same page wait for."""
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.page = None
+
+
+class TimelinePageCache:
+  """A cache of the pages of a timeline that are the same for every user.
+
+  Each page is a PaginatedSequence whose items have an id attribute. A page is
+  invalidated when any of its items is invalidated, when all pages are
+  invalidated, or once it is older than a given number of seconds. When several
+  threads miss on the same page, only one rebuilds it while the others wait.
+
+  This is safe to use from multiple threads.
+  """
+
+  def __init__(self, max_entries, ttl_seconds, get_time=time.time):
+    self._max_entries = max_entries
+    self._ttl_seconds = ttl_seconds
+    self._get_time = get_time
+    # Maps each key to its page and the time it was built, from least to most
+    # recently used.
+    self._entries = collections.OrderedDict()
+    # Maps each item identifier to the keys of the cached pages containing it.
+    self._keys_by_item_id = collections.defaultdict(set)
+    # Maps each key to the _Build of its page, if one is in progress.
+    self._builds = {}
+    # Incremented by each invalidation, so that a page built concurrently with
+    # an invalidation is not cached.
+    self._generation = 0
+    self._lock = threading.Lock()
+
+    self.hits = 0
+    self.misses = 0
+    self.coalesced_misses = 0
+    self.invalidations = 0
+
+  def __len__(self):
+    return len(self._entries)
+
+  def _remove_entry(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is None:
+      return
+    page, build_time = entry
+    for item in page.items:
+      keys = self._keys_by_item_id.get(item.id)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self._keys_by_item_id[item.id]
+
+  def _get_entry(self, key):
+    entry = self._entries.get(key)
+    if entry is None:
+      return None
+    page, build_time = entry
+    if self._get_time() - build_time >= self._ttl_seconds:
+      self._remove_entry(key)
+      return None
+    # Reinsert the entry so that it is the most recently used.
+    self._entries[key] = self._entries.pop(key)
+    return page
+
+  def _put_entry(self, key, page, build_time):
+    self._remove_entry(key)
+    self._entries[key] = (page, build_time)
+    for item in page.items:
+      self._keys_by_item_id[item.id].add(key)
+    while len(self._entries) > self._max_entries:
+      evicted_key = next(iter(self._entries))
+      self._remove_entry(evicted_key)
+
+  def get_page(self, key, build_page, is_cacheable=None):
+    """Returns the page for the given key.
+
+    Upon a miss, it is returned by calling build_page and then added to the
+    cache, unless it was invalidated while it was built, or unless is_cacheable
+    is not None and returns False for it.
+    """
+    while True:
+      with self._lock:
+        page = self._get_entry(key)
+        if page is not None:
+          self.hits += 1
+          return page
+
+        build = self._builds.get(key)
+        if build is None:
+          # This thread rebuilds the page.
+          self.misses += 1
+          build = _Build()
+          self._builds[key] = build
+          generation = self._generation
+          break
+        self.coalesced_misses += 1
+
+      # Wait for the thread rebuilding the page.
+      build.done.wait()
+      if build.page is not None:
+        return build.page
+      # Building the page failed, so try again.
+
+    build_time = self._get_time()
+    try:
+      page = build_page()
+      build.page = page
+    finally:
+      with self._lock:
+        del self._builds[key]
+        if ((build.page is not None) and (generation == self._generation) and
+            ((is_cacheable is None) or is_cacheable(page))):
+          self._put_entry(key, page, build_time)
+      build.done.set()
+    return page
+
+  def invalidate_item(self, item_id):
+    """Removes every page containing the item with the given identifier."""
+    with self._lock:
+      self._generation += 1
+      self.invalidations += 1
+      for key in list(self._keys_by_item_id.get(item_id, ())):
+        self._remove_entry(key)
+
+  def invalidate_all(self):
+    """Removes every page."""
+    with self._lock:
+      self._generation += 1
+      self.invalidations += 1
+      self._entries.clear()
+      self._keys_by_item_id.clear()
+
+  def get_stats(self):
+    """Returns a dictionary of statistics for this cache."""
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "coalesced_misses": self.coalesced_misses,
+        "invalidations": self.invalidations,
+        "entries": len(self._entries),
+        "max_entries": self._max_entries,
+      }
@@ -0,0 +1,140 @@
+import threading
+import time
+import unittest
+
+from db import PaginatedSequence
+from timeline_cache import TimelinePageCache
+
+
+class _Item:
+  def __init__(self, id):
+    self.id = id
+
+
+class TimelinePageCacheTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.now = 1000.0
+    self.cache = TimelinePageCache(2, 60, get_time=self._get_time)
+    self.num_builds = 0
+
+  def _get_time(self):
+    return self.now
+
+  def _build_page(self, *item_ids):
+    def build_page():
+      self.num_builds += 1
+      return PaginatedSequence([_Item(item_id) for item_id in item_ids])
+    return build_page
+
+
+  def test_page_is_cached(self):
+    page = self.cache.get_page("key", self._build_page(1, 2))
+    self.assertSequenceEqual([1, 2], [item.id for item in page])
+    self.assertIs(page, self.cache.get_page("key", self._build_page(1, 2)))
+    self.assertEqual(1, self.num_builds)
+    stats = self.cache.get_stats()
+    self.assertEqual(1, stats["hits"])
+    self.assertEqual(1, stats["misses"])
+
+  def test_ttl(self):
+    self.cache.get_page("key", self._build_page(1))
+    self.now += 59
+    self.cache.get_page("key", self._build_page(1))
+    self.assertEqual(1, self.num_builds)
+    self.now += 1
+    self.cache.get_page("key", self._build_page(1))
+    self.assertEqual(2, self.num_builds)
+
+  def test_evicts_least_recently_used(self):
+    self.cache.get_page("key1", self._build_page(1))
+    self.cache.get_page("key2", self._build_page(2))
+    # Use the first key so that the second key is the least recently used.
+    self.cache.get_page("key1", self._build_page(1))
+    self.cache.get_page("key3", self._build_page(3))
+    self.assertEqual(2, len(self.cache))
+    self.cache.get_page("key1", self._build_page(1))
+    self.assertEqual(3, self.num_builds)
+    self.cache.get_page("key2", self._build_page(2))
+    self.assertEqual(4, self.num_builds)
+
+  def test_invalidate_item(self):
+    self.cache.get_page("key1", self._build_page(1, 2))
+    self.cache.get_page("key2", self._build_page(3, 4))
+    self.cache.invalidate_item(2)
+    self.assertEqual(1, len(self.cache))
+    self.cache.get_page("key2", self._build_page(3, 4))
+    self.assertEqual(2, self.num_builds)
+    self.cache.get_page("key1", self._build_page(1, 2))
+    self.assertEqual(3, self.num_builds)
+    # Invalidating an item on no page does nothing.
+    self.cache.invalidate_item(5)
+    self.assertEqual(2, len(self.cache))
+
+  def test_invalidate_all(self):
+    self.cache.get_page("key1", self._build_page(1))
+    self.cache.get_page("key2", self._build_page(2))
+    self.cache.invalidate_all()
+    self.assertEqual(0, len(self.cache))
+    self.assertEqual(1, self.cache.get_stats()["invalidations"])
+
+  def test_invalidate_during_build(self):
+    def build_page():
+      self.cache.invalidate_item(1)
+      return PaginatedSequence([_Item(1)])
+    page = self.cache.get_page("key", build_page)
+    self.assertEqual(1, len(page))
+    # The page may be stale, so it is not cached.
+    self.assertEqual(0, len(self.cache))
+
+  def test_not_cacheable(self):
+    is_cacheable = lambda page: page[0].id != 1
+    self.cache.get_page("key1", self._build_page(1), is_cacheable)
+    self.cache.get_page("key2", self._build_page(2), is_cacheable)
+    self.assertIsNone(self.cache._get_entry("key1"))
+    self.assertIsNotNone(self.cache._get_entry("key2"))
+
+  def test_build_fails(self):
+    def build_page():
+      raise ValueError()
+    self.assertRaises(ValueError, self.cache.get_page, "key", build_page)
+    self.cache.get_page("key", self._build_page(1))
+    self.assertEqual(1, len(self.cache))
+
+  def test_coalesces_concurrent_misses(self):
+    build_started = threading.Event()
+    finish_build = threading.Event()
+    def build_page():
+      self.num_builds += 1
+      build_started.set()
+      finish_build.wait()
+      return PaginatedSequence([_Item(1)])
+
+    pages = []
+    def get_page():
+      pages.append(self.cache.get_page("key", build_page))
+    threads = [threading.Thread(target=get_page)]
+    threads[0].start()
+    build_started.wait()
+    for i in xrange(3):
+      thread = threading.Thread(target=get_page)
+      thread.start()
+      threads.append(thread)
+    # Wait for the other threads to find the build in progress.
+    while self.cache.get_stats()["coalesced_misses"] < 3:
+      time.sleep(0.001)
+    finish_build.set()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(1, self.num_builds)
+    self.assertEqual(4, len(pages))
+    for page in pages:
+      self.assertIs(pages[0], page)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(TimelinePageCacheTest))
+  return suite
+
@@ -0,0 +1,76 @@
+"""Measures the rows per second of reading a timeline using the ORM, as before,
+and using the SQLAlchemy Core rows of db.get_posts.
+
+Run with: python sharebears/timeline_read_benchmark.py
+"""
+
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+import sqlalchemy.orm as sa_orm
+import time
+
+import db
+from db_schema import Post as MappedPost, StarredPost as MappedStarredPost
+import db_schema
+import db_util
+
+
+_NUM_POSTS = [100, 1000, 10000]
+_MIN_SECONDS = 1.0
+
+
+@db_util.use_session
+def _get_posts_with_orm(session, client_id, page_size):
+  """Reads posts by creating ORM instances, and then copying them into Posts."""
+  results = session.query(MappedPost, MappedStarredPost, db._get_star_count_delta(MappedPost.id))\
+      .options(sa_orm.subqueryload(MappedPost.hash_tags))\
+      .outerjoin(MappedStarredPost, sa.and_(
+        MappedStarredPost.post_id == MappedPost.id,
+        MappedStarredPost.user_id == client_id))\
+      .order_by(MappedPost.created_datetime.desc(), MappedPost.id.desc())\
+      .limit(page_size)
+  return tuple(db.Post(mapped_post.id,
+        mapped_post.creator,
+        mapped_post.created_datetime,
+        mapped_post.data,
+        bool(starred_post),
+        mapped_post.num_stars + star_count_delta,
+        tuple(mapped_hash_tag.value for mapped_hash_tag in mapped_post.hash_tags))
+      for mapped_post, starred_post, star_count_delta in results)
+
+
+def _get_posts_with_core(client_id, page_size):
+  return db.get_posts(client_id, page_size=page_size).items
+
+
+def _rows_per_second(get_posts, num_posts):
+  num_rows = 0
+  start_time = time.time()
+  while True:
+    num_rows += len(get_posts("user_id0", num_posts))
+    seconds = time.time() - start_time
+    if seconds >= _MIN_SECONDS:
+      return num_rows / seconds
+
+
+def _main():
+  for num_posts in _NUM_POSTS:
+    engine = db_util.init_db("sqlite", "sqlite://")
+    db_schema.create_all_tables(engine)
+    now = datetime(2014, 10, 27)
+    result = db.add_posts([db.NewPost("user_id%s" % (i % 10), "data%s" % i,
+          ["hash_tag%s" % (i % 3), "hash_tag%s" % (i % 5)], now + timedelta(seconds=i))
+        for i in xrange(num_posts)])
+    for post_id in result.post_ids[::2]:
+      db.star_post("user_id0", post_id)
+
+    orm_rows_per_second = _rows_per_second(_get_posts_with_orm, num_posts)
+    core_rows_per_second = _rows_per_second(_get_posts_with_core, num_posts)
+    print "posts=%-6s orm rows/second=%-8.0f core rows/second=%-8.0f speedup=%.2fx" % (
+        num_posts, orm_rows_per_second, core_rows_per_second,
+        core_rows_per_second / orm_rows_per_second)
+    db_schema.drop_all_tables(engine)
+
+if __name__ == "__main__":
+  _main()
+
@@ -17,6 +17,16 @@ class UrlDecoder:
   def name():
     raise NotImplementedError
 
+  @staticmethod
+  def host_prefixes():
+    """Returns the hosts of the URLs that can_decode_url may accept, or None if
+    it may accept URLs with any host.
+
+    Each is either a host, which matches only that host, or a prefix ending with
+    a dot, which matches any host that starts with it.
+    """
+    return None
+
   @staticmethod
   def can_decode_url(url, parsed_url):
     raise NotImplementedError
@@ -0,0 +1,147 @@
+import threading
+import time
+
+from lru_cache import LruCache
+from url_decoder import UrlDecoderException
+
+
+class UrlDecoderUnavailableException(UrlDecoderException):
+  """An exception raised when the upstream service of a URL decoder is unhealthy."""
+  pass
+
+
+class CircuitBreaker:
+  """Stops calls to an unhealthy upstream service.
+
+  After a number of consecutive failures, the breaker opens and rejects all
+  calls for a number of seconds. It then allows one trial call: if it succeeds
+  then the breaker closes, and if it fails then the breaker opens again.
+
+  This is safe to use from multiple threads.
+  """
+
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half-open"
+
+  def __init__(self, failure_threshold, reset_seconds, get_time=time.time):
+    self._failure_threshold = failure_threshold
+    self._reset_seconds = reset_seconds
+    self._get_time = get_time
+    self._state = CircuitBreaker.CLOSED
+    self._opened_time = None
+    self._consecutive_failures = 0
+    self._lock = threading.Lock()
+
+    self.times_opened = 0
+    self.rejected_calls = 0
+
+  def get_state(self):
+    with self._lock:
+      return self._state
+
+  def allow_call(self):
+    """Returns whether a call to the upstream service should be made."""
+    with self._lock:
+      if self._state == CircuitBreaker.CLOSED:
+        return True
+      elif (self._state == CircuitBreaker.OPEN and
+          self._get_time() - self._opened_time >= self._reset_seconds):
+        # Allow only this call until it succeeds or fails.
+        self._state = CircuitBreaker.HALF_OPEN
+        return True
+      self.rejected_calls += 1
+      return False
+
+  def record_success(self):
+    """Records that a call to the upstream service succeeded."""
+    with self._lock:
+      self._state = CircuitBreaker.CLOSED
+      self._consecutive_failures = 0
+
+  def record_failure(self):
+    """Records that a call to the upstream service failed."""
+    with self._lock:
+      self._consecutive_failures += 1
+      if ((self._state == CircuitBreaker.HALF_OPEN) or
+          (self._consecutive_failures >= self._failure_threshold)):
+        if self._state != CircuitBreaker.OPEN:
+          self.times_opened += 1
+        self._state = CircuitBreaker.OPEN
+        self._opened_time = self._get_time()
+
+  def get_stats(self):
+    """Returns a dictionary of statistics for this breaker."""
+    with self._lock:
+      return {
+        "state": self._state,
+        "consecutive_failures": self._consecutive_failures,
+        "times_opened": self.times_opened,
+        "rejected_calls": self.rejected_calls,
+      }
+
+
+class BreakerUrlDecoder:
+  """Wraps a URL decoder to avoid calling its upstream service needlessly.
+
+  If the decoder raises UrlDecoderException, then the URL cannot be decoded, and
+  so the decoder is not called again for that URL for a number of seconds.
+  Any other exception is a failure of the upstream service, which is recorded
+  by a CircuitBreaker. While that breaker is open, the decoder is not called.
+
+  In either case, decode_url raises UrlDecoderException, and so PostProcessor
+  stores the URL as a plain URL.
+  """
+
+  def __init__(self, decoder,
+      failure_threshold=5, reset_seconds=30, failed_url_ttl_seconds=5 * 60,
+      max_failed_urls=1000, get_time=time.time):
+    self._decoder = decoder
+    self._breaker = CircuitBreaker(failure_threshold, reset_seconds, get_time)
+    self._failed_url_ttl_seconds = failed_url_ttl_seconds
+    # Maps each URL that could not be decoded to when it can be decoded again.
+    self._failed_urls = LruCache(max_failed_urls, lambda expires_time: 1)
+    self._get_time = get_time
+
+    self.failed_url_hits = 0
+
+  def name(self):
+    return self._decoder.name()
+
+  def host_prefixes(self):
+    return self._decoder.host_prefixes()
+
+  def can_decode_url(self, url, parsed_url):
+    return self._decoder.can_decode_url(url, parsed_url)
+
+  def decode_url(self, url, parsed_url):
+    expires_time = self._failed_urls.get(url)
+    if (expires_time is not None) and (self._get_time() < expires_time):
+      self.failed_url_hits += 1
+      raise UrlDecoderException("URL recently failed to decode: %s" % url)
+    if not self._breaker.allow_call():
+      raise UrlDecoderUnavailableException("Decoder %s is unavailable" % self.name())
+
+    try:
+      decoded_url = self._decoder.decode_url(url, parsed_url)
+    except UrlDecoderException:
+      # The upstream service is healthy, but the URL cannot be decoded.
+      self._breaker.record_success()
+      self._failed_urls.put(url, self._get_time() + self._failed_url_ttl_seconds)
+      raise
+    except Exception as e:
+      self._breaker.record_failure()
+      raise UrlDecoderUnavailableException(
+          "Decoder %s failed with %r" % (self.name(), e))
+    self._breaker.record_success()
+    return decoded_url
+
+  def item_for_rendering(self, decoded_url):
+    return self._decoder.item_for_rendering(decoded_url)
+
+  def get_stats(self):
+    """Returns a dictionary of statistics for the breaker and failed URLs."""
+    stats = self._breaker.get_stats()
+    stats["failed_url_hits"] = self.failed_url_hits
+    stats["failed_urls"] = len(self._failed_urls)
+    return stats
@@ -0,0 +1,124 @@
+import unittest
+import urlparse
+
+from test_util import TestDecoder
+from url_decoder import UrlDecoderException
+from url_decoder_breaker import BreakerUrlDecoder, CircuitBreaker, UrlDecoderUnavailableException
+
+
+class CircuitBreakerTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.now = 1000.0
+    self.breaker = CircuitBreaker(2, 30, lambda: self.now)
+
+
+  def test_opens_after_consecutive_failures(self):
+    self.assertTrue(self.breaker.allow_call())
+    self.breaker.record_failure()
+    # A success resets the count of consecutive failures.
+    self.breaker.record_success()
+    self.breaker.record_failure()
+    self.assertEqual(CircuitBreaker.CLOSED, self.breaker.get_state())
+    self.breaker.record_failure()
+    self.assertEqual(CircuitBreaker.OPEN, self.breaker.get_state())
+    self.assertFalse(self.breaker.allow_call())
+
+    stats = self.breaker.get_stats()
+    self.assertEqual(1, stats["times_opened"])
+    self.assertEqual(1, stats["rejected_calls"])
+
+  def test_closes_after_trial_succeeds(self):
+    self.breaker.record_failure()
+    self.breaker.record_failure()
+    self.now += 30
+    # Assert that only one trial call is allowed.
+    self.assertTrue(self.breaker.allow_call())
+    self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.get_state())
+    self.assertFalse(self.breaker.allow_call())
+    self.breaker.record_success()
+    self.assertEqual(CircuitBreaker.CLOSED, self.breaker.get_state())
+    self.assertTrue(self.breaker.allow_call())
+
+  def test_opens_after_trial_fails(self):
+    self.breaker.record_failure()
+    self.breaker.record_failure()
+    self.now += 30
+    self.assertTrue(self.breaker.allow_call())
+    self.breaker.record_failure()
+    self.assertEqual(CircuitBreaker.OPEN, self.breaker.get_state())
+    self.now += 29
+    self.assertFalse(self.breaker.allow_call())
+    self.assertEqual(2, self.breaker.get_stats()["times_opened"])
+
+
+class _FailingDecoder(TestDecoder):
+  def __init__(self):
+    TestDecoder.__init__(self, "failing", "http://decoder")
+    self.error = None
+    self.num_calls = 0
+
+  def decode_url(self, url, parsed_url):
+    self.num_calls += 1
+    if self.error:
+      raise self.error
+    return TestDecoder.decode_url(self, url, parsed_url)
+
+
+class BreakerUrlDecoderTest(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.now = 1000.0
+    self.decoder = _FailingDecoder()
+    self.breaker_decoder = BreakerUrlDecoder(self.decoder,
+        failure_threshold=2, reset_seconds=30, failed_url_ttl_seconds=60,
+        get_time=lambda: self.now)
+
+  def _decode_url(self, url):
+    return self.breaker_decoder.decode_url(url, urlparse.urlparse(url))
+
+
+  def test_delegates(self):
+    url = "http://decoder/path"
+    self.assertEqual("failing", self.breaker_decoder.name())
+    self.assertTrue(self.breaker_decoder.can_decode_url(url, urlparse.urlparse(url)))
+    self.assertEqual("decoded-%s" % url, self._decode_url(url))
+    self.assertEqual("rendered-decoded", self.breaker_decoder.item_for_rendering("decoded"))
+
+  def test_failed_url(self):
+    self.decoder.error = UrlDecoderException("not found")
+    self.assertRaises(UrlDecoderException, self._decode_url, "http://decoder/missing")
+    # Assert that the failed URL is not decoded again until its TTL expires.
+    self.decoder.error = None
+    self.assertRaises(UrlDecoderException, self._decode_url, "http://decoder/missing")
+    self.assertEqual(1, self.decoder.num_calls)
+    self._decode_url("http://decoder/path")
+    self.now += 60
+    self._decode_url("http://decoder/missing")
+    self.assertEqual(3, self.decoder.num_calls)
+
+    stats = self.breaker_decoder.get_stats()
+    self.assertEqual(1, stats["failed_url_hits"])
+    self.assertEqual(CircuitBreaker.CLOSED, stats["state"])
+
+  def test_unavailable(self):
+    self.decoder.error = IOError("timed out")
+    for i in xrange(2):
+      self.assertRaises(UrlDecoderUnavailableException, self._decode_url, "http://decoder/path")
+    # Assert that the decoder is not called while the breaker is open.
+    self.decoder.error = None
+    self.assertRaises(UrlDecoderUnavailableException, self._decode_url, "http://decoder/path")
+    self.assertEqual(2, self.decoder.num_calls)
+    self.assertEqual(CircuitBreaker.OPEN, self.breaker_decoder.get_stats()["state"])
+
+    self.now += 30
+    self.assertEqual("decoded-http://decoder/path", self._decode_url("http://decoder/path"))
+    self.assertEqual(CircuitBreaker.CLOSED, self.breaker_decoder.get_stats()["state"])
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTest(unittest.makeSuite(CircuitBreakerTest))
+  suite.addTest(unittest.makeSuite(BreakerUrlDecoderTest))
+  return suite
+
@@ -1,16 +1,36 @@
 import re
+import requests
 
+from github_client import GitHubClientException
 import url_decoder
 from url_decoder import UrlDecoder, UrlDecoderException
 
 
 class _GitHubUrlDecoder(UrlDecoder):
+  _HOST_PREFIX = "github."
+
+  @staticmethod
+  def host_prefixes():
+    return (_GitHubUrlDecoder._HOST_PREFIX,)
+
   @staticmethod
   def can_decode_url(url, parsed_url):
-    if not parsed_url.netloc.startswith("github."):
+    if not parsed_url.netloc.startswith(_GitHubUrlDecoder._HOST_PREFIX):
       return False
     return True
 
+  @staticmethod
+  def _get_json(get_json, *pargs):
+    """Returns the JSON from calling get_json of a GitHubClient with the given
+    arguments, raising UrlDecoderException if it is not found.
+    """
+    try:
+      return get_json(*pargs)
+    except GitHubClientException as e:
+      if e.status_code == requests.codes.not_found:
+        raise UrlDecoderException("Not found on GitHub: %s" % (pargs,))
+      raise
+
 
 class GitHubRepositoryOwnerItem:
   """The owner in a GitHubRepositoryItem."""
@@ -81,7 +101,7 @@ class GitHubRepositoryUrlDecoder(_GitHubUrlDecoder):
       raise UrlDecoderException("URL is not decodeable: %s" % parsed_url)
     owner = match.group("owner")
     repo = match.group("repo")
-    json = self.github_client.get_repository(owner, repo)
+    json = self._get_json(self.github_client.get_repository, owner, repo)
     return self._filter_json(json)
 
   def item_for_rendering(self, decoded_url):
@@ -151,7 +171,7 @@ class GitHubCommitUrlDecoder(_GitHubUrlDecoder):
     owner = match.group("owner")
     repo = match.group("repo")
     sha = match.group("sha")
-    json = self.github_client.get_commit(owner, repo, sha)
+    json = self._get_json(self.github_client.get_commit, owner, repo, sha)
     return self._filter_json(json)
 
   def item_for_rendering(self, decoded_url):
@@ -169,15 +189,20 @@ class GitHubGistItem:
 class GitHubGistUrlDecoder(UrlDecoder):
   """Embeds a Gist."""
 
+  _HOST_PREFIX = "gist.github."
   _PATH_REGEX = re.compile("^/\w+/\w+$")
 
   @staticmethod
   def name():
     return "github-gist"
 
+  @staticmethod
+  def host_prefixes():
+    return (GitHubGistUrlDecoder._HOST_PREFIX,)
+
   @staticmethod
   def can_decode_url(url, parsed_url):
-    if not parsed_url.netloc.startswith("gist.github."):
+    if not parsed_url.netloc.startswith(GitHubGistUrlDecoder._HOST_PREFIX):
       return False
     elif not GitHubGistUrlDecoder._PATH_REGEX.match(parsed_url.path):
       return False
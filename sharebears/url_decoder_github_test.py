@@ -1,6 +1,8 @@
 import unittest
 
+from github_client import GitHubClientException
 import url_decoder
+from url_decoder import UrlDecoderException
 from url_decoder_test import UrlDecoderTestCase
 from url_decoder_github import GitHubRepositoryUrlDecoder, GitHubCommitUrlDecoder, GitHubGistUrlDecoder
 
@@ -9,6 +11,13 @@ class _GitHubTestClient:
   def __init__(self):
     self.get_repository_args = []
     self.get_commit_args = []
+    # If not None, the status code of the GitHubClientException to raise.
+    self.error_status_code = None
+
+  def _raise_error(self):
+    if self.error_status_code is not None:
+      raise GitHubClientException("Status code was not 200 but was %s" % self.error_status_code,
+          self.error_status_code)
 
   def _get_repository_json(self):
     owner_json = { "login": "mgp" }
@@ -16,6 +25,7 @@ class _GitHubTestClient:
 
   def get_repository(self, *pargs):
     self.get_repository_args.append(pargs)
+    self._raise_error()
     return self._get_repository_json()
 
   def _get_commit_json(self):
@@ -23,6 +33,7 @@ class _GitHubTestClient:
 
   def get_commit(self, *pargs):
     self.get_commit_args.append(pargs)
+    self._raise_error()
     return self._get_commit_json()
 
 
@@ -60,6 +71,16 @@ class GitHubRepositoryUrlDecoderTest(UrlDecoderTestCase):
     self.assertEqual("mgp", owner)
     self.assertEqual("sharebears", repo)
 
+  def test_decode_url_errors(self):
+    url = "https://github.com/mgp/missing"
+    parsed_url = self._parse_url(url)
+    # A missing repository cannot be decoded.
+    self.test_client.error_status_code = 404
+    self.assertRaises(UrlDecoderException, self.url_decoder.decode_url, url, parsed_url)
+    # Any other error is raised by the client.
+    self.test_client.error_status_code = 502
+    self.assertRaises(GitHubClientException, self.url_decoder.decode_url, url, parsed_url)
+
   def test_item_for_rendering(self):
     owner_json = {"login": "login-value", "avatar_url": "avatar-url-value", "html_url": "html_url-value"}
     decoded_url = {
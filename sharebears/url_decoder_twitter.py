@@ -4,9 +4,15 @@ from url_decoder import UrlDecoder
 
 
 class _TwitterUrlDecoder(UrlDecoder):
+  _HOST_PREFIX = "twitter."
+
+  @staticmethod
+  def host_prefixes():
+    return (_TwitterUrlDecoder._HOST_PREFIX,)
+
   @staticmethod
   def can_decode_url(url, parsed_url):
-    if not parsed_url.netloc.startswith("twitter."):
+    if not parsed_url.netloc.startswith(_TwitterUrlDecoder._HOST_PREFIX):
       return False
     return True
 
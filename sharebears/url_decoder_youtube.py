@@ -4,6 +4,7 @@ import urlparse
 from url_decoder import UrlDecoder
 
 
+_HOST_PREFIX = "www.youtube."
 _QUERY_REGEX = re.compile("^v=(?P<videoId>[\w-]+)$")
 
 
@@ -26,9 +27,13 @@ class YouTubeUrlDecoder(UrlDecoder):
   def name():
     return "youtube"
 
+  @staticmethod
+  def host_prefixes():
+    return (_HOST_PREFIX,)
+
   @staticmethod
   def can_decode_url(url, parsed_url):
-    if not parsed_url.netloc.startswith("www.youtube."):
+    if not parsed_url.netloc.startswith(_HOST_PREFIX):
       return False
     elif parsed_url.path != "/watch":
       return False
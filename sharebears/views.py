@@ -7,13 +7,23 @@ from sharebears import app
 
 import authn_google
 import authz
+import conditional_get
 import db
 from db import PaginatedSequence
+import db_util
 import filters
+import parser
 from github_client import GitHubClient
+from lru_cache import LruCache
+from post_enrichment import EnrichmentWorker
 from post_processor import PostProcessor
 from renderable_item import RenderablePost
+import rendered_post
+from rendered_post import RenderedPostContent
 import resource_summary
+from sqlite_cache import SqliteCache
+from timeline_cache import TimelinePageCache
+from url_decoder_breaker import BreakerUrlDecoder
 from url_decoder_github import GitHubRepositoryUrlDecoder
 from url_decoder_image import ImageUrlDecoder
 from url_decoder_twitter import TwitterTweetUrlDecoder
@@ -25,18 +35,36 @@ filters.add_to_environment(app.jinja_env)
 
 def _get_post_processor():
   """Returns an PostProcessor configured with the default URL decoders."""
-  github_client = GitHubClient.for_oauth_token(app.config["GITHUB_OAUTH_TOKEN"])
+  response_cache = None
+  if app.config["GITHUB_RESPONSE_CACHE_PATH"]:
+    response_cache = SqliteCache(app.config["GITHUB_RESPONSE_CACHE_PATH"],
+        app.config["GITHUB_RESPONSE_CACHE_MAX_BYTES"])
+  github_client = GitHubClient.for_oauth_token(app.config["GITHUB_OAUTH_TOKEN"],
+      response_cache=response_cache, ttl_seconds=app.config["GITHUB_RESPONSE_TTL_SECONDS"])
   decoders = [
-      GitHubRepositoryUrlDecoder(github_client),
+      # Do not call GitHub for URLs that failed recently, or while it is unhealthy.
+      BreakerUrlDecoder(GitHubRepositoryUrlDecoder(github_client), **app.config["URL_DECODER_BREAKER"]),
       ImageUrlDecoder(),
       TwitterTweetUrlDecoder(),
       YouTubeUrlDecoder()
   ]
-  return PostProcessor(decoders)
+  return PostProcessor(decoders, **app.config["POST_PROCESSOR"])
 
 post_processor = _get_post_processor()
 
 
+def _make_cache(namespace, max_size, get_size):
+  """Returns a cache shared by all worker processes if SHARED_CACHE_PATH is
+  configured, or a cache of only this process otherwise.
+  """
+  shared_cache_path = app.config["SHARED_CACHE_PATH"]
+  if shared_cache_path:
+    return SqliteCache(shared_cache_path,
+        app.config["SHARED_CACHE_MAX_BYTES"],
+        namespace=namespace,
+        ttl_seconds=app.config["SHARED_CACHE_TTL_SECONDS"])
+  return LruCache(max_size, get_size)
+
 def _get_renderable_post(post):
   """Returns a RenderablePost instance from the given Post."""
   data = json.loads(post.data)
@@ -49,24 +77,134 @@ def _get_renderable_post(post):
       post.num_stars,
       post.hash_tags)
 
-def _get_renderable_post_sequence(post_sequence):
-  """Returns a PaginatedSequence of RenderablePost instances from the given
+
+# The rendered content of each post, which is the same for all viewers.
+rendered_post_content_cache = _make_cache("rendered_post_content",
+    app.config["RENDERED_POST_CACHE_MAX_BYTES"], rendered_post.get_content_size)
+
+def _render_post_content(post):
+  """Returns a RenderedPostContent instance from the given Post."""
+  renderable_post = _get_renderable_post(post)
+  render_post_content = app.jinja_env.get_template("render_post_macro.html").module.render_post_content
+  html = render_post_content(renderable_post)
+  summary = resource_summary.summary_for_renderable_post(renderable_post)
+  return RenderedPostContent(html, summary)
+
+def _get_rendered_post(post):
+  """Returns a RenderedPost instance from the given Post."""
+  return rendered_post.get_rendered_post(rendered_post_content_cache, post, _render_post_content)
+
+def _get_rendered_post_sequence(post_sequence):
+  """Returns a PaginatedSequence of RenderedPost instances from the given
   paginated sequence of Post instances.
   """
-  renderable_posts = [_get_renderable_post(post) for post in post_sequence.items]
-  return PaginatedSequence(renderable_posts)
+  rendered_posts = [_get_rendered_post(post) for post in post_sequence.items]
+  return PaginatedSequence(rendered_posts,
+      post_sequence.next_cursor,
+      post_sequence.previous_cursor)
+
+def _get_summary_for_rendered_posts(rendered_posts):
+  """Returns the ResourceSummary for the given RenderedPost instances."""
+  return resource_summary.merge_summaries(
+      post.content.resource_summary for post in rendered_posts)
+
+
+def _get_page_args():
+  """Returns the keyword arguments for reading the requested page of posts."""
+  request_args = flask.request.args
+  return {
+    "before": request_args.get("before"),
+    "after": request_args.get("after"),
+    "page_size": app.config["POSTS_PAGE_SIZE"],
+  }
+
+
+def _make_conditional_response(posts, cursors, render_page):
+  """Returns a response with the page of the given posts and cursors, rendered
+  by calling render_page with the current time, or a response with status 304
+  Not Modified if the client has a copy of this page.
+  """
+  now = datetime.utcnow()
+  etag, last_modified = conditional_get.get_validators(flask.g.user_id,
+      posts, now, app.config["CONDITIONAL_GET_INTERVAL_SECONDS"], cursors)
+  if conditional_get.is_modified(flask.request.environ, etag, last_modified):
+    response = flask.make_response(render_page(now))
+  else:
+    response = flask.Response(status=requests.codes.not_modified)
+
+  # The relative times on the page may differ, so the ETag is weak.
+  response.set_etag(etag, weak=True)
+  response.last_modified = last_modified
+  # Each page is for one viewer, and clients must revalidate it before reuse.
+  response.cache_control.private = True
+  response.cache_control.no_cache = True
+  return response
+
+def _make_conditional_post_sequence_response(post_sequence, render_page):
+  """Like _make_conditional_response, but for the given PaginatedSequence."""
+  return _make_conditional_response(post_sequence.items,
+      (post_sequence.next_cursor, post_sequence.previous_cursor), render_page)
+
+
+# The pages of all posts, which are the same for every user except for the
+# posts that each has starred.
+timeline_page_cache = TimelinePageCache(
+    app.config["TIMELINE_PAGE_CACHE_MAX_ENTRIES"],
+    app.config["TIMELINE_PAGE_CACHE_TTL_SECONDS"])
+
+def _get_timeline_page(user_id, page_args):
+  """Returns the requested page of all posts as RenderedPost instances,
+  with the posts starred by the given user.
+  """
+  def build_page():
+    # Read the posts as a client without any stars.
+    return _get_rendered_post_sequence(db.get_posts(None, **page_args))
+  def is_cacheable(page):
+    # Do not cache a page read while a write to it may not have reached the
+    # replicas, because it may be stale.
+    return not db.is_page_of_posts_sticky([post.id for post in page.items])
+  page_key = (page_args["before"], page_args["after"], page_args["page_size"])
+  page = timeline_page_cache.get_page(page_key, build_page, is_cacheable)
+
+  starred_post_ids = db.get_starred_post_ids(user_id, [post.id for post in page.items])
+  rendered_posts = [rendered_post.with_is_starred(post, post.id in starred_post_ids)
+      for post in page.items]
+  return PaginatedSequence(rendered_posts, page.next_cursor, page.previous_cursor)
+
+def _invalidate_timeline_pages_with_post(post_id):
+  """Removes the cached pages of all posts that contain the given post."""
+  try:
+    post_id = int(post_id)
+  except ValueError:
+    return
+  timeline_page_cache.invalidate_item(post_id)
+
+# Decodes the URLs of new posts in the background, if configured.
+enrichment_worker = None
+if app.config["ENRICH_POSTS_IN_BACKGROUND"]:
+  enrichment_worker = EnrichmentWorker(post_processor,
+      on_enriched=_invalidate_timeline_pages_with_post, **app.config["ENRICHMENT_WORKER"])
+  # Start a worker in each process, which also enriches posts queued before it started.
+  app.before_first_request(enrichment_worker.start)
 
 
 @app.route('/', methods=["GET"])
 @authz.login_optional
 def posts():
   if flask.g.logged_in:
-    all_posts = db.get_posts(flask.g.user_id)
-    renderable_all_posts = _get_renderable_post_sequence(all_posts)
-    summary = resource_summary.summary_for_renderable_post_sequence(renderable_all_posts)
-    now = datetime.utcnow()
-    return flask.render_template("all_posts.html",
-        posts=renderable_all_posts, resource_summary=summary, now_datetime=now)
+    page_args = _get_page_args()
+    try:
+      # Validate the client's copy from the posts, before rendering any of them.
+      all_posts = db.get_posts(flask.g.user_id, **page_args)
+    except db.InvalidCursorException:
+      flask.abort(requests.codes.bad_request)
+
+    def render_page(now):
+      rendered_all_posts = _get_timeline_page(flask.g.user_id, page_args)
+      summary = _get_summary_for_rendered_posts(rendered_all_posts)
+      return flask.render_template("all_posts.html",
+          posts=rendered_all_posts, resource_summary=summary, now_datetime=now)
+    return _make_conditional_post_sequence_response(all_posts, render_page)
   else:
     return flask.render_template("sign_in.html")
 
@@ -74,11 +212,19 @@ def posts():
 def _add_post(user_id, text):
   """Adds a post to the database derived from the given text, by the given user.
 
+  If the enrichment worker is enabled, then the post is added with unrecognized
+  URLs, and the worker decodes them later.
+
   This method returns the identifier of the added post.
   """
-  processed_post = post_processor.process(text)
+  enrich = enrichment_worker is not None
+  processed_post = post_processor.process(text, decode_urls=not enrich)
   data_string = json.dumps(processed_post.data)
-  post_id = db.add_post(user_id, data_string, processed_post.hash_tags)
+  post_id = db.add_post(user_id, data_string, processed_post.hash_tags, enrich=enrich)
+  # The new post changes which posts are on every page of all posts.
+  timeline_page_cache.invalidate_all()
+  if enrich:
+    enrichment_worker.notify()
   return post_id
 
 
@@ -90,7 +236,10 @@ def add_post():
   user_id = request_form["user_id"]
   text = request_form["text"]
 
-  post_id = _add_post(user_id, text)
+  try:
+    post_id = _add_post(user_id, text)
+  except parser.ParseLimitException:
+    flask.abort(requests.codes.request_entity_too_large)
   if post_id:
     post_url = flask.url_for("post", post_id=post_id)
     rendered_template = flask.render_template("post_added.html", post_url=post_url)
@@ -112,10 +261,11 @@ def post(post_id):
   if not post:
     flask.abort(requests.codes.not_found)
 
-  renderable_post = _get_renderable_post(post)
-  summary = resource_summary.summary_for_renderable_post(renderable_post)
-  now = datetime.utcnow()
-  return flask.render_template("post.html", post=renderable_post, resource_summary=summary, now_datetime=now)
+  def render_page(now):
+    rendered = _get_rendered_post(post)
+    summary = rendered.content.resource_summary
+    return flask.render_template("post.html", post=rendered, resource_summary=summary, now_datetime=now)
+  return _make_conditional_response((post,), (), render_page)
 
 
 @app.route("%s/stars" % _POST_PATH)
@@ -129,6 +279,7 @@ def stars(post_id):
 @authz.login_required
 def star(post_id):
   db.star_post(flask.g.user_id, post_id)
+  _invalidate_timeline_pages_with_post(post_id)
   return flask.jsonify()
 
 
@@ -136,29 +287,57 @@ def star(post_id):
 @authz.login_required
 def unstar(post_id):
   db.unstar_post(flask.g.user_id, post_id)
+  _invalidate_timeline_pages_with_post(post_id)
   return flask.jsonify()
 
 
 @app.route("/hashtag/<hash_tag>")
 @authz.login_required
 def posts_with_hashtag(hash_tag):
-  hash_tag_posts = db.get_posts_with_hashtag(flask.g.user_id, hash_tag)
-  renderable_hash_tag_posts = _get_renderable_post_sequence(hash_tag_posts)
-  summary = resource_summary.summary_for_renderable_post_sequence(renderable_hash_tag_posts)
-  now = datetime.utcnow()
-  return flask.render_template("hashtag_posts.html",
-      hash_tag=hash_tag, posts=renderable_hash_tag_posts, resource_summary=summary, now_datetime=now)
+  try:
+    hash_tag_posts = db.get_posts_with_hashtag(flask.g.user_id, hash_tag, **_get_page_args())
+  except db.InvalidCursorException:
+    flask.abort(requests.codes.bad_request)
+
+  def render_page(now):
+    rendered_hash_tag_posts = _get_rendered_post_sequence(hash_tag_posts)
+    summary = _get_summary_for_rendered_posts(rendered_hash_tag_posts)
+    return flask.render_template("hashtag_posts.html",
+        hash_tag=hash_tag, posts=rendered_hash_tag_posts, resource_summary=summary, now_datetime=now)
+  return _make_conditional_post_sequence_response(hash_tag_posts, render_page)
 
 
 @app.route("/user/<user_id>")
 @authz.login_required
 def posts_by_user(user_id):
-  user_posts = db.get_posts_by_user(flask.g.user_id, user_id)
-  renderable_user_posts = _get_renderable_post_sequence(user_posts)
-  summary = resource_summary.summary_for_renderable_post_sequence(renderable_user_posts)
-  now = datetime.utcnow()
-  return flask.render_template("user_posts.html",
-      user_id=user_id, posts=renderable_user_posts, resource_summary=summary, now_datetime=now)
+  try:
+    user_posts = db.get_posts_by_user(flask.g.user_id, user_id, **_get_page_args())
+  except db.InvalidCursorException:
+    flask.abort(requests.codes.bad_request)
+
+  def render_page(now):
+    rendered_user_posts = _get_rendered_post_sequence(user_posts)
+    summary = _get_summary_for_rendered_posts(rendered_user_posts)
+    return flask.render_template("user_posts.html",
+        user_id=user_id, posts=rendered_user_posts, resource_summary=summary, now_datetime=now)
+  return _make_conditional_post_sequence_response(user_posts, render_page)
+
+
+@app.route("/stats/caches")
+@authz.login_required
+def cache_stats():
+  return flask.jsonify({
+    "rendered_post_content": rendered_post_content_cache.get_stats(),
+    "timeline_pages": timeline_page_cache.get_stats(),
+    "db_results": db_util.get_result_cache_stats(),
+  })
+
+
+@app.route("/stats/url_decoders")
+@authz.login_required
+def url_decoder_stats():
+  return flask.jsonify({decoder.name(): decoder.get_stats()
+      for decoder in post_processor.get_decoders() if isinstance(decoder, BreakerUrlDecoder)})
 
 
 @app.route("/logout")